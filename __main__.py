@@ -4,6 +4,7 @@ import sys
 from absl import app
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from weibo_spider.spider import main
+from weibo_spider.comment_parser import CommentPageParser, fetch_comment_page
 import requests
 from bs4 import XMLParsedAsHTMLWarning
 import warnings
@@ -15,21 +16,6 @@ import random
 from fake_useragent import UserAgent
 
 
-def get_total_pages(url, headers):
-    """获取评论总页数"""
-    try:
-        response = requests.get(url, headers=headers)
-        soup = BeautifulSoup(response.text, 'lxml')
-        pagination = soup.find('div', id='pagelist')
-        if pagination:
-            input_tag = pagination.find('input', {'name': 'mp'})
-            return int(input_tag['value']) if input_tag else 1
-        return 1
-    except Exception as e:
-        print(f"获取总页数失败: {str(e)}")
-        return 1
-
-
 def clean_header_value(value: str) -> str:
     """清理请求头中的非法字符"""
     return value.strip().replace('\ufeff', '').replace('\xa0', ' ')
@@ -62,6 +48,7 @@ def weibo_comment_spider(max_pages=1):
     :param max_pages: 要爬取的微博页数
     """
     ua = UserAgent()
+    parser = CommentPageParser()
     user_id = '2803301701'  # 用户ID
     base_url = f'https://weibo.cn/u/{user_id}'
 
@@ -175,26 +162,31 @@ def weibo_comment_spider(max_pages=1):
                             comment_page = 1
                             comment_count = 1  # 评论编号从1开始
                             
-                            # 获取评论总页数
-                            total_comment_pages = get_total_pages(comment_url, headers)
+                            # 获取评论总页数，第1页的评论直接复用
+                            try:
+                                total_comment_pages, first_comments = fetch_comment_page(
+                                    requests.get, f"{comment_url}?page=1", parser,
+                                    headers=headers,
+                                    proxies=random.choice(working_proxies),
+                                    timeout=15)
+                            except Exception as e:
+                                print(f"获取总页数失败: {str(e)}")
+                                total_comment_pages, first_comments = 1, None
                             print(f"微博 {weibo_id} 共有 {total_comment_pages} 页评论")
                             
                             while comment_page <= total_comment_pages:
                                 try:
                                     print(f"正在获取微博 {weibo_count} 的第 {comment_page} 页评论")
-                                    comment_response = requests.get(
-                                        f"{comment_url}?page={comment_page}",
-                                        headers=headers,
-                                        proxies=random.choice(working_proxies),
-                                        timeout=15
-                                    )
-                                    
-                                    if comment_response.status_code != 200:
-                                        print(f"获取评论失败，状态码: {comment_response.status_code}")
-                                        continue
-                                        
-                                    comment_soup = BeautifulSoup(comment_response.text, 'lxml')
-                                    comments = comment_soup.find_all('div', class_='c', id=lambda x: x and x.startswith('C_'))
+                                    if comment_page == 1 and first_comments is not None:
+                                        comments = first_comments
+                                    else:
+                                        comments = fetch_comment_page(
+                                            requests.get,
+                                            f"{comment_url}?page={comment_page}",
+                                            parser,
+                                            headers=headers,
+                                            proxies=random.choice(working_proxies),
+                                            timeout=15)[1]
                                     
                                     if not comments:
                                         print(f"微博 {weibo_count} 的评论获取完成")
@@ -203,42 +195,20 @@ def weibo_comment_spider(max_pages=1):
                                     print(f"找到 {len(comments)} 条评论")
                                     
                                     for comment in comments:
-                                        try:
-                                            # 用户信息
-                                            user_link = comment.find('a', href=lambda x: x and '/u/' in x)
-                                            user_id = user_link['href'].split('/')[-1] if user_link else 'N/A'
-                                            screen_name = user_link.text if user_link else 'N/A'
-                                            
-                                            # 评论内容
-                                            content = comment.find('span', class_='ctt').text.strip() if comment.find('span', class_='ctt') else 'N/A'
-                                            
-                                            # 元数据解析
-                                            info_text = comment.find('span', class_='ct').text if comment.find('span', class_='ct') else ''
-                                            like_info = comment.find('a', string=lambda t: t and '赞[' in t)
-                                            likes = like_info.text.replace('赞[', '').replace(']', '') if like_info else '0'
-                                            
-                                            # 分离时间和设备信息
-                                            time_source = info_text.split('\xa0')[0] if info_text else 'N/A'
-                                            device = info_text.split('来自')[-1].split('\xa0')[0] if '来自' in info_text else 'N/A'
-                                            ip_location = info_text.split('\xa0')[-1] if len(info_text.split('\xa0')) > 1 else 'N/A'
-                                            
-                                            # 写入评论
-                                            comment_writer.writerow([
-                                                comment.get('id', 'N/A'),
-                                                weibo_count,
-                                                comment_count,
-                                                user_id,
-                                                screen_name,
-                                                content,
-                                                likes,
-                                                time_source,
-                                                device,
-                                                ip_location
-                                            ])
-                                            comment_count += 1
-                                        except Exception as e:
-                                            print(f"解析评论时出错: {str(e)}")
-                                            continue
+                                        # 写入评论
+                                        comment_writer.writerow([
+                                            comment.id,
+                                            weibo_count,
+                                            comment_count,
+                                            comment.user_id,
+                                            comment.screen_name,
+                                            comment.content,
+                                            comment.likes,
+                                            comment.publish_time,
+                                            comment.device,
+                                            comment.ip_location
+                                        ])
+                                        comment_count += 1
                                     
                                     # 评论页延时
                                     sleep_time = random.uniform(3, 8)
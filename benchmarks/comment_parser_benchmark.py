@@ -0,0 +1,101 @@
+"""对比评论页解析耗时：原BeautifulSoup解析方式 vs CommentPageParser vs 流式解析
+
+用法: python -m weibo_spider.benchmarks.comment_parser_benchmark [循环次数]
+"""
+import glob
+import os
+import sys
+import timeit
+import warnings
+
+from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
+
+from ..comment import Comment
+from ..comment_parser import CommentPageParser, StreamingCommentPageParser
+
+warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'fixtures')
+CHUNK_SIZE = 8192
+
+
+def parse_with_bs4(html):
+    """原spider.crawl_comments中的BeautifulSoup解析逻辑"""
+    soup = BeautifulSoup(html, 'lxml')
+    pagination = soup.find('div', id='pagelist')
+    total_pages = 1
+    if pagination:
+        input_tag = pagination.find('input', {'name': 'mp'})
+        total_pages = int(input_tag['value']) if input_tag else 1
+    result = []
+    comments = soup.find_all('div',
+                             class_='c',
+                             id=lambda x: x and x.startswith('C_'))
+    for comment in comments:
+        user_link = comment.find('a', href=lambda x: x and '/u/' in x)
+        user_id = user_link['href'].split('/')[-1] if user_link else 'N/A'
+        screen_name = user_link.text if user_link else 'N/A'
+        content = comment.find('span', class_='ctt').text.strip(
+        ) if comment.find('span', class_='ctt') else 'N/A'
+        info_text = comment.find('span', class_='ct').text if comment.find(
+            'span', class_='ct') else ''
+        like_info = comment.find('a', string=lambda t: t and '赞[' in t)
+        likes = like_info.text.replace('赞[', '').replace(
+            ']', '') if like_info else '0'
+        time_source = info_text.split('\xa0')[0] if info_text else 'N/A'
+        device = info_text.split('来自')[-1].split(
+            '\xa0')[0] if '来自' in info_text else 'N/A'
+        ip_location = info_text.split('\xa0')[-1] if len(
+            info_text.split('\xa0')) > 1 else 'N/A'
+        result.append({
+            'id': comment.get('id'),
+            'user_id': user_id,
+            'screen_name': screen_name,
+            'content': content,
+            'likes': likes,
+            'publish_time': time_source,
+            'device': device,
+            'ip_location': ip_location,
+            'hot': comment.find('span', class_='kt') is not None,
+        })
+    return total_pages, result
+
+
+def parse_streaming(html):
+    """按CHUNK_SIZE分段传入，模拟iter_content"""
+    return StreamingCommentPageParser().parse(
+        html[i:i + CHUNK_SIZE] for i in range(0, len(html), CHUNK_SIZE))
+
+
+def to_rows(result):
+    """将解析结果转为可比较的行，原解析方式的评论为字典"""
+    total_pages, comments = result
+    return total_pages, [
+        Comment(**dict(c, likes=int(c['likes']))).to_row()
+        if isinstance(c, dict) else c.to_row() for c in comments
+    ]
+
+
+def main(number=200):
+    fixtures = []
+    for file_path in sorted(glob.glob(os.path.join(FIXTURE_DIR, '*.html'))):
+        with open(file_path, 'rb') as f:
+            fixtures.append((os.path.basename(file_path), f.read()))
+    parser = CommentPageParser()
+    for name, html in fixtures:
+        if not to_rows(parse_with_bs4(html)) == to_rows(
+                parser.parse(html)) == to_rows(parse_streaming(html)):
+            print(u'%s: 几种解析方式结果不一致' % name)
+            sys.exit(1)
+        bs4_time = timeit.timeit(lambda: parse_with_bs4(html), number=number)
+        lxml_time = timeit.timeit(lambda: parser.parse(html), number=number)
+        stream_time = timeit.timeit(lambda: parse_streaming(html),
+                                    number=number)
+        print(u'%s: bs4 %.3f ms/页, lxml %.3f ms/页, 流式 %.3f ms/页, 提速 %.1fx' %
+              (name, bs4_time * 1000 / number, lxml_time * 1000 / number,
+               stream_time * 1000 / number, bs4_time / lxml_time))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
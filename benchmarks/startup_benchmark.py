@@ -0,0 +1,77 @@
+"""对比启动耗时：导入模块时创建代理池(原实现) vs 按配置延迟创建
+
+从导入proxy_pool和rate_limiter开始计时，到第一个请求返回为止。
+请求发往本地HTTP服务，每次测量在新的子进程中进行，包含模块导入时间。
+
+用法: python benchmarks/startup_benchmark.py [测量次数]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 原实现在导入proxy_pool时创建全局代理池，测试本地代理并启动维护线程
+EAGER = '''
+from proxy_pool import ProxyPool
+proxy_pool = ProxyPool({'test_urls': [URL]}).start()
+'''
+# 未配置proxy_pool时不创建代理池
+LAZY = '''
+import proxy_pool
+proxy_pool = None
+'''
+FIRST_REQUEST = '''
+import time
+start = time.perf_counter()
+%s
+from rate_limiter import RateLimitedSession, RateLimiter
+session = RateLimitedSession(RateLimiter(), proxy_pool=proxy_pool)
+session.get(URL, timeout=5)
+print(time.perf_counter() - start)
+'''
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def measure(setup, url, number):
+    code = 'URL = %r\n' % url + FIRST_REQUEST % setup
+    timings = []
+    for _ in range(number):
+        output = subprocess.run([sys.executable, '-c', code],
+                                cwd=ROOT_DIR,
+                                capture_output=True,
+                                text=True,
+                                check=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def main(number):
+    server = HTTPServer(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:%d/' % server.server_port
+
+    eager = measure(EAGER, url, number)
+    lazy = measure(LAZY, url, number)
+    server.shutdown()
+    print(u'测量次数: %d，取中位数' % number)
+    print(u'导入时创建代理池:   %.1f ms' % (eager * 1000))
+    print(u'按配置延迟创建:     %.1f ms' % (lazy * 1000))
+    print(u'减少: %.1f ms' % ((eager - lazy) * 1000))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
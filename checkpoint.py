@@ -0,0 +1,212 @@
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger('spider.checkpoint')
+
+
+def get_comment_id(comment):
+    """将评论id(C_xxx)转为整数，越新的评论id越大"""
+    try:
+        return int(comment.id[2:])
+    except (TypeError, ValueError):
+        return 0
+
+
+def get_comment_sequence(comment):
+    """返回评论编号("微博序号-评论序号")中的评论序号"""
+    try:
+        return int(comment.number.rsplit('-', 1)[1])
+    except (AttributeError, IndexError, ValueError):
+        return 0
+
+
+def filter_new_comments(comments, high_water_mark):
+    """过滤出高水位之后的新评论，返回(新评论, 是否已翻到旧评论)"""
+    if not high_water_mark:
+        return comments, False
+    new_comments = []
+    reached = False
+    for comment in comments:
+        if get_comment_id(comment) > high_water_mark:
+            new_comments.append(comment)
+        elif not comment.hot:
+            reached = True
+    return new_comments, reached
+
+
+class CheckpointStore:
+    """爬取断点，按(用户, 微博, 评论页)记录已写出的评论页
+
+    一条微博的评论爬完后清除其页断点，只保留最新评论id作为高水位和最大评论序号，
+    之后的增量爬取翻到高水位即停止，新评论从最大评论序号之后编号。已写出的微博id也记录在断点中，
+    续爬时重新获取的微博不会再次追加到结果文件。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS comment_pages (
+                    user_uri TEXT NOT NULL,
+                    weibo_id TEXT NOT NULL,
+                    page INTEGER NOT NULL,
+                    comment_count INTEGER NOT NULL,
+                    max_comment_id INTEGER,
+                    newest_time TEXT,
+                    committed_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    last_number INTEGER,
+                    PRIMARY KEY (user_uri, weibo_id, page)
+                )""")
+            self._add_column('comment_pages', 'last_number INTEGER')
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS comment_weibos (
+                    user_uri TEXT NOT NULL,
+                    weibo_id TEXT NOT NULL,
+                    total_pages INTEGER NOT NULL,
+                    PRIMARY KEY (user_uri, weibo_id)
+                )""")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS comment_marks (
+                    user_uri TEXT NOT NULL,
+                    weibo_id TEXT NOT NULL,
+                    max_comment_id INTEGER NOT NULL,
+                    newest_time TEXT,
+                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    last_number INTEGER,
+                    PRIMARY KEY (user_uri, weibo_id)
+                )""")
+            self._add_column('comment_marks', 'last_number INTEGER')
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS written_weibos (
+                    user_uri TEXT NOT NULL,
+                    weibo_id TEXT NOT NULL,
+                    PRIMARY KEY (user_uri, weibo_id)
+                )""")
+
+    def _add_column(self, table, column):
+        """为旧版本创建的断点数据库补充新增的列"""
+        columns = [
+            row[1] for row in self.connection.execute(
+                'PRAGMA table_info(%s)' % table)
+        ]
+        if column.split()[0] not in columns:
+            self.connection.execute('ALTER TABLE %s ADD COLUMN %s' %
+                                    (table, column))
+
+    def get_total_pages(self, user_uri, weibo_id):
+        """获取已记录的评论总页数，未记录时返回None"""
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT total_pages FROM comment_weibos '
+                'WHERE user_uri = ? AND weibo_id = ?',
+                (user_uri, weibo_id)).fetchone()
+        return row[0] if row else None
+
+    def set_total_pages(self, user_uri, weibo_id, total_pages):
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO comment_weibos VALUES (?, ?, ?)',
+                (user_uri, weibo_id, total_pages))
+
+    def get_finished_pages(self, user_uri, weibo_id):
+        """获取已写出的评论页，返回{页码: 评论数}"""
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT page, comment_count FROM comment_pages '
+                'WHERE user_uri = ? AND weibo_id = ?',
+                (user_uri, weibo_id)).fetchall()
+        return dict(rows)
+
+    def get_last_number(self, user_uri, weibo_id):
+        """获取已写出评论的最大评论序号，续爬和增量爬取的评论从其后编号"""
+        key = (user_uri, weibo_id)
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT MAX(last_number) FROM ('
+                'SELECT last_number FROM comment_pages '
+                'WHERE user_uri = ? AND weibo_id = ? UNION ALL '
+                'SELECT last_number FROM comment_marks '
+                'WHERE user_uri = ? AND weibo_id = ?)', key + key).fetchone()
+        return row[0] or 0
+
+    def commit_pages(self, user_uri, weibo_id, pages):
+        """记录已写出的评论页，pages为[(页码, 评论列表)]"""
+        rows = []
+        for page, comments in pages:
+            newest = max(comments, key=get_comment_id, default=None)
+            rows.append((user_uri, weibo_id, page, len(comments),
+                         get_comment_id(newest) if newest else None,
+                         newest.publish_time if newest else None,
+                         max(map(get_comment_sequence, comments), default=0)))
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO comment_pages '
+                '(user_uri, weibo_id, page, comment_count, max_comment_id, '
+                'newest_time, last_number) VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        logger.debug(u'微博%s已记录断点页%s', weibo_id,
+                     [page for page, _ in pages])
+
+    def get_high_water_mark(self, user_uri, weibo_id):
+        """获取已爬取的最新评论id，未爬取过时返回None"""
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT max_comment_id FROM comment_marks '
+                'WHERE user_uri = ? AND weibo_id = ?',
+                (user_uri, weibo_id)).fetchone()
+        return row[0] if row else None
+
+    def finish_weibo(self, user_uri, weibo_id):
+        """微博评论爬取完成，更新高水位和最大评论序号并清除该微博的页断点"""
+        key = (user_uri, weibo_id)
+        with self.lock, self.connection:
+            newest = self.connection.execute(
+                'SELECT max_comment_id, newest_time FROM comment_pages '
+                'WHERE user_uri = ? AND weibo_id = ? '
+                'AND max_comment_id IS NOT NULL '
+                'ORDER BY max_comment_id DESC LIMIT 1', key).fetchone()
+            if newest:
+                last_number = self.connection.execute(
+                    'SELECT MAX(last_number) FROM comment_pages '
+                    'WHERE user_uri = ? AND weibo_id = ?', key).fetchone()
+                self.connection.execute(
+                    'INSERT INTO comment_marks '
+                    '(user_uri, weibo_id, max_comment_id, newest_time, '
+                    'last_number) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (user_uri, weibo_id) DO UPDATE SET '
+                    'max_comment_id = excluded.max_comment_id, '
+                    'newest_time = excluded.newest_time, '
+                    'last_number = MAX(COALESCE(last_number, 0), '
+                    'excluded.last_number), '
+                    'updated_at = CURRENT_TIMESTAMP '
+                    'WHERE excluded.max_comment_id > max_comment_id',
+                    key + newest + last_number)
+            self.connection.execute(
+                'DELETE FROM comment_pages WHERE user_uri = ? AND weibo_id = ?',
+                key)
+            self.connection.execute(
+                'DELETE FROM comment_weibos WHERE user_uri = ? AND weibo_id = ?',
+                key)
+
+    def get_written_weibos(self, user_uri, weibo_ids):
+        """返回weibo_ids中已写出过的微博id"""
+        if not weibo_ids:
+            return set()
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT weibo_id FROM written_weibos WHERE user_uri = ? '
+                'AND weibo_id IN (%s)' % ', '.join('?' * len(weibo_ids)),
+                [user_uri] + list(weibo_ids)).fetchall()
+        return {row[0] for row in rows}
+
+    def add_written_weibos(self, user_uri, weibo_ids):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO written_weibos VALUES (?, ?)',
+                [(user_uri, weibo_id) for weibo_id in weibo_ids])
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
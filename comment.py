@@ -0,0 +1,63 @@
+from .record import Record
+
+
+class Comment(Record):
+    """微博评论
+
+    字段:
+        id (str): 评论id，格式为C_xxx，越新的评论id越大
+        weibo_id (str): 所属微博id
+        number (str): 评论编号，格式为"微博序号-评论序号"
+        user_id (str): 评论者用户id
+        screen_name (str): 评论者昵称
+        content (str): 评论内容
+        likes (int): 点赞数
+        publish_time (str): 发布时间
+        device (str): 发布设备
+        ip_location (str): IP属地
+        hot (bool): 是否为置顶的热门评论，热门评论不按时间排序
+    """
+
+    fields = ('id', 'weibo_id', 'number', 'user_id', 'screen_name', 'content',
+              'likes', 'publish_time', 'device', 'ip_location', 'hot')
+    __slots__ = fields
+
+    id: str
+    weibo_id: str
+    number: str
+    user_id: str
+    screen_name: str
+    content: str
+    likes: int
+    publish_time: str
+    device: str
+    ip_location: str
+    hot: bool
+
+    def __init__(self,
+                 id='',
+                 user_id='N/A',
+                 screen_name='N/A',
+                 content='N/A',
+                 likes=0,
+                 publish_time='N/A',
+                 device='N/A',
+                 ip_location='N/A',
+                 hot=False,
+                 weibo_id='',
+                 number=''):
+        self.id = id
+        self.weibo_id = weibo_id
+        self.number = number
+        self.user_id = user_id
+        self.screen_name = screen_name
+        self.content = content
+        self.likes = likes
+        self.publish_time = publish_time
+        self.device = device
+        self.ip_location = ip_location
+        self.hot = hot
+
+    def __str__(self):
+        """打印一条评论"""
+        return u'%s(%s): %s' % (self.screen_name, self.user_id, self.content)
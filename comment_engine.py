@@ -0,0 +1,193 @@
+import asyncio
+import logging
+
+import requests
+
+from .checkpoint import filter_new_comments
+from .comment_parser import parse_response
+from .datetime_util import standardize_comment_date
+from .response_classifier import (OK, ResponseClassifier, fetch_page_steps,
+                                  get_backoff_policies, run_fetch_steps_async)
+
+logger = logging.getLogger('spider.comment_engine')
+
+
+class AsyncCommentEngine:
+    """基于asyncio的评论爬取引擎，同时爬取多条微博的评论
+
+    请求从身份池中选择最早可用的身份，总吞吐量随身份数量线性增长。
+    """
+
+    def __init__(self,
+                 identity_pool,
+                 sink_factory,
+                 max_comment_pages,
+                 concurrency=8,
+                 timeout=15,
+                 checkpoint=None,
+                 user_uri='',
+                 backoff_policies=None,
+                 streaming=False,
+                 response_archive=None):
+        self.identity_pool = identity_pool
+        self.sink_factory = sink_factory  # 根据微博id创建评论输出
+        self.max_comment_pages = max_comment_pages
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.checkpoint = checkpoint
+        self.user_uri = user_uri
+        self.streaming = streaming  # 边下载边解析评论页
+        self.response_archive = response_archive  # 存档正常的评论页，需关闭流式解析
+        self.classifier = ResponseClassifier()
+        self.backoff_policies = backoff_policies or get_backoff_policies()
+
+    def crawl(self, weibos):
+        """爬取一批微博的评论"""
+        asyncio.run(self._crawl_all(weibos))
+
+    async def _crawl_all(self, weibos):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*[self._crawl_weibo(weibo) for weibo in weibos])
+
+    async def _reserve(self, url):
+        """从身份池选出最早可用的身份，等待到可以发送请求时返回该身份"""
+        identity, wait = self.identity_pool.reserve(url)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return identity
+
+    def _request(self, identity, url):
+        """在线程中请求并解析评论页，返回(响应类别, (总页数, 评论列表, 原始内容))"""
+        response = identity.session.get(url,
+                                        reserved=True,
+                                        timeout=self.timeout,
+                                        stream=self.streaming)
+        response_class = self.classifier.classify(response)
+        if response_class != OK:
+            response.close()
+            return response_class, None
+        return response_class, parse_response(response, self.streaming)
+
+    async def _fetch(self, url):
+        """使用可用身份请求并解析页面，返回(身份, 响应类别, 解析结果)"""
+        identity = await self._reserve(url)
+        async with self.semaphore:
+            logger.info(f"[{identity}] 发送请求: {url}")
+            try:
+                response_class, page = await asyncio.to_thread(
+                    self._request, identity, url)
+            except requests.RequestException as e:
+                logger.error(f"[{identity}] 请求失败: {str(e)}")
+                return identity, self.classifier.classify_error(e), None
+        return identity, response_class, page
+
+    async def _fetch_comments(self, url):
+        """获取并解析评论页，返回(总页数, 评论列表)，按响应类别退避重试，放弃时返回None"""
+        page = await run_fetch_steps_async(
+            fetch_page_steps(url, self.identity_pool, self.backoff_policies,
+                             self.classifier), lambda: self._fetch(url))
+        if page is None:
+            return None
+        total_pages, comments, html = page
+        if self.response_archive:
+            await asyncio.to_thread(self.response_archive.put, url, html,
+                                    self.user_uri)
+        return total_pages, comments
+
+    async def _crawl_weibo(self, weibo):
+        """爬取单条微博的评论，第1页同时用于获取总页数"""
+        comment_url = f'https://weibo.cn/comment/{weibo.id}'
+        finished_pages = {}
+        total_pages = None
+        high_water_mark = None
+        if self.checkpoint:
+            finished_pages = self.checkpoint.get_finished_pages(
+                self.user_uri, weibo.id)
+            total_pages = self.checkpoint.get_total_pages(
+                self.user_uri, weibo.id)
+            high_water_mark = self.checkpoint.get_high_water_mark(
+                self.user_uri, weibo.id)
+
+        pages = {}
+        if total_pages is None:
+            try:
+                result = await self._fetch_comments(f'{comment_url}?page=1')
+            except Exception as e:
+                logger.error(f"爬取微博 {weibo.weibo_number} 的评论时出错: {str(e)}")
+                return
+            if result is None:
+                logger.error(f"获取微博 {weibo.weibo_number} 的评论总页数失败")
+                return
+            total_pages, pages[1] = result
+            if self.checkpoint:
+                self.checkpoint.set_total_pages(self.user_uri, weibo.id,
+                                                total_pages)
+        total_pages = min(self.max_comment_pages, total_pages)
+        logger.info(f"微博 {weibo.weibo_number} 将爬取前 {total_pages} 页评论")
+
+        page_numbers = [
+            page for page in range(1, total_pages + 1)
+            if page not in finished_pages and page not in pages
+        ]
+        if high_water_mark:
+            # 增量爬取逐页翻页，翻到上次爬取的位置即停止
+            reached = any(
+                filter_new_comments(comments or [], high_water_mark)[1]
+                for comments in pages.values())
+            for page in page_numbers:
+                if reached:
+                    break
+                pages[page] = await self._crawl_page(comment_url,
+                                                     weibo.weibo_number, page)
+                reached = filter_new_comments(pages[page] or [],
+                                              high_water_mark)[1]
+        else:
+            pages.update(
+                zip(
+                    page_numbers, await asyncio.gather(*[
+                        self._crawl_page(comment_url, weibo.weibo_number,
+                                         page) for page in page_numbers
+                    ])))
+        pages = sorted((page, comments) for page, comments in pages.items()
+                       if page not in finished_pages)
+        comment_counter = self.checkpoint.get_last_number(
+            self.user_uri, weibo.id) if self.checkpoint else 0
+        await asyncio.to_thread(self._write_comments, weibo, pages,
+                                comment_counter, high_water_mark)
+
+    async def _crawl_page(self, comment_url, weibo_number, page):
+        """爬取一页评论，失败时返回None"""
+        try:
+            result = await self._fetch_comments(f'{comment_url}?page={page}')
+            return result[1] if result else None
+        except Exception as e:
+            logger.error(f"爬取微博 {weibo_number} 的第 {page} 页评论失败: {str(e)}")
+
+    def _write_comments(self,
+                        weibo,
+                        pages,
+                        comment_counter=0,
+                        high_water_mark=None):
+        """按页码顺序将评论写入评论输出，pages为[(页码, 评论列表)]"""
+        all_pages_done = True
+        with self.sink_factory(weibo.id) as comment_sink:
+            for page, comments in pages:
+                if comments is None:
+                    # 该页爬取失败，保留断点
+                    all_pages_done = False
+                    continue
+                comments = filter_new_comments(comments, high_water_mark)[0]
+                for comment in comments:
+                    comment_counter += 1
+                    comment.weibo_id = weibo.id
+                    comment.publish_time = standardize_comment_date(
+                        comment.publish_time, weibo.publish_time)
+                    comment.number = f"{weibo.weibo_number}-{comment_counter}"
+                if comments:
+                    comment_sink.write_page(weibo.weibo_number, page, comments)
+        # 评论已全部落盘后更新高水位；有失败页时保留断点，下次续爬
+        if self.checkpoint and all_pages_done:
+            comment_sink.after_flush(lambda: self.checkpoint.finish_weibo(
+                self.user_uri, weibo.id))
+        logger.info(
+            f"微博 {weibo.weibo_number} 的评论爬取完成，本次保存 {comment_sink.saved_count} 条评论")
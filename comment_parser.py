@@ -0,0 +1,203 @@
+import logging
+
+from lxml import etree
+
+from .comment import Comment
+
+logger = logging.getLogger('spider.comment_parser')
+
+# 预编译的XPath表达式，所有评论页共用
+_COMMENT_XPATH = etree.XPath(
+    '//div[contains(concat(" ", normalize-space(@class), " "), " c ")]'
+    '[starts-with(@id, "C_")]')
+_TOTAL_PAGES_XPATH = etree.XPath(
+    '//div[@id="pagelist"]//input[@name="mp"]/@value')
+_USER_LINK_XPATH = etree.XPath('.//a[contains(@href, "/u/")]')
+_CONTENT_XPATH = etree.XPath('.//span[@class="ctt"]')
+_INFO_XPATH = etree.XPath('.//span[@class="ct"]')
+_LIKE_XPATH = etree.XPath('.//a[contains(text(), "赞[")]')
+_HOT_XPATH = etree.XPath('boolean(.//span[@class="kt"])')
+
+
+def _text(node):
+    return ''.join(node.itertext())
+
+
+def _get_page_count(value):
+    """将分页控件中的总页数转为整数，无法识别时按1页处理"""
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        logger.warning(u'无法识别评论总页数: %s', value)
+        return 1
+
+
+def fetch_comment_page(get, url, parser, **kwargs):
+    """请求并解析一页评论，返回(总页数, 评论列表)
+
+    总页数和评论来自同一响应，第1页不需要为获取总页数单独请求。
+    get为requests.get或会话的get方法，kwargs原样传给get。
+    """
+    response = get(url, **kwargs)
+    response.raise_for_status()
+    return parser.parse(response.content)
+
+
+class CommentPageParser:
+    """weibo.cn评论页解析器，一次遍历得到总页数和本页全部评论"""
+
+    def __init__(self):
+        self.html_parser = etree.HTMLParser(encoding='utf-8')
+
+    def parse(self, html):
+        """解析评论页，返回(总页数, Comment列表)"""
+        root = self._get_root(html)
+        if root is None:
+            return 1, []
+        comments = []
+        for node in _COMMENT_XPATH(root):
+            comment = self._parse_node(node)
+            if comment:
+                comments.append(comment)
+        return self._get_total_pages(root), comments
+
+    def _get_root(self, html):
+        if not html:
+            return None
+        # 微博页面带有xml编码声明，统一按bytes交给lxml解析
+        if isinstance(html, str):
+            html = html.encode('utf-8')
+        return etree.fromstring(html, self.html_parser)
+
+    @staticmethod
+    def _get_total_pages(root):
+        total_pages = _TOTAL_PAGES_XPATH(root)
+        return _get_page_count(total_pages[0]) if total_pages else 1
+
+    @staticmethod
+    def _parse_node(node):
+        """解析一条评论，格式异常时跳过该条评论并返回None"""
+        try:
+            return CommentPageParser._parse_comment(node)
+        except Exception as e:
+            logger.error(u'解析评论%s时出错: %s', node.get('id'), e)
+            return None
+
+    @staticmethod
+    def _parse_comment(node):
+        user_link = _USER_LINK_XPATH(node)
+        if user_link:
+            user_id = user_link[0].get('href').split('/')[-1]
+            screen_name = _text(user_link[0])
+        else:
+            user_id = screen_name = 'N/A'
+
+        content = _CONTENT_XPATH(node)
+        content = _text(content[0]).strip() if content else 'N/A'
+
+        like_info = _LIKE_XPATH(node)
+        likes = _text(like_info[0]).replace('赞[', '').replace(
+            ']', '') if like_info else '0'
+        likes = int(likes) if likes.isdigit() else 0
+
+        # 分离时间、设备和IP属地
+        info_text = _INFO_XPATH(node)
+        info_text = _text(info_text[0]) if info_text else ''
+        info_parts = info_text.split('\xa0')
+        publish_time = info_parts[0] if info_text else 'N/A'
+        device = info_text.split('来自')[-1].split(
+            '\xa0')[0] if '来自' in info_text else 'N/A'
+        ip_location = info_parts[-1] if len(info_parts) > 1 else 'N/A'
+
+        return Comment(id=node.get('id'),
+                       user_id=user_id,
+                       screen_name=screen_name,
+                       content=content,
+                       likes=likes,
+                       publish_time=publish_time,
+                       device=device,
+                       ip_location=ip_location,
+                       hot=_HOT_XPATH(node))
+
+
+class StreamingCommentPageParser:
+    """流式评论页解析器
+
+    边接收响应内容边解析，每条评论的div结束时即解析出评论并释放节点，
+    内存占用不随页面大小增长。
+    """
+
+    HEAD_LIMIT = 64 * 1024
+
+    def __init__(self):
+        self.pull_parser = etree.HTMLPullParser(events=('end', ),
+                                                tag=('div', 'input'),
+                                                encoding='utf-8')
+        self.total_pages = 1
+        # 找到第一条评论之前的原始内容，用于判断没有评论的页面是否被反爬
+        self.head = bytearray()
+
+    def feed(self, chunk):
+        """传入一段响应内容，返回其中已完整的评论"""
+        if self.head is not None and len(self.head) < self.HEAD_LIMIT:
+            self.head += chunk
+        self.pull_parser.feed(chunk)
+        return self._read_comments()
+
+    def close(self):
+        """结束解析，返回剩余的评论"""
+        self.pull_parser.close()
+        return self._read_comments()
+
+    def parse(self, chunks):
+        """解析全部内容，返回(总页数, 评论列表)"""
+        comments = []
+        for chunk in chunks:
+            comments.extend(self.feed(chunk))
+        comments.extend(self.close())
+        return self.total_pages, comments
+
+    def _read_comments(self):
+        comments = []
+        for _, node in self.pull_parser.read_events():
+            if node.tag == 'input':
+                if node.get('name') == 'mp' and any(
+                        div.get('id') == 'pagelist'
+                        for div in node.iterancestors('div')):
+                    self.total_pages = _get_page_count(node.get('value'))
+                continue
+            if not (node.get('id') or '').startswith('C_') or ' c ' not in (
+                    ' %s ' % ' '.join((node.get('class') or '').split())):
+                continue
+            comment = CommentPageParser._parse_node(node)
+            if comment:
+                comments.append(comment)
+            self.head = None
+            # 释放已解析的评论及其之前的节点
+            node.clear()
+            while node.getprevious() is not None:
+                del node.getparent()[0]
+        return comments
+
+
+def parse_stream(response, chunk_size=8192):
+    """边下载边解析评论页响应，返回(总页数, 评论列表, 找到评论前的原始内容)"""
+    parser = StreamingCommentPageParser()
+    try:
+        total_pages, comments = parser.parse(response.iter_content(chunk_size))
+    finally:
+        response.close()
+    return total_pages, comments, bytes(parser.head or b'')
+
+
+def parse_response(response, streaming=False, parser=None):
+    """解析评论页响应，返回(总页数, 评论列表, 用于判断空页面的原始内容)
+
+    streaming为True时边下载边解析，请求需以stream=True发送；
+    parser为None时新建解析器，可在多个线程中同时调用。
+    """
+    if streaming:
+        return parse_stream(response)
+    total_pages, comments = (parser or CommentPageParser()).parse(
+        response.content)
+    return total_pages, comments, response.content
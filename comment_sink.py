@@ -0,0 +1,210 @@
+import csv
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from .datetime_util import standardize_date
+
+logger = logging.getLogger('spider.comment_sink')
+
+
+class CommentSink(ABC):
+    """评论输出基类，按页接收评论，攒够一批或超过刷新间隔后统一写出"""
+
+    def __init__(self, batch_size=500, flush_interval=5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.pending_pages = []  # 缓冲区中的评论页，[(页码, 评论列表)]
+        self.last_flush = time.monotonic()
+        self.saved_count = 0
+        self.on_flush = None  # 写出的评论落盘后回调，参数为已写出的评论页
+
+    def write_page(self, weibo_number, page, comments):
+        """写入一页Comment，评论需已设置number(评论编号)"""
+        self.buffer.extend(comments)
+        self.pending_pages.append((page, comments))
+        logger.info(f"微博 {weibo_number} 第 {page} 页评论已接收 {len(comments)} 条")
+        if (len(self.buffer) >= self.batch_size or
+                time.monotonic() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """将缓冲区中的评论写出"""
+        if self.buffer:
+            self._write_batch(self.buffer)
+            self.saved_count += len(self.buffer)
+            logger.debug(f"已批量保存 {len(self.buffer)} 条评论")
+            self.buffer = []
+        if self.pending_pages and self.on_flush:
+            pages = self.pending_pages
+            self.after_flush(lambda: self.on_flush(pages))
+        self.pending_pages = []
+        self.last_flush = time.monotonic()
+
+    def after_flush(self, callback):
+        """已写出的评论全部落盘后调用callback
+
+        写出即落盘的输出立即调用；写出后仍在缓冲中的输出(如Parquet、Kafka)
+        推迟到落盘后调用，同一输出的回调按登记顺序执行。
+        """
+        callback()
+
+    def close(self):
+        self.flush()
+
+    @abstractmethod
+    def _write_batch(self, comments):
+        """写出一批评论，子类实现"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CsvCommentSink(CommentSink):
+    """将评论批量写入csv文件"""
+
+    result_headers = ['评论编号', '用户ID', '昵称', '内容', '点赞数', '发布时间', '设备', 'IP属地']
+    result_fields = ('number', 'user_id', 'screen_name', 'content', 'likes',
+                     'publish_time', 'device', 'ip_location')
+
+    def __init__(self,
+                 file_path,
+                 batch_size=500,
+                 flush_interval=5,
+                 append=False):
+        super().__init__(batch_size, flush_interval)
+        # 续爬时追加到已有文件，只在新文件中写表头
+        write_headers = not (append and os.path.isfile(file_path)
+                             and os.path.getsize(file_path))
+        self.file = open(file_path,
+                         mode='a' if append else 'w',
+                         encoding='utf-8-sig',
+                         newline='',
+                         buffering=1 << 16)
+        self.csv_writer = csv.writer(self.file)
+        if write_headers:
+            self.csv_writer.writerow(self.result_headers)
+
+    def _write_batch(self, comments):
+        self.csv_writer.writerows(
+            [c.to_row(self.result_fields) for c in comments])
+        self.file.flush()
+
+    def close(self):
+        super().close()
+        self.file.close()
+
+
+class MultiCommentSink(CommentSink):
+    """同时写出到多个评论输出，缓冲和断点回调只在这里处理一次"""
+
+    def __init__(self, sinks, batch_size=500, flush_interval=5):
+        super().__init__(batch_size, flush_interval)
+        self.sinks = sinks
+
+    def _write_batch(self, comments):
+        for sink in self.sinks:
+            sink._write_batch(comments)
+
+    def after_flush(self, callback):
+        """全部输出都落盘后调用callback"""
+        lock = threading.Lock()
+        remaining = [len(self.sinks)]
+
+        def on_sink_flushed():
+            with lock:
+                remaining[0] -= 1
+                done = remaining[0] == 0
+            if done:
+                callback()
+
+        for sink in self.sinks:
+            sink.after_flush(on_sink_flushed)
+
+    def close(self):
+        super().close()
+        for sink in self.sinks:
+            sink.close()
+
+
+class SqliteCommentDatabase:
+    """评论SQLite数据库，所有用户和评论线程共用一个连接
+
+    使用WAL模式，写入时读取不被阻塞；评论以id为主键，重复爬取时更新点赞数等字段。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        # WAL模式下synchronous=NORMAL不会损坏数据库，只在断电时可能丢失最近的事务
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('PRAGMA busy_timeout=5000')
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS comment (
+                    id TEXT PRIMARY KEY,
+                    weibo_id TEXT NOT NULL,
+                    number TEXT,
+                    user_id TEXT,
+                    screen_name TEXT,
+                    content TEXT,
+                    likes INTEGER,
+                    publish_time TEXT,
+                    device TEXT,
+                    ip_location TEXT,
+                    hot INTEGER,
+                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )""")
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS comment_weibo_time '
+                'ON comment (weibo_id, publish_time)')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS comment_user '
+                'ON comment (user_id)')
+
+    def upsert(self, comments):
+        """在一个事务中批量写入评论，评论已存在时更新"""
+        rows = []
+        for c in comments:
+            try:
+                publish_time = standardize_date(c.publish_time)
+            except ValueError:
+                publish_time = c.publish_time
+            rows.append((c.id, c.weibo_id, c.number, c.user_id,
+                         c.screen_name, c.content, c.likes, publish_time,
+                         c.device, c.ip_location, int(bool(c.hot))))
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT INTO comment (id, weibo_id, number, user_id, '
+                'screen_name, content, likes, publish_time, device, '
+                'ip_location, hot) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (id) DO UPDATE SET '
+                'screen_name = excluded.screen_name, '
+                'content = excluded.content, '
+                'likes = excluded.likes, '
+                'hot = excluded.hot, '
+                'updated_at = CURRENT_TIMESTAMP', rows)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class SqliteCommentSink(CommentSink):
+    """将评论批量写入SQLite，每次写出的若干整页评论在同一个事务中提交"""
+
+    def __init__(self, database, batch_size=500, flush_interval=5):
+        super().__init__(batch_size, flush_interval)
+        self.database = database
+
+    def _write_batch(self, comments):
+        self.database.upsert(comments)
@@ -0,0 +1,104 @@
+import csv
+import io
+import logging
+import os
+import threading
+
+from .comment import Comment
+from .comment_sink import CommentSink, CsvCommentSink
+
+logger = logging.getLogger('spider.comment_store')
+
+
+class CommentStore:
+    """用户的全部评论保存在一个只追加的csv文件中
+
+    每批评论作为一段连续的字节追加到数据文件，段的位置按微博id记录在索引文件
+    (数据文件名.idx，每行"微博id,偏移,长度")中，按微博读取评论时只读取对应的段。
+    多个评论线程可同时追加，追加和索引更新在锁内完成。
+    """
+
+    result_headers = ['微博id'] + CsvCommentSink.result_headers
+    result_fields = ('weibo_id', ) + CsvCommentSink.result_fields
+
+    def __init__(self, file_path, append=False):
+        self.file_path = file_path
+        self.index_path = file_path + '.idx'
+        self.lock = threading.Lock()
+        self.index = {}  # {微博id: [(偏移, 长度)]}
+        if not append:
+            for path in (file_path, self.index_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.file = open(file_path, 'ab')
+        if not self.file.tell():
+            self.file.write(self._encode([self.result_headers], 'utf-8-sig'))
+            self.file.flush()
+        self._load_index()
+        self.index_file = open(self.index_path, 'a', encoding='utf-8')
+
+    def _load_index(self):
+        """读取索引，丢弃超出数据文件的段(写数据后、写索引前中断)"""
+        if not os.path.isfile(self.index_path):
+            return
+        size = self.file.tell()
+        with open(self.index_path, encoding='utf-8') as f:
+            for weibo_id, offset, length in csv.reader(f):
+                offset, length = int(offset), int(length)
+                if offset + length <= size:
+                    self.index.setdefault(weibo_id, []).append((offset, length))
+
+    @staticmethod
+    def _encode(rows, encoding='utf-8'):
+        buffer = io.StringIO(newline='')
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode(encoding)
+
+    def append(self, weibo_id, comments):
+        """追加一条微博的一批评论"""
+        data = self._encode(
+            [comment.to_row(self.result_fields) for comment in comments])
+        with self.lock:
+            offset = self.file.tell()
+            self.file.write(data)
+            self.file.flush()
+            self.index.setdefault(weibo_id, []).append((offset, len(data)))
+            self.index_file.write(f'{weibo_id},{offset},{len(data)}\n')
+            self.index_file.flush()
+
+    def get_weibo_ids(self):
+        with self.lock:
+            return list(self.index)
+
+    def read_comments(self, weibo_id):
+        """读取一条微博已保存的全部评论，返回Comment列表"""
+        with self.lock:
+            segments = list(self.index.get(weibo_id, []))
+        comments = []
+        with open(self.file_path, 'rb') as f:
+            for offset, length in segments:
+                f.seek(offset)
+                text = f.read(length).decode('utf-8')
+                for row in csv.reader(io.StringIO(text, newline='')):
+                    comment = Comment(**dict(zip(self.result_fields, row)))
+                    comment.likes = int(comment.likes) if comment.likes.isdigit() else 0
+                    comments.append(comment)
+        return comments
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            self.index_file.close()
+        logger.info(u'%s共保存%d条微博的评论', self.file_path, len(self.index))
+
+
+class CommentStoreSink(CommentSink):
+    """将一条微博的评论写入用户的CommentStore"""
+
+    def __init__(self, store, weibo_id, batch_size=500, flush_interval=5):
+        super().__init__(batch_size, flush_interval)
+        self.store = store
+        self.weibo_id = weibo_id
+
+    def _write_batch(self, comments):
+        self.store.append(self.weibo_id, comments)
@@ -1,10 +1,14 @@
 import codecs
+import importlib.util
 import logging
 import os
 import sys
+import threading
 from datetime import datetime
 
 logger = logging.getLogger('spider.config_util')
+# 多用户并行爬取时，串行化对user_id_list.txt的读写
+_user_config_file_lock = threading.Lock()
 
 
 def _is_date(date_str):
@@ -19,6 +23,21 @@ def _is_date(date_str):
         return False
 
 
+def _validate_proxy_source(source):
+    """验证dict形式的代理源，键为ProxySource的参数"""
+    for key, value in source.items():
+        if key not in ['url', 'xpath', 'regex', 'scheme']:
+            logger.warning(u'proxy_pool的代理源中不存在%s参数,请重新输入', key)
+            sys.exit()
+        if key == 'regex':
+            if not isinstance(value, (bool, str)):
+                logger.warning(u'代理源中regex的值应为true或正则表达式,请重新输入')
+                sys.exit()
+        elif not isinstance(value, str):
+            logger.warning(u'代理源中%s的值应为字符串,请重新输入', key)
+            sys.exit()
+
+
 def validate_config(config):
     """验证配置是否正确"""
 
@@ -41,61 +60,303 @@ def validate_config(config):
         logger.warning(u'end_date值应为yyyy-mm-dd形式或"now",请重新输入')
         sys.exit()
 
-    # 验证random_wait_pages
-    random_wait_pages = config['random_wait_pages']
-    if not isinstance(random_wait_pages, list):
-        logger.warning(u'random_wait_pages参数值应为list类型,请重新输入')
-        sys.exit()
-    if (not isinstance(min(random_wait_pages), int)) or (not isinstance(
-            max(random_wait_pages), int)):
-        logger.warning(u'random_wait_pages列表中的值应为整数类型,请重新输入')
-        sys.exit()
-    if min(random_wait_pages) < 1:
-        logger.warning(u'random_wait_pages列表中的值应大于0,请重新输入')
-        sys.exit()
-
-    # 验证random_wait_seconds
-    random_wait_seconds = config['random_wait_seconds']
-    if not isinstance(random_wait_seconds, list):
-        logger.warning(u'random_wait_seconds参数值应为list类型,请重新输入')
-        sys.exit()
-    if (not isinstance(min(random_wait_seconds), int)) or (not isinstance(
-            max(random_wait_seconds), int)):
-        logger.warning(u'random_wait_seconds列表中的值应为整数类型,请重新输入')
-        sys.exit()
-    if min(random_wait_seconds) < 1:
-        logger.warning(u'random_wait_seconds列表中的值应大于0,请重新输入')
-        sys.exit()
+    # 验证rate_limit、media_rate_limit
+    for name in ['rate_limit', 'media_rate_limit']:
+        rate_limit = config.get(name) or {}
+        if not isinstance(rate_limit, dict):
+            logger.warning(u'%s值应为dict类型,请重新输入', name)
+            sys.exit()
+        for kind in ['host', 'cookie', 'proxy']:
+            bucket = rate_limit.get(kind, {})
+            if not isinstance(bucket, dict):
+                logger.warning(u'%s中%s的值应为包含rate和burst的dict,请重新输入', name,
+                               kind)
+                sys.exit()
+            if 'rate' in bucket and ((not isinstance(bucket['rate'],
+                                                     (int, float)))
+                                     or bucket['rate'] <= 0):
+                logger.warning(u'%s中%s的rate值应为大于0的数字,请重新输入', name, kind)
+                sys.exit()
+            if 'burst' in bucket and ((not isinstance(bucket['burst'], int))
+                                      or bucket['burst'] < 1):
+                logger.warning(u'%s中%s的burst值应为大于0的整数,请重新输入', name, kind)
+                sys.exit()
+        for key in ['backoff_factor', 'recover_factor']:
+            if key in rate_limit and ((not isinstance(rate_limit[key],
+                                                      (int, float)))
+                                      or rate_limit[key] < 1):
+                logger.warning(u'%s中%s的值应为不小于1的数字,请重新输入', name, key)
+                sys.exit()
 
-    # 验证global_wait
-    global_wait = config['global_wait']
-    if not isinstance(global_wait, list):
-        logger.warning(u'global_wait参数值应为list类型,请重新输入')
+    # 验证backoff
+    backoff = config.get('backoff', {})
+    if not isinstance(backoff, dict):
+        logger.warning(u'backoff值应为dict类型,请重新输入')
         sys.exit()
-    for g in global_wait:
-        if not isinstance(g, list):
-            logger.warning(u'global_wait参数内的值应为长度为2的list类型,请重新输入')
+    for response_class, policy in backoff.items():
+        if response_class not in [
+                'empty', 'login_redirect', 'captcha', 'blocked',
+                'client_error', 'server_error', 'timeout'
+        ]:
+            logger.warning(u'backoff中不存在%s类别,请重新输入', response_class)
+            sys.exit()
+        if not isinstance(policy, dict):
+            logger.warning(u'backoff中%s的值应为dict类型,请重新输入', response_class)
             sys.exit()
-        if len(g) != 2:
-            logger.warning(u'global_wait参数内的list长度应为2,请重新输入')
+        if 'action' in policy and policy['action'] not in [
+                'retry', 'rotate', 'skip', 'disable'
+        ]:
+            logger.warning(u'backoff中%s的action值应为retry、rotate、skip或disable,请重新输入',
+                           response_class)
             sys.exit()
-        for i in g:
-            if (not isinstance(i, int)) or i < 1:
-                logger.warning(u'global_wait列表中的值应为大于0的整数,请重新输入')
+        for key in ['delay', 'max_delay', 'retries']:
+            if key in policy and ((not isinstance(policy[key], (int, float)))
+                                  or policy[key] < 0):
+                logger.warning(u'backoff中%s的%s值应为不小于0的数字,请重新输入',
+                               response_class, key)
                 sys.exit()
 
     # 验证write_mode
-    write_mode = ['txt', 'csv', 'json', 'mongo', 'mysql', 'sqlite', 'kafka']
+    write_mode = [
+        'txt', 'csv', 'json', 'mongo', 'mysql', 'sqlite', 'kafka', 'parquet'
+    ]
     if not isinstance(config['write_mode'], list):
         logger.warning(u'write_mode值应为list类型')
         sys.exit()
     for mode in config['write_mode']:
         if mode not in write_mode:
             logger.warning(
-                u'%s为无效模式，请从txt、csv、json、mongo、sqlite, kafka和mysql中挑选一个或多个作为write_mode',
+                u'%s为无效模式，请从txt、csv、json、mongo、sqlite, kafka、parquet和mysql中挑选一个或多个作为write_mode',
                 mode)
             sys.exit()
 
+    # 验证mysql_config、mongo_config中的批量写入参数
+    for mode in ['mysql', 'mongo']:
+        db_config = config.get(mode + '_config') or {}
+        if mode not in config['write_mode'] or not isinstance(db_config, dict):
+            continue
+        for key in [
+                'batch_size', 'flush_interval', 'max_pending', 'pool_size',
+                'pool_timeout'
+        ]:
+            if key in db_config and ((not isinstance(db_config[key],
+                                                     (int, float)))
+                                     or db_config[key] <= 0):
+                logger.warning(u'%s_config中%s值应为大于0的数字,请重新输入', mode, key)
+                sys.exit()
+        for key in ['retries', 'retry_interval']:
+            if key in db_config and ((not isinstance(db_config[key],
+                                                     (int, float)))
+                                     or db_config[key] < 0):
+                logger.warning(u'%s_config中%s值应为不小于0的数字,请重新输入', mode, key)
+                sys.exit()
+
+    # 验证kafka_config
+    if 'kafka' in config['write_mode']:
+        kafka_config = config.get('kafka_config')
+        if not isinstance(kafka_config, dict) or not kafka_config.get(
+                'bootstrap-server'):
+            logger.warning(u'write_mode为kafka时需要配置kafka_config的bootstrap-server,请重新输入')
+            sys.exit()
+        comment_topics = kafka_config.get('comment_topics', [])
+        if not isinstance(comment_topics, list) or not all(
+                isinstance(topic, str) for topic in comment_topics):
+            logger.warning(u'kafka_config中comment_topics值应为主题名列表,请重新输入')
+            sys.exit()
+        if not isinstance(kafka_config.get('producer', {}), dict):
+            logger.warning(u'kafka_config中producer值应为dict类型,请重新输入')
+            sys.exit()
+
+    # 验证parquet_config
+    if 'parquet' in config['write_mode']:
+        if importlib.util.find_spec('pyarrow') is None:
+            logger.warning(u'write_mode为parquet时需要安装pyarrow: pip install pyarrow')
+            sys.exit()
+        parquet_config = config.get('parquet_config', {})
+        if not isinstance(parquet_config, dict):
+            logger.warning(u'parquet_config值应为dict类型,请重新输入')
+            sys.exit()
+        if parquet_config.get('compression', 'zstd') not in [
+                'none', 'snappy', 'gzip', 'brotli', 'lz4', 'zstd'
+        ]:
+            logger.warning(
+                u'parquet_config中compression值应为none、snappy、gzip、brotli、lz4或zstd,请重新输入')
+            sys.exit()
+        for key in parquet_config:
+            if key not in ['compression', 'row_group_size', 'commit_rows']:
+                logger.warning(u'parquet_config中不存在%s参数,请重新输入', key)
+                sys.exit()
+        commit_rows = parquet_config.get('commit_rows', 100000)
+        if (not isinstance(commit_rows, int)) or commit_rows <= 0:
+            logger.warning(u'parquet_config中commit_rows值应为大于0的整数,请重新输入')
+            sys.exit()
+        row_group_size = parquet_config.get('row_group_size', 10000)
+        if (not isinstance(row_group_size, int)) or row_group_size < 1:
+            logger.warning(u'parquet_config中row_group_size值应为大于0的整数,请重新输入')
+            sys.exit()
+
+    # 验证comment_engine
+    comment_engine = config.get('comment_engine', 'sync')
+    if comment_engine not in ['sync', 'async']:
+        logger.warning(u'comment_engine值应为sync或async,请重新输入')
+        sys.exit()
+    comment_concurrency = config.get('comment_concurrency', 8)
+    if (not isinstance(comment_concurrency, int)) or comment_concurrency < 1:
+        logger.warning(u'comment_concurrency值应为大于0的整数,请重新输入')
+        sys.exit()
+
+    # 验证comment_storage
+    if config.get('comment_storage', 'weibo') not in ['weibo', 'user']:
+        logger.warning(u'comment_storage值应为weibo或user,请重新输入')
+        sys.exit()
+
+    # 验证comment_streaming
+    if config.get('comment_streaming', 0) not in [0, 1]:
+        logger.warning(u'comment_streaming值应为0或1,请重新输入')
+        sys.exit()
+
+    # 验证comment_batch_size、comment_flush_interval
+    comment_batch_size = config.get('comment_batch_size', 500)
+    if (not isinstance(comment_batch_size, int)) or comment_batch_size < 1:
+        logger.warning(u'comment_batch_size值应为大于0的整数,请重新输入')
+        sys.exit()
+    comment_flush_interval = config.get('comment_flush_interval', 5)
+    if (not isinstance(comment_flush_interval,
+                       (int, float))) or comment_flush_interval < 0:
+        logger.warning(u'comment_flush_interval值应为不小于0的数字,请重新输入')
+        sys.exit()
+
+    # 验证cookies
+    cookies = config.get('cookies', [])
+    if not isinstance(cookies, list):
+        logger.warning(u'cookies值应为list类型,请重新输入')
+        sys.exit()
+    for cookie in cookies:
+        if not isinstance(cookie, (str, dict)) or (isinstance(cookie, dict)
+                                                   and 'cookie' not in cookie):
+            logger.warning(u'cookies中的每一项应为cookie字符串或包含cookie的dict,请重新输入')
+            sys.exit()
+    if not cookies and not config.get('cookie'):
+        logger.warning(u'请配置cookie或cookies')
+        sys.exit()
+
+    # 验证user_agent_cache
+    user_agent_cache = config.get('user_agent_cache')
+    if user_agent_cache is not None and not isinstance(user_agent_cache, str):
+        logger.warning(u'user_agent_cache值应为User-Agent缓存文件路径,请重新输入')
+        sys.exit()
+
+    # 验证user_concurrency
+    user_concurrency = config.get('user_concurrency', 1)
+    if (not isinstance(user_concurrency, int)) or user_concurrency < 1:
+        logger.warning(u'user_concurrency值应为大于0的整数,请重新输入')
+        sys.exit()
+
+    # 验证pipeline
+    pipeline = config.get('pipeline')
+    if pipeline is not None:
+        if not isinstance(pipeline, dict):
+            logger.warning(u'pipeline值应为dict类型,请重新输入')
+            sys.exit()
+        for key, value in pipeline.items():
+            if key not in [
+                    'writer_workers', 'download_workers', 'comment_workers',
+                    'queue_size'
+            ]:
+                logger.warning(u'pipeline中不存在%s参数,请重新输入', key)
+                sys.exit()
+            if (not isinstance(value, int)) or value < 1:
+                logger.warning(u'pipeline中%s的值应为大于0的整数,请重新输入', key)
+                sys.exit()
+
+    # 验证proxy_pool
+    proxy_pool = config.get('proxy_pool')
+    if proxy_pool is not None:
+        if not isinstance(proxy_pool, dict):
+            logger.warning(u'proxy_pool值应为dict类型,请重新输入')
+            sys.exit()
+        for key, value in proxy_pool.items():
+            if key in ['local_proxies', 'sources', 'test_urls']:
+                if not isinstance(value, list):
+                    logger.warning(u'proxy_pool中%s的值应为list类型,请重新输入', key)
+                    sys.exit()
+                if key == 'sources':
+                    for source in value:
+                        if not isinstance(source, (str, dict)) or (
+                                isinstance(source, dict) and 'url' not in source):
+                            logger.warning(
+                                u'proxy_pool中sources的每一项应为代理源名称、网址或包含url的dict,请重新输入')
+                            sys.exit()
+                        if isinstance(source, dict):
+                            _validate_proxy_source(source)
+            elif key in [
+                    'max_proxies', 'update_interval', 'probe_interval',
+                    'test_timeout', 'test_workers', 'max_retries',
+                    'max_failures', 'quarantine_seconds',
+                    'max_quarantine_seconds', 'min_success_rate',
+                    'source_deadline'
+            ]:
+                if (not isinstance(value, (int, float))) or value <= 0:
+                    logger.warning(u'proxy_pool中%s的值应为大于0的数字,请重新输入', key)
+                    sys.exit()
+            else:
+                logger.warning(u'proxy_pool中不存在%s参数,请重新输入', key)
+                sys.exit()
+
+    # 验证media_download_workers、media_manifest_path
+    media_download_workers = config.get('media_download_workers', 4)
+    if (not isinstance(media_download_workers,
+                       int)) or media_download_workers < 1:
+        logger.warning(u'media_download_workers值应为大于0的整数,请重新输入')
+        sys.exit()
+    media_manifest_path = config.get('media_manifest_path')
+    if media_manifest_path is not None and not isinstance(
+            media_manifest_path, str):
+        logger.warning(u'media_manifest_path值应为下载清单数据库文件路径,请重新输入')
+        sys.exit()
+
+    # 验证page_cache
+    page_cache = config.get('page_cache', {})
+    if not isinstance(page_cache, dict):
+        logger.warning(u'page_cache值应为dict类型,请重新输入')
+        sys.exit()
+    if 'path' in page_cache and not isinstance(page_cache['path'], str):
+        logger.warning(u'page_cache中path值应为缓存数据库文件路径,请重新输入')
+        sys.exit()
+    for key in ['profile_ttl', 'album_ttl']:
+        if key in page_cache and ((not isinstance(page_cache[key],
+                                                  (int, float)))
+                                  or page_cache[key] < 0):
+            logger.warning(u'page_cache中%s值应为不小于0的秒数,请重新输入', key)
+            sys.exit()
+
+    # 验证response_archive
+    response_archive = config.get('response_archive', {})
+    if not isinstance(response_archive, dict):
+        logger.warning(u'response_archive值应为dict类型,请重新输入')
+        sys.exit()
+    if 'path' in response_archive and not isinstance(
+            response_archive['path'], str):
+        logger.warning(u'response_archive中path值应为存档目录路径,请重新输入')
+        sys.exit()
+    compression = response_archive.get('compression', 'zlib')
+    if compression not in ['zlib', 'zstd']:
+        logger.warning(u'response_archive中compression值应为zlib或zstd,请重新输入')
+        sys.exit()
+    if compression == 'zstd' and importlib.util.find_spec('zstandard') is None:
+        logger.warning(u'使用zstd压缩需要先安装zstandard')
+        sys.exit()
+    segment_size = response_archive.get('segment_size', 1)
+    if (not isinstance(segment_size, int)) or segment_size <= 0:
+        logger.warning(u'response_archive中segment_size值应为大于0的字节数,请重新输入')
+        sys.exit()
+
+    # 验证checkpoint_path
+    checkpoint_path = config.get('checkpoint_path')
+    if checkpoint_path is not None and not isinstance(checkpoint_path, str):
+        logger.warning(u'checkpoint_path值应为断点数据库文件路径,请重新输入')
+        sys.exit()
+
     # 验证user_id_list
     user_id_list = config['user_id_list']
     if (not isinstance(user_id_list,
@@ -142,26 +403,28 @@ def update_user_config_file(user_config_file_path, user_uri, nickname,
     """更新用户配置文件"""
     if not user_config_file_path:
         user_config_file_path = os.getcwd() + os.sep + 'user_id_list.txt'
-    with open(user_config_file_path, 'rb') as f:
-        lines = f.read().splitlines()
-        lines = [line.decode('utf-8-sig') for line in lines]
-        for i, line in enumerate(lines):
-            info = line.split(' ')
-            if len(info) > 0:
-                if user_uri == info[0]:
-                    if len(info) == 1:
-                        info.append(nickname)
-                        info.append(start_time)
-                    if len(info) == 2:
-                        info.append(start_time)
-                    if len(info) > 3 and _is_date(info[2] + ' ' + info[3]):
-                        del info[3]
-                    if len(info) > 2:
-                        info[2] = start_time
-                    lines[i] = ' '.join(info)
-                    break
-    with codecs.open(user_config_file_path, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(lines))
+    with _user_config_file_lock:
+        with open(user_config_file_path, 'rb') as f:
+            lines = f.read().splitlines()
+            lines = [line.decode('utf-8-sig') for line in lines]
+            for i, line in enumerate(lines):
+                info = line.split(' ')
+                if len(info) > 0:
+                    if user_uri == info[0]:
+                        if len(info) == 1:
+                            info.append(nickname)
+                            info.append(start_time)
+                        if len(info) == 2:
+                            info.append(start_time)
+                        if len(info) > 3 and _is_date(info[2] + ' ' +
+                                                      info[3]):
+                            del info[3]
+                        if len(info) > 2:
+                            info[2] = start_time
+                        lines[i] = ' '.join(info)
+                        break
+        with codecs.open(user_config_file_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines))
 
 
 def add_user_uri_list(user_config_file_path, user_uri_list):
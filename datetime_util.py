@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
 
 def str_to_time(text):
@@ -8,3 +8,49 @@ def str_to_time(text):
     else:
         result = datetime.strptime(text, '%Y-%m-%d')
     return result
+
+
+def _get_day(text):
+    """返回YYYY-MM-DD开头的时间中的(年, 月, 日)，无法识别时返回None"""
+    try:
+        day = datetime.strptime((text or '')[:10], '%Y-%m-%d')
+    except ValueError:
+        return None
+    return day.year, day.month, day.day
+
+
+def standardize_date(text, now=None, since=None):
+    """将微博页面中的时间(刚刚、x分钟前、今天 HH:MM、x月x日 HH:MM)转换成YYYY-MM-DD HH:MM格式
+
+    x月x日不含年份，晚于now的日期属于前一年；since为不早于的时间(如评论所属微博的
+    发布时间)，早于since的日期属于下一年，跨年前后爬取的评论不会算到错误的年份。
+    """
+    now = now or datetime.now()
+    text = (text or '').strip()
+    if text.startswith(u'刚刚'):
+        return now.strftime('%Y-%m-%d %H:%M')
+    if u'分钟前' in text:
+        minutes = int(text[:text.find(u'分钟')])
+        return (now - timedelta(minutes=minutes)).strftime('%Y-%m-%d %H:%M')
+    if text.startswith(u'今天'):
+        return now.strftime('%Y-%m-%d') + ' ' + text[2:].strip()[:5]
+    if u'月' in text and u'日' in text:
+        month = int(text[:text.find(u'月')])
+        day = int(text[text.find(u'月') + 1:text.find(u'日')])
+        year = now.year
+        if (month, day) > (now.month, now.day):
+            year -= 1
+        since_day = _get_day(since)
+        if since_day and (year, month, day) < since_day:
+            year += 1
+        return '%d-%02d-%02d %s' % (year, month, day,
+                                    text[text.find(u'日') + 1:].strip()[:5])
+    return text[:16]
+
+
+def standardize_comment_date(text, weibo_publish_time):
+    """将评论时间转换成YYYY-MM-DD HH:MM格式，按微博发布时间推断年份，无法识别时原样返回"""
+    try:
+        return standardize_date(text, since=weibo_publish_time)
+    except ValueError:
+        return text
@@ -0,0 +1,348 @@
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from queue import Empty, Queue
+
+from .user import User
+from .weibo import Weibo
+
+logger = logging.getLogger('spider.db_writer')
+
+# 写入器参数，可写在mysql_config/mongo_config中，不会传给数据库驱动
+WRITER_OPTIONS = {
+    'batch_size': 1000,  # 某个表缓冲够该条数时立即写出
+    'flush_interval': 5,  # 缓冲最长秒数
+    'max_pending': 20000,  # 缓冲超过该条数时写入方等待，防止数据库不可用时内存无限增长
+    'retries': 2,  # 批量写入失败后的重试次数，仍失败时逐条写入
+    'retry_interval': 1,  # 第n次重试前等待n倍该秒数
+    'pool_size': 2,  # MySQL连接数
+    'pool_timeout': 30,  # 连接都在使用中时最长等待秒数
+}
+_TABLES = {'user': User, 'weibo': Weibo}
+
+
+def split_options(config):
+    """将配置分为(数据库连接参数, 写入器参数)"""
+    config = dict(config or {})
+    options = {
+        key: config.pop(key, default)
+        for key, default in WRITER_OPTIONS.items()
+    }
+    return config, options
+
+
+def _to_value(value):
+    """图片链接等列表字段以逗号连接"""
+    return ','.join(value) if isinstance(value, list) else value
+
+
+class BufferedWriter(ABC):
+    """批量写入数据库的写入器基类
+
+    write_weibo、write_user只把记录放入缓冲区并立即返回，后台线程在某个表
+    缓冲够batch_size条或距上次写出超过flush_interval秒时批量写出，
+    爬取不再等待数据库往返。同一id的记录在缓冲区中只保留最新的一条。
+    批量写入失败时重试，重试后仍失败则逐条写入，只丢弃本身有问题的记录。
+    所有用户共用一个写入器。
+    """
+
+    def __init__(self,
+                 batch_size=1000,
+                 flush_interval=5,
+                 max_pending=20000,
+                 retries=2,
+                 retry_interval=1,
+                 **kwargs):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retries = retries
+        self.retry_interval = retry_interval
+        self.condition = threading.Condition()
+        self.buffers = {table: {} for table in _TABLES}  # {表: {id: 记录}}
+        self.pending = 0
+        self.written_count = 0
+        self.failed_count = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self._run,
+                                       name=type(self).__name__,
+                                       daemon=True)
+        self.thread.start()
+
+    def write_weibo(self, weibos):
+        self._put('weibo', weibos)
+
+    def write_user(self, user):
+        self._put('user', [user])
+
+    def _put(self, table, records):
+        with self.condition:
+            while self.pending >= self.max_pending and not self.closed:
+                self.condition.wait()
+            buffer = self.buffers[table]
+            for record in records:
+                if record.id not in buffer:
+                    self.pending += 1
+                buffer[record.id] = [
+                    _to_value(value) for value in record.to_row()
+                ]
+            if len(buffer) >= self.batch_size:
+                self.condition.notify_all()
+
+    def _take_batches(self):
+        """等待到需要写出时取出全部缓冲，返回{表: [行]}"""
+        deadline = time.monotonic() + self.flush_interval
+        with self.condition:
+            while not self.closed and all(
+                    len(buffer) < self.batch_size
+                    for buffer in self.buffers.values()):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                self.condition.wait(timeout)
+            batches = {
+                table: list(buffer.values())
+                for table, buffer in self.buffers.items() if buffer
+            }
+            self.buffers = {table: {} for table in _TABLES}
+            return batches
+
+    def _run(self):
+        while True:
+            closed = self.closed
+            batches = self._take_batches()
+            for table, rows in batches.items():
+                self._write_rows(table, rows)
+            with self.condition:
+                self.pending -= sum(len(rows) for rows in batches.values())
+                self.condition.notify_all()
+            if closed:
+                break
+
+    def _write_rows(self, table, rows):
+        fields = _TABLES[table].fields
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.retry_interval * attempt)
+            try:
+                self._write(table, fields, rows)
+                self.written_count += len(rows)
+                logger.debug(u'已批量写入%s表%d条记录', table, len(rows))
+                return
+            except Exception as e:
+                logger.warning(u'批量写入%s表%d条记录失败(第%d次): %s', table,
+                               len(rows), attempt + 1, e)
+        # 逐条写入，跳过本身有问题的记录(如字段超长、日期格式错误)
+        for row in rows:
+            try:
+                self._write(table, fields, [row])
+                self.written_count += 1
+            except Exception as e:
+                self.failed_count += 1
+                logger.error(u'写入%s表id为%s的记录失败: %s', table, row[0], e)
+
+    @abstractmethod
+    def _write(self, table, fields, rows):
+        """将一批行写入table，rows中每行的值与fields对应"""
+
+    def close(self):
+        """写出剩余的记录后停止后台线程"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        logger.info(u'%s共写入%d条记录，失败%d条', type(self).__name__,
+                    self.written_count, self.failed_count)
+
+
+class MySqlConnectionPool:
+    """MySQL连接池，取出连接时检查连接是否可用，断开时自动重连"""
+
+    def __init__(self, mysql_config, size=2, timeout=30):
+        self.mysql_config = mysql_config
+        self.connections = Queue()
+        self.size = size
+        self.timeout = timeout
+        self.created = 0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        import pymysql
+
+        try:
+            connection = self.connections.get_nowait()
+        except Empty:
+            with self.lock:
+                create = self.created < self.size
+                if create:
+                    self.created += 1
+            if create:
+                try:
+                    connection = pymysql.connect(**self.mysql_config)
+                except Exception:
+                    self._discard(None)
+                    raise
+            else:
+                try:
+                    connection = self.connections.get(timeout=self.timeout)
+                except Empty:
+                    raise TimeoutError(u'%s秒内没有可用的MySQL连接' %
+                                       self.timeout)
+        try:
+            connection.ping(reconnect=True)
+        except Exception:
+            # 无法重连的连接不再放回连接池，之后按需新建
+            self._discard(connection)
+            raise
+        try:
+            yield connection
+        finally:
+            self.connections.put(connection)
+
+    def _discard(self, connection):
+        with self.lock:
+            self.created -= 1
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def close(self):
+        while not self.connections.empty():
+            self.connections.get_nowait().close()
+
+
+class BufferedMySqlWriter(BufferedWriter):
+    """将微博和用户信息批量写入MySQL
+
+    pymysql的executemany会把INSERT ... ON DUPLICATE KEY UPDATE合并成多行插入，
+    一批记录只需一次往返。
+    """
+
+    create_sql = {
+        'user': """
+            CREATE TABLE IF NOT EXISTS user (
+                id varchar(20) NOT NULL,
+                nickname varchar(30),
+                gender varchar(10),
+                location varchar(200),
+                birthday varchar(40),
+                description varchar(400),
+                verified_reason varchar(140),
+                talent varchar(200),
+                education varchar(200),
+                work varchar(200),
+                weibo_num INT,
+                following INT,
+                followers INT,
+                PRIMARY KEY (id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+        'weibo': """
+            CREATE TABLE IF NOT EXISTS weibo (
+                id varchar(10) NOT NULL,
+                user_id varchar(20),
+                content varchar(2000),
+                article_url varchar(200),
+                original_pictures varchar(3000),
+                retweet_pictures varchar(3000),
+                original BOOLEAN,
+                video_url varchar(300),
+                publish_place varchar(100),
+                publish_time DATETIME NOT NULL,
+                publish_tool varchar(30),
+                up_num INT NOT NULL,
+                retweet_num INT NOT NULL,
+                comment_num INT NOT NULL,
+                PRIMARY KEY (id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    }
+
+    def __init__(self, mysql_config):
+        mysql_config, options = split_options(mysql_config)
+        mysql_config.setdefault('charset', 'utf8mb4')
+        self._create_database(mysql_config)
+        mysql_config['db'] = 'weibo'
+        self.pool = MySqlConnectionPool(mysql_config, options['pool_size'],
+                                        options['pool_timeout'])
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                for sql in self.create_sql.values():
+                    cursor.execute(sql)
+            connection.commit()
+        super().__init__(**options)
+
+    @staticmethod
+    def _create_database(mysql_config):
+        import pymysql
+
+        connection = pymysql.connect(**mysql_config)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'CREATE DATABASE IF NOT EXISTS weibo DEFAULT CHARACTER SET utf8mb4')
+        finally:
+            connection.close()
+
+    @staticmethod
+    def get_insert_sql(table, fields):
+        return 'INSERT INTO %s (%s) VALUES (%s) ON DUPLICATE KEY UPDATE %s' % (
+            table, ', '.join(fields), ', '.join(['%s'] * len(fields)),
+            ', '.join('%s = VALUES(%s)' % (field, field)
+                      for field in fields[1:]))
+
+    def _write(self, table, fields, rows):
+        with self.pool.connection() as connection:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.executemany(self.get_insert_sql(table, fields),
+                                       rows)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+
+    def close(self):
+        super().close()
+        self.pool.close()
+
+
+class BufferedMongoWriter(BufferedWriter):
+    """将微博和用户信息批量写入MongoDB，一批记录一次bulk_write"""
+
+    def __init__(self, mongo_config, client=None):
+        mongo_config, options = split_options(mongo_config)
+        if client is None:
+            import pymongo
+
+            credentials = {}
+            if mongo_config.get('dba_name') and mongo_config.get(
+                    'dba_password'):
+                credentials = {
+                    'username': mongo_config['dba_name'],
+                    'password': mongo_config['dba_password'],
+                }
+            # MongoClient自带连接池，所有用户共用
+            client = pymongo.MongoClient(mongo_config['connection_string'],
+                                         **credentials)
+        self.client = client
+        self.db = client['weibo']
+        for table in _TABLES:
+            self.db[table].create_index('id', unique=True)
+        super().__init__(**options)
+
+    def _write(self, table, fields, rows):
+        from pymongo import UpdateOne
+
+        operations = [
+            UpdateOne({'id': row[0]}, {'$set': dict(zip(fields, row))},
+                      upsert=True) for row in rows
+        ]
+        self.db[table].bulk_write(operations, ordered=False)
+
+    def close(self):
+        super().close()
+        self.client.close()
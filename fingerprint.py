@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+
+logger = logging.getLogger('spider.fingerprint')
+
+# 数据文件和缓存都不可用时使用的User-Agent
+DEFAULT_USER_AGENTS = [
+    {
+        'useragent':
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
+        'browser': 'Chrome',
+        'browser_version': '124.0.0.0',
+        'os': 'Windows',
+        'type': 'desktop',
+        'percent': 1.0,
+    },
+    {
+        'useragent':
+        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Safari/605.1.15',
+        'browser': 'Safari',
+        'browser_version': '17.4',
+        'os': 'Mac OS X',
+        'type': 'desktop',
+        'percent': 0.5,
+    },
+    {
+        'useragent':
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0',
+        'browser': 'Firefox',
+        'browser_version': '125.0',
+        'os': 'Windows',
+        'type': 'desktop',
+        'percent': 0.3,
+    },
+]
+# 能生成匹配请求头的浏览器，值为sec-ch-ua中的品牌名，None表示不发送sec-ch-ua
+_CHROMIUM_BRANDS = {
+    'Chrome': 'Google Chrome',
+    'Chrome Mobile': 'Google Chrome',
+    'Edge': 'Microsoft Edge',
+    'Opera': 'Opera',
+    'Samsung Internet': 'Samsung Internet',
+}
+_OTHER_BROWSERS = ('Firefox', 'Firefox Mobile', 'Safari', 'Mobile Safari',
+                   'Chrome Mobile iOS')
+_PLATFORMS = {
+    'Windows': 'Windows',
+    'Mac OS X': 'macOS',
+    'Linux': 'Linux',
+    'Ubuntu': 'Linux',
+    'Android': 'Android',
+    'Chrome OS': 'Chrome OS',
+}
+_CHROMIUM_ACCEPT = ('text/html,application/xhtml+xml,application/xml;q=0.9,'
+                    'image/avif,image/webp,image/apng,*/*;q=0.8,'
+                    'application/signed-exchange;v=b3;q=0.7')
+_DEFAULT_ACCEPT = 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
+
+_user_agents = None
+_user_agents_lock = threading.Lock()
+
+
+def _read_package_data():
+    """读取fake_useragent自带的数据文件，不初始化UserAgent，也不访问网络"""
+    try:
+        from importlib.resources import files
+
+        data = files('fake_useragent').joinpath('data', 'browsers.jsonl')
+        return [json.loads(line) for line in data.read_text('utf-8').splitlines()
+                if line.strip()]
+    except Exception as e:
+        logger.warning(u'读取fake_useragent数据文件失败，使用内置User-Agent: %s', e)
+        return []
+
+
+def _is_supported(user_agent):
+    if user_agent.get('os') == 'iOS':
+        # iOS上的浏览器都基于WebKit，请求头和Safari一致
+        return True
+    return (user_agent.get('browser') in _CHROMIUM_BRANDS
+            or user_agent.get('browser') in _OTHER_BROWSERS) and user_agent.get(
+                'os') in _PLATFORMS
+
+
+def load_user_agents(cache_path=None):
+    """加载User-Agent数据，整个进程只加载一次
+
+    优先读取本地缓存，没有缓存时读取fake_useragent自带的数据文件并写入缓存。
+    """
+    global _user_agents
+    with _user_agents_lock:
+        if _user_agents is not None:
+            return _user_agents
+        user_agents = None
+        if cache_path and os.path.isfile(cache_path):
+            try:
+                with open(cache_path, encoding='utf-8') as f:
+                    user_agents = json.load(f)
+            except ValueError:
+                logger.warning(u'User-Agent缓存%s格式不正确，重新生成', cache_path)
+        if not user_agents:
+            user_agents = [
+                {
+                    key: user_agent.get(key)
+                    for key in DEFAULT_USER_AGENTS[0]
+                } for user_agent in _read_package_data()
+                if _is_supported(user_agent)
+            ] or DEFAULT_USER_AGENTS
+            if cache_path:
+                cache_dir = os.path.dirname(os.path.abspath(cache_path))
+                if not os.path.isdir(cache_dir):
+                    os.makedirs(cache_dir)
+                with open(cache_path, 'w', encoding='utf-8') as f:
+                    json.dump(user_agents, f, ensure_ascii=False)
+        logger.debug(u'已加载%d个User-Agent', len(user_agents))
+        _user_agents = user_agents
+        return _user_agents
+
+
+def get_headers(user_agent):
+    """生成与User-Agent匹配的请求头"""
+    mobile = user_agent.get('type') != 'desktop'
+    headers = {
+        'user-agent': user_agent['useragent'],
+        'accept': _DEFAULT_ACCEPT,
+        'upgrade-insecure-requests': '1',
+        'sec-fetch-dest': 'document',
+        'sec-fetch-mode': 'navigate',
+        'sec-fetch-site': 'same-origin',
+        'sec-fetch-user': '?1',
+    }
+    brand = _CHROMIUM_BRANDS.get(user_agent.get('browser'))
+    if brand and user_agent.get('os') != 'iOS':
+        major = str(user_agent.get('browser_version') or '').split('.')[0]
+        headers['accept'] = _CHROMIUM_ACCEPT
+        headers['sec-ch-ua'] = (f'"Chromium";v="{major}", "{brand}";v="{major}", '
+                                f'"Not-A.Brand";v="99"')
+        headers['sec-ch-ua-mobile'] = '?1' if mobile else '?0'
+        headers['sec-ch-ua-platform'] = f'"{_PLATFORMS[user_agent["os"]]}"'
+    return headers
+
+
+class FingerprintManager:
+    """为每个身份生成一套固定的浏览器请求头
+
+    User-Agent按使用占比随机选择，同一cookie每次运行得到相同的结果，
+    accept和sec-*头与User-Agent所属的浏览器一致，会话期间不再更换。
+    """
+
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path
+
+    def create(self, seed):
+        """根据seed(如cookie)生成请求头"""
+        user_agents = load_user_agents(self.cache_path)
+        rng = random.Random(hashlib.sha1(seed.encode('utf-8')).hexdigest())
+        user_agent = rng.choices(
+            user_agents,
+            weights=[user_agent.get('percent') or 0.01
+                     for user_agent in user_agents])[0]
+        return get_headers(user_agent)
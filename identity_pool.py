@@ -0,0 +1,155 @@
+import logging
+import threading
+import time
+from time import sleep
+
+from .rate_limiter import RateLimitedSession
+
+logger = logging.getLogger('spider.identity_pool')
+
+
+class Identity:
+    """爬取身份（cookie + 代理），拥有独立的会话、User-Agent和限速令牌桶"""
+
+    def __init__(self,
+                 rate_limiter,
+                 cookie,
+                 headers,
+                 proxy=None,
+                 proxy_pool=None,
+                 name=''):
+        self.rate_limiter = rate_limiter
+        self.cookie = cookie
+        self.name = name
+        self.proxy_pool = proxy_pool
+        # 身份固定使用一个代理，请求结果仍反馈给代理池
+        self.session = RateLimitedSession(rate_limiter,
+                                          cookie,
+                                          proxy_pool,
+                                          rotate_proxy=False)
+        self.session.headers.update(headers)
+        self.session.headers['cookie'] = cookie
+        self.proxy = None
+        self.bind_proxy(proxy)
+        self.cooldown_until = 0  # 被反爬后冷却到该时间(time.monotonic)
+        self.expired = False  # cookie失效(跳转登录页)后不再使用
+        self.blocked = 0
+
+    @property
+    def headers(self):
+        return self.session.headers
+
+    def bind_proxy(self, proxy):
+        """绑定代理，None为直连"""
+        self.proxy = proxy
+        self.session.proxies.clear()
+        if proxy:
+            self.session.proxies.update({'http': proxy, 'https': proxy})
+
+    def get_cooldown(self):
+        """返回剩余冷却秒数"""
+        return max(0.0, self.cooldown_until - time.monotonic())
+
+    def get_wait(self, url):
+        """返回现在使用该身份请求url需要等待的秒数"""
+        return max(self.get_cooldown(),
+                   self.rate_limiter.get_wait(url, self.cookie, self.proxy))
+
+    def mark_blocked(self, seconds):
+        """身份被反爬(验证码、403、空页面等)，冷却seconds秒"""
+        self.blocked += 1
+        self.cooldown_until = max(self.cooldown_until,
+                                  time.monotonic() + seconds)
+
+    def mark_expired(self):
+        """cookie失效，停止使用该身份"""
+        self.expired = True
+        logger.error(u'%s的cookie已失效，停止使用，请更新cookie', self)
+
+    def get_metrics(self):
+        return {
+            'proxy': self.proxy or u'直连',
+            'expired': self.expired,
+            'blocked': self.blocked,
+            'cooldown': round(self.get_cooldown(), 1),
+        }
+
+    def __str__(self):
+        return f"{self.name}@{self.proxy or u'直连'}"
+
+
+class IdentityPool:
+    """身份池
+
+    每个cookie是一个身份，各自拥有会话、User-Agent和代理，并占用各自的cookie令牌桶。
+    每次请求选择最早可用的身份，吞吐量随账号数量线性增长；
+    被反爬的身份冷却，cookie失效的身份停用，绑定的代理被隔离时换绑其他代理。
+    """
+
+    def __init__(self,
+                 rate_limiter,
+                 cookies,
+                 headers,
+                 proxy_pool=None,
+                 fingerprints=None):
+        self.proxy_pool = proxy_pool
+        self.lock = threading.Lock()
+        proxies = proxy_pool.valid_proxies if proxy_pool else [None]
+        self.identities = []
+        for i, cookie in enumerate(cookies):
+            # cookie可以写成{"cookie": ..., "proxy": ...}固定代理，否则轮流绑定代理池中的代理
+            proxy = proxies[i % len(proxies)]
+            if isinstance(cookie, dict):
+                proxy = cookie.get('proxy', proxy)
+                cookie = cookie['cookie']
+            # 每个身份使用固定的浏览器指纹，整个会话期间不变
+            identity_headers = dict(headers)
+            if fingerprints:
+                identity_headers.update(fingerprints.create(cookie))
+            self.identities.append(
+                Identity(rate_limiter, cookie, identity_headers, proxy,
+                         proxy_pool, f'账号{i + 1}'))
+
+    def _rebind_quarantined(self):
+        """绑定的代理被代理池隔离时，换绑一个可用代理"""
+        if not self.proxy_pool:
+            return
+        for identity in self.identities:
+            if identity.proxy and self.proxy_pool.get_quarantine(
+                    identity.proxy):
+                identity.bind_proxy(self.proxy_pool.select())
+                logger.info(u'%s的代理被隔离，换绑代理', identity)
+
+    def is_exhausted(self):
+        """所有身份的cookie均已失效"""
+        return all(identity.expired for identity in self.identities)
+
+    def reserve(self, url):
+        """选出最早可用的身份并预约令牌，返回(身份, 需要等待的秒数)"""
+        with self.lock:
+            self._rebind_quarantined()
+            identities = [i for i in self.identities if not i.expired]
+            if not identities:
+                raise RuntimeError(u'所有身份的cookie均已失效')
+            identity = min(identities, key=lambda i: i.get_wait(url))
+            wait = max(
+                identity.get_cooldown(),
+                identity.rate_limiter.reserve(url, identity.cookie,
+                                              identity.proxy))
+        return identity, wait
+
+    def acquire(self, url):
+        """等待到有身份可以请求url时返回该身份"""
+        identity, wait = self.reserve(url)
+        if wait > 0:
+            logger.debug(u'%s等待 %.2f 秒: %s', identity, wait, url)
+            sleep(wait)
+        return identity
+
+    def get_metrics(self):
+        """返回各身份的代理、失效、被反爬次数和剩余冷却时间"""
+        with self.lock:
+            return {
+                identity.name: identity.get_metrics()
+                for identity in self.identities
+            }
@@ -0,0 +1,230 @@
+import json
+import logging
+import threading
+import zlib
+from collections import deque, namedtuple
+
+from .comment_sink import CommentSink
+
+logger = logging.getLogger('spider.kafka_comment_sink')
+
+# KafkaProducer参数，可在kafka_config.producer中覆盖
+DEFAULT_PRODUCER_CONFIG = {
+    'acks': 1,
+    'linger_ms': 50,  # 最多等待50毫秒攒成一批再发送
+    'batch_size': 64 * 1024,
+    'compression_type': 'gzip',
+    'max_block_ms': 5000,  # 缓冲区满或取不到元数据时send最长阻塞时间
+}
+# bootstrap-server为该前缀时使用进程内的FakeKafkaBroker，不需要真实的Kafka
+MEMORY_BROKER_PREFIX = 'memory://'
+
+RecordMetadata = namedtuple('RecordMetadata', ['topic', 'partition', 'offset'])
+
+
+class _FakeFuture:
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+
+    def add_callback(self, callback, *args, **kwargs):
+        callback(*args, self.metadata, **kwargs)
+        return self
+
+    def add_errback(self, errback, *args, **kwargs):
+        return self
+
+    def get(self, timeout=None):
+        return self.metadata
+
+
+class FakeKafkaBroker:
+    """进程内的Kafka替身，用于测试和本地调试
+
+    按key的crc32选择分区，同一key的消息在同一分区内保持顺序。
+    """
+
+    def __init__(self, partitions=4):
+        self.partitions = partitions
+        self.lock = threading.Lock()
+        self.topics = {}  # {主题: [[(key, value)]]}
+
+    def append(self, topic, key, value):
+        partition = zlib.crc32(key or b'') % self.partitions
+        with self.lock:
+            log = self.topics.setdefault(
+                topic, [[] for _ in range(self.partitions)])[partition]
+            log.append((key, value))
+            return RecordMetadata(topic, partition, len(log) - 1)
+
+    def get_messages(self, topic, partition=None):
+        """返回主题(或其中一个分区)的全部消息，[(key, value)]"""
+        with self.lock:
+            logs = self.topics.get(topic, [])
+            if partition is not None:
+                return list(logs[partition]) if logs else []
+            return [message for log in logs for message in log]
+
+
+class FakeKafkaProducer:
+    """与KafkaProducer接口一致、写入FakeKafkaBroker的生产者"""
+
+    def __init__(self, broker, key_serializer=None, value_serializer=None,
+                 **kwargs):
+        self.broker = broker
+        self.key_serializer = key_serializer
+        self.value_serializer = value_serializer
+
+    def send(self, topic, value=None, key=None):
+        if self.key_serializer and key is not None:
+            key = self.key_serializer(key)
+        if self.value_serializer:
+            value = self.value_serializer(value)
+        return _FakeFuture(self.broker.append(topic, key, value))
+
+    def flush(self, timeout=None):
+        pass
+
+    def close(self, timeout=None):
+        pass
+
+
+_memory_brokers = {}
+_memory_brokers_lock = threading.Lock()
+
+
+def get_memory_broker(name):
+    """获取bootstrap-server为memory://name时使用的进程内broker"""
+    with _memory_brokers_lock:
+        return _memory_brokers.setdefault(name, FakeKafkaBroker())
+
+
+class KafkaCommentProducer:
+    """将评论异步发送到comment_topics
+
+    send只把消息放入生产者缓冲区，由KafkaProducer的后台线程按linger_ms和
+    batch_size攒批、压缩后发送，不等待broker确认；发送失败在回调中记录。
+    消息以微博id为key，同一微博的评论进入同一分区并保持顺序。
+    多个用户和评论线程共用一个实例。
+    """
+
+    def __init__(self, kafka_config):
+        self.topics = kafka_config.get('comment_topics', [])
+        producer_config = dict(DEFAULT_PRODUCER_CONFIG,
+                               **kafka_config.get('producer', {}))
+        servers = kafka_config['bootstrap-server']
+        serializers = {
+            'key_serializer': lambda key: key.encode('utf-8'),
+            'value_serializer':
+            lambda value: json.dumps(value, ensure_ascii=False).encode('utf-8'),
+        }
+        if servers.startswith(MEMORY_BROKER_PREFIX):
+            self.producer = FakeKafkaProducer(
+                get_memory_broker(servers[len(MEMORY_BROKER_PREFIX):]),
+                **serializers)
+        else:
+            from kafka import KafkaProducer
+
+            self.producer = KafkaProducer(bootstrap_servers=servers,
+                                          **serializers, **producer_config)
+        self.lock = threading.Lock()
+        self.sent_count = 0
+        self.acked_count = 0
+        self.failed_count = 0
+
+    def _on_success(self, metadata):
+        with self.lock:
+            self.acked_count += 1
+
+    def _on_error(self, error):
+        with self.lock:
+            self.failed_count += 1
+        logger.error(u'评论发送到Kafka失败: %s', error)
+
+    def send(self, comments, on_acked=None, on_failed=None):
+        """发送评论，每条消息确认后调用on_acked()，发送失败时调用on_failed(error)"""
+        for comment in comments:
+            value = comment.to_dict()
+            for topic in self.topics:
+                future = self.producer.send(topic, value=value,
+                                            key=comment.weibo_id)
+                future.add_callback(self._on_success).add_errback(
+                    self._on_error)
+                if on_acked:
+                    future.add_callback(lambda metadata: on_acked())
+                if on_failed:
+                    future.add_errback(on_failed)
+        with self.lock:
+            self.sent_count += len(comments) * len(self.topics)
+
+    def get_metrics(self):
+        with self.lock:
+            return {
+                'sent': self.sent_count,
+                'acked': self.acked_count,
+                'failed': self.failed_count,
+            }
+
+    def close(self):
+        """等待缓冲区中的消息发送完毕后关闭"""
+        self.producer.flush()
+        self.producer.close()
+        logger.info(u'Kafka评论发送统计: %s', self.get_metrics())
+
+
+class KafkaCommentSink(CommentSink):
+    """将评论写入Kafka
+
+    写出只把消息放入生产者缓冲区，断点回调等之前发送的消息全部确认后才执行；
+    有消息发送失败时不再执行该输出的断点回调，下次爬取时重新爬取这些评论。
+    """
+
+    def __init__(self, producer, batch_size=500, flush_interval=5):
+        super().__init__(batch_size, flush_interval)
+        self.producer = producer
+        self.lock = threading.Lock()
+        self.run_lock = threading.Lock()  # 保证回调按登记顺序执行
+        self.epoch = 0  # 已登记的回调数，之后发送的消息属于下一个回调
+        self.unacked = {}  # {epoch: 未确认的消息数}
+        self.callbacks = deque()  # [(epoch, 回调)]
+        self.failed = False
+
+    def _write_batch(self, comments):
+        with self.lock:
+            epoch = self.epoch
+            self.unacked[epoch] = self.unacked.get(epoch, 0) + len(
+                comments) * len(self.producer.topics)
+        self.producer.send(comments, lambda: self._on_acked(epoch),
+                           self._on_failed)
+
+    def _on_acked(self, epoch):
+        with self.lock:
+            self.unacked[epoch] -= 1
+        self._run_callbacks()
+
+    def _on_failed(self, error):
+        with self.lock:
+            self.failed = True
+            dropped = len(self.callbacks)
+            self.callbacks.clear()
+        if dropped:
+            logger.warning(u'评论发送到Kafka失败，不记录%d个断点', dropped)
+
+    def after_flush(self, callback):
+        with self.lock:
+            if self.failed:
+                return
+            self.callbacks.append((self.epoch, callback))
+            self.epoch += 1
+        self._run_callbacks()
+
+    def _run_callbacks(self):
+        with self.run_lock:
+            while True:
+                with self.lock:
+                    if not self.callbacks or self.unacked.get(
+                            self.callbacks[0][0], 0):
+                        return
+                    epoch, callback = self.callbacks.popleft()
+                    self.unacked.pop(epoch, None)
+                callback()
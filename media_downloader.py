@@ -0,0 +1,292 @@
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .rate_limiter import RateLimitedSession, RateLimiter
+
+logger = logging.getLogger('spider.media_downloader')
+
+CHUNK_SIZE = 64 * 1024
+# 图片和视频服务器按域名限速，比weibo.cn页面宽松
+DEFAULT_MEDIA_RATE_LIMIT = {'host': {'rate': 5, 'burst': 20}}
+
+
+class MediaManifest:
+    """已下载文件清单，记录每个url对应的文件路径和内容的sha256"""
+
+    def __init__(self, db_path):
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS media (
+                    url TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    downloaded_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )""")
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS media_sha256 ON media (sha256)')
+
+    def get_path(self, url):
+        """返回url已下载到的文件路径，文件已不存在时返回None"""
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT path FROM media WHERE url = ?', (url, )).fetchone()
+        return row[0] if row and os.path.isfile(row[0]) else None
+
+    def get_path_by_hash(self, sha256):
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT path FROM media WHERE sha256 = ?',
+                (sha256, )).fetchall()
+        for (path, ) in rows:
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def add(self, url, path, sha256, size):
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO media (url, path, sha256, size) '
+                'VALUES (?, ?, ?, ?)', (url, path, sha256, size))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def _link(src, dst):
+    """用硬链接复用已下载的文件，不支持硬链接时复制"""
+    if os.path.abspath(src) == os.path.abspath(dst) or os.path.isfile(dst):
+        return
+    dst_dir = os.path.dirname(dst)
+    if dst_dir and not os.path.isdir(dst_dir):
+        os.makedirs(dst_dir, exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class MediaDownloadService:
+    """图片和视频下载服务
+
+    submit只登记下载任务，由固定数量的工作线程下载，爬取线程不再等待下载；
+    排队的任务超过max_queue时submit阻塞，避免任务无限堆积。
+    同一url只下载一次，内容相同的文件(如被多次转发的图片)只保存一份，
+    其他位置使用硬链接；未下载完的文件保存为.part，下次用Range请求续传。
+    每个媒体域名有独立的令牌桶，被限制(403/418/429)时降速。
+    所有用户共用一个下载服务。
+    """
+
+    def __init__(self,
+                 manifest_path,
+                 workers=4,
+                 file_download_timeout=(5, 5, 10),
+                 max_queue=1000,
+                 headers=None,
+                 rate_limit=None):
+        self.manifest = MediaManifest(manifest_path)
+        # file_download_timeout依次为重试次数、连接超时、读取超时
+        self.retries = file_download_timeout[0]
+        self.timeout = tuple(file_download_timeout[1:3])
+        self.session = RateLimitedSession(
+            RateLimiter(rate_limit or DEFAULT_MEDIA_RATE_LIMIT))
+        self.session.mount('http://', HTTPAdapter(pool_maxsize=workers))
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=workers))
+        self.session.headers.update(headers or {})
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='media')
+        self.slots = threading.BoundedSemaphore(max_queue)
+        self.lock = threading.Lock()
+        self.pending = {}  # {url: [文件路径]}，正在下载的url及需要保存到的位置
+        self.downloaded_count = 0
+        self.reused_count = 0
+        self.failed_count = 0
+
+    def submit(self, url, file_path):
+        """登记下载任务，url已下载过时直接链接到file_path"""
+        if os.path.isfile(file_path):
+            return
+        with self.lock:
+            if url in self.pending:
+                self.pending[url].append(file_path)
+                return
+            path = self.manifest.get_path(url)
+            if path is None:
+                self.pending[url] = [file_path]
+        if path:
+            _link(path, file_path)
+            self._count('reused_count')
+            return
+        self.slots.acquire()
+        self.executor.submit(self._download, url)
+
+    def _count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _download(self, url):
+        try:
+            file_path = self.pending[url][0]
+            sha256, size = self._download_file(url, file_path)
+            with self.lock:
+                existing = self.manifest.get_path_by_hash(sha256)
+                if existing and existing != file_path:
+                    # 内容已下载过，只保留一份
+                    os.remove(file_path)
+                    _link(existing, file_path)
+                    self.reused_count += 1
+                else:
+                    self.downloaded_count += 1
+                self.manifest.add(url, existing or file_path, sha256, size)
+                file_paths = self.pending.pop(url)
+            for other_path in file_paths[1:]:
+                _link(file_path, other_path)
+        except Exception as e:
+            with self.lock:
+                self.pending.pop(url, None)
+                self.failed_count += 1
+            logger.error(u'下载%s失败: %s', url, e)
+        finally:
+            self.slots.release()
+
+    def _download_file(self, url, file_path):
+        """下载到file_path.part，支持断点续传，返回(sha256, 文件大小)"""
+        file_dir = os.path.dirname(file_path)
+        if file_dir and not os.path.isdir(file_dir):
+            os.makedirs(file_dir, exist_ok=True)
+        part_path = file_path + '.part'
+        for attempt in range(self.retries + 1):
+            try:
+                self._fetch(url, part_path)
+                break
+            except requests.RequestException as e:
+                if attempt == self.retries:
+                    raise
+                logger.debug(u'下载%s中断，第%d次续传: %s', url, attempt + 1, e)
+        sha256 = hashlib.sha256()
+        with open(part_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                sha256.update(chunk)
+        size = os.path.getsize(part_path)
+        os.replace(part_path, file_path)
+        return sha256.hexdigest(), size
+
+    def _fetch(self, url, part_path):
+        offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        with self.session.get(url,
+                              headers=headers,
+                              timeout=self.timeout,
+                              stream=True) as response:
+            if offset and response.status_code == 416:
+                return  # .part已是完整文件
+            response.raise_for_status()
+            # 服务器不支持Range时返回200和完整内容，从头下载
+            mode = 'ab' if offset and response.status_code == 206 else 'wb'
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+
+    def get_metrics(self):
+        with self.lock:
+            return {
+                'downloaded': self.downloaded_count,
+                'reused': self.reused_count,
+                'failed': self.failed_count,
+                'pending': len(self.pending),
+                'rate_limit': self.session.rate_limiter.get_metrics(),
+            }
+
+    def close(self):
+        """等待全部下载完成"""
+        self.executor.shutdown(wait=True)
+        self.manifest.close()
+        logger.info(u'文件下载统计: %s', self.get_metrics())
+
+
+class MediaDownloader:
+    """将微博中的一类文件交给下载服务
+
+    文件名为"发布日期_微博id[_序号].后缀"，与原下载器一致。
+    """
+
+    key = ''  # 文件链接所在的Weibo属性
+    dir_name = ''
+    separator = ','
+    default_suffix = '.jpg'
+
+    def __init__(self, service, file_dir):
+        self.service = service
+        self.file_dir = os.path.join(file_dir, self.dir_name)
+
+    def get_suffix(self, url):
+        path = url.split('?')[0]
+        suffix = os.path.splitext(path)[1]
+        return suffix if 1 < len(suffix) <= 5 else self.default_suffix
+
+    def get_urls(self, weibo):
+        urls = getattr(weibo, self.key) or ''
+        if isinstance(urls, list):
+            return urls
+        if urls == u'无':
+            return []
+        return [url for url in urls.split(self.separator) if url]
+
+    def download_files(self, weibos):
+        for weibo in weibos:
+            urls = self.get_urls(weibo)
+            prefix = weibo.publish_time[:10].replace('-', '') + '_' + weibo.id
+            for i, url in enumerate(urls):
+                file_name = prefix
+                if len(urls) > 1:
+                    file_name += '_' + str(i + 1)
+                self.service.submit(
+                    url,
+                    os.path.join(self.file_dir,
+                                 file_name + self.get_suffix(url)))
+
+    def handle_download(self, urls):
+        """下载一组文件，以url中的文件名保存"""
+        for url in urls:
+            self.service.submit(
+                url,
+                os.path.join(self.file_dir,
+                             os.path.basename(url.split('?')[0])))
+
+
+class OriginPictureDownloader(MediaDownloader):
+    key = 'original_pictures'
+    dir_name = u'原创微博图片'
+
+
+class RetweetPictureDownloader(MediaDownloader):
+    key = 'retweet_pictures'
+    dir_name = u'转发微博图片'
+
+
+class VideoDownloader(MediaDownloader):
+    key = 'video_url'
+    separator = ';'
+    default_suffix = '.mp4'
+
+    def get_suffix(self, url):
+        return '.mp4'
+
+
+class AvatarPictureDownloader(MediaDownloader):
+    dir_name = u'头像图片'
@@ -0,0 +1,72 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('spider.page_cache')
+
+DEFAULT_PAGE_CACHE = {
+    'path': 'page_cache.db',
+    # 用户资料缓存秒数，0为不缓存；缓存的微博数、粉丝数等会过时，默认只缓存头像相册
+    'profile_ttl': 0,
+    'album_ttl': 7 * 24 * 3600,  # 头像相册缓存秒数
+}
+
+
+class PageCache:
+    """页面解析结果的磁盘缓存
+
+    以页面url为键保存解析结果(JSON)和获取时间，在有效期内不再请求该页面。
+    多个用户线程共用一个实例。
+    """
+
+    def __init__(self, db_path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS page_cache (
+                    url TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                )""")
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url, ttl):
+        """返回未过期的缓存值，没有缓存或已过期时返回None"""
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT value, fetched_at FROM page_cache WHERE url = ?',
+                (url, )).fetchone()
+            if row and time.time() - row[1] < ttl:
+                self.hits += 1
+                return json.loads(row[0])
+            self.misses += 1
+        return None
+
+    def set(self, url, value):
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO page_cache VALUES (?, ?, ?)',
+                (url, json.dumps(value, ensure_ascii=False), time.time()))
+
+    def get_or_fetch(self, url, ttl, fetch):
+        """有未过期的缓存时直接返回，否则调用fetch()获取并缓存"""
+        value = self.get(url, ttl)
+        if value is None:
+            value = fetch()
+            if value is not None:
+                self.set(url, value)
+        else:
+            logger.debug(u'使用缓存: %s', url)
+        return value
+
+    def get_metrics(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
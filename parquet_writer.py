@@ -0,0 +1,194 @@
+import logging
+import os
+import re
+import threading
+import uuid
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .comment import Comment
+from .comment_sink import CommentSink
+from .datetime_util import standardize_date
+from .user import User
+from .weibo import Weibo
+
+logger = logging.getLogger('spider.parquet_writer')
+
+DEFAULT_PARQUET_CONFIG = {
+    'compression': 'zstd',
+    'row_group_size': 10000,  # 每个分区攒够该行数写出一个row group
+    'commit_rows': 100000,  # 打开的文件累计写入该行数后关闭并提交，断点随之推进
+}
+
+_TYPES = {str: pa.string(), int: pa.int64(), bool: pa.bool_()}
+_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+def get_schema(record_type):
+    """根据记录类型的字段注解生成Arrow schema，图片链接等列表字段以逗号连接存为字符串"""
+    annotations = {}
+    for cls in reversed(record_type.__mro__):
+        annotations.update(getattr(cls, '__annotations__', {}))
+    return pa.schema([(field, _TYPES.get(annotations.get(field), pa.string()))
+                      for field in record_type.fields])
+
+
+def _get_date(publish_time):
+    """返回发布时间所在的日期，用作分区"""
+    try:
+        date = standardize_date(publish_time)[:10]
+    except ValueError:
+        return 'unknown'
+    return date if _DATE_RE.match(date) else 'unknown'
+
+
+class ParquetDataset:
+    """按(用户, 日期)分区的Parquet数据集
+
+    目录结构为root/user=<用户id>/date=<YYYY-MM-DD>/part-<uuid>.parquet，
+    每个分区缓冲到row_group_size行写出一个row group。写入中的文件以"."开头，
+    读取数据集时被忽略；打开的文件累计写入commit_rows行或close时统一关闭并
+    改为正式文件名，程序中断不会留下没有footer的不可读文件。
+    可在多个线程中同时写入。
+    """
+
+    def __init__(self,
+                 root_dir,
+                 record_type,
+                 compression='zstd',
+                 row_group_size=10000,
+                 commit_rows=100000):
+        self.root_dir = root_dir
+        self.record_type = record_type
+        self.schema = get_schema(record_type)
+        self.compression = compression
+        self.row_group_size = row_group_size
+        self.commit_rows = commit_rows
+        self.lock = threading.Lock()
+        self.commit_lock = threading.Lock()  # 保证提交回调按登记顺序执行
+        self.buffers = {}  # {(用户id, 日期): [行]}
+        self.writers = {}  # {(用户id, 日期): (pq.ParquetWriter, 写入中的文件路径)}
+        self.uncommitted_rows = 0
+        self.callbacks = []  # 当前写入的记录提交后执行的回调
+        self.row_count = 0
+
+    def write(self, records, user_id):
+        """写入一批记录，记录按发布时间分区"""
+        with self.lock:
+            for record in records:
+                partition = (user_id, _get_date(record.publish_time))
+                rows = self.buffers.setdefault(partition, [])
+                rows.append(record.to_row())
+                if len(rows) >= self.row_group_size:
+                    self._write_row_group(partition)
+            self.uncommitted_rows += len(records)
+            should_commit = self.uncommitted_rows >= self.commit_rows
+        if should_commit:
+            self.commit()
+
+    def after_commit(self, callback):
+        """已写入的记录全部提交(文件关闭并改名)后调用callback"""
+        with self.lock:
+            self.callbacks.append(callback)
+
+    def _write_row_group(self, partition):
+        rows = self.buffers.pop(partition, None)
+        if not rows:
+            return
+        columns = [list(column) for column in zip(*rows)]
+        for i, field in enumerate(self.schema):
+            if field.type == pa.string():
+                columns[i] = [
+                    ','.join(value) if isinstance(value, list) else
+                    (None if value is None else str(value))
+                    for value in columns[i]
+                ]
+        table = pa.Table.from_arrays(columns, schema=self.schema)
+        if partition not in self.writers:
+            user_id, date = partition
+            partition_dir = os.path.join(self.root_dir, f'user={user_id}',
+                                         f'date={date}')
+            if not os.path.isdir(partition_dir):
+                os.makedirs(partition_dir)
+            file_path = os.path.join(partition_dir,
+                                     f'.part-{uuid.uuid4().hex}.parquet')
+            # 各列默认使用字典编码，字典过大时pyarrow自动改为普通编码
+            self.writers[partition] = (pq.ParquetWriter(
+                file_path, self.schema,
+                compression=self.compression), file_path)
+        self.writers[partition][0].write_table(table)
+        self.row_count += len(rows)
+
+    def commit(self):
+        """写出全部缓冲，关闭文件并改为正式文件名，然后执行提交回调"""
+        with self.commit_lock:
+            with self.lock:
+                for partition in list(self.buffers):
+                    self._write_row_group(partition)
+                for writer, file_path in self.writers.values():
+                    writer.close()
+                    directory, name = os.path.split(file_path)
+                    os.replace(file_path, os.path.join(directory, name[1:]))
+                self.writers = {}
+                self.uncommitted_rows = 0
+                callbacks, self.callbacks = self.callbacks, []
+            for callback in callbacks:
+                callback()
+
+    def close(self):
+        self.commit()
+        logger.info(u'%s共写入%d条记录', self.root_dir, self.row_count)
+
+
+class ParquetWriter:
+    """将微博、用户信息和评论写入Parquet数据集
+
+    数据集位于dataset_dir下的weibo、user和comment目录，多个用户共用，
+    按用户和日期分区，可直接用pyarrow.dataset或Spark按hive分区读取。
+    """
+
+    def __init__(self, dataset_dir, user_id, parquet_config=None):
+        parquet_config = dict(DEFAULT_PARQUET_CONFIG, **(parquet_config or {}))
+        self.user_id = user_id
+        self.weibo_dataset = ParquetDataset(os.path.join(dataset_dir, 'weibo'),
+                                            Weibo, **parquet_config)
+        self.comment_dataset = ParquetDataset(
+            os.path.join(dataset_dir, 'comment'), Comment, **parquet_config)
+        self.user_dir = os.path.join(dataset_dir, 'user', f'user={user_id}')
+        self.compression = parquet_config['compression']
+
+    def write_weibo(self, weibos):
+        self.weibo_dataset.write(weibos, self.user_id)
+
+    def write_user(self, user):
+        """用户信息每个用户一行，覆盖上次写入的文件"""
+        if not os.path.isdir(self.user_dir):
+            os.makedirs(self.user_dir)
+        table = pa.Table.from_pylist([user.to_dict()], schema=get_schema(User))
+        pq.write_table(table,
+                       os.path.join(self.user_dir, 'user.parquet'),
+                       compression=self.compression)
+
+    def close(self):
+        self.weibo_dataset.close()
+        self.comment_dataset.close()
+
+
+class ParquetCommentSink(CommentSink):
+    """将评论写入Parquet数据集
+
+    写出时文件保持打开，评论按row_group_size合并成大的row group；
+    断点回调推迟到数据集提交文件后执行，断点记录之前的评论都已落盘。
+    """
+
+    def __init__(self, dataset, user_id, batch_size=500, flush_interval=5):
+        super().__init__(batch_size, flush_interval)
+        self.dataset = dataset
+        self.user_id = user_id
+
+    def _write_batch(self, comments):
+        self.dataset.write(comments, self.user_id)
+
+    def after_flush(self, callback):
+        self.dataset.after_commit(callback)
@@ -1,29 +1,15 @@
+"""单条微博评论爬虫
+
+用法: python -m weibo_spider.pinglun
+"""
 import requests
-from bs4 import XMLParsedAsHTMLWarning
-import warnings
-warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
-from bs4 import BeautifulSoup
+from .comment_parser import CommentPageParser, fetch_comment_page
 import csv
 import time
 import random
 from fake_useragent import UserAgent
 
 
-def get_total_pages(url, headers):
-    """获取评论总页数"""
-    try:
-        response = requests.get(url, headers=headers)
-        soup = BeautifulSoup(response.text, 'lxml')
-        pagination = soup.find('div', id='pagelist')
-        if pagination:
-            input_tag = pagination.find('input', {'name': 'mp'})
-            return int(input_tag['value']) if input_tag else 1
-        return 1
-    except Exception as e:
-        print(f"获取总页数失败: {str(e)}")
-        return 1
-
-
 def clean_header_value(value: str) -> str:
     """清理请求头中的非法字符"""
     return value.strip().replace('\ufeff', '').replace('\xa0', ' ')
@@ -31,6 +17,7 @@ def clean_header_value(value: str) -> str:
 
 def weibo_comment_spider():
     ua = UserAgent()
+    parser = CommentPageParser()
     base_url = 'https://weibo.cn/comment/PoUl5taJ0'
 
     # 动态请求头
@@ -51,8 +38,14 @@ def weibo_comment_spider():
         csv_writer = csv.writer(f)
         csv_writer.writerow(['用户ID', '昵称', '内容', '点赞数', '发布时间', '设备', 'IP属地'])
 
-        # 获取总页数
-        total_pages = get_total_pages(f"{base_url}?page=1&uid=2803301701", headers)
+        # 获取总页数，第1页的评论直接复用
+        try:
+            total_pages, first_comments = fetch_comment_page(
+                requests.get, f"{base_url}?page=1&uid=2803301701", parser,
+                headers=headers, timeout=15)
+        except Exception as e:
+            print(f"获取总页数失败: {str(e)}")
+            total_pages, first_comments = 1, None
         print(f"共发现 {total_pages} 页评论")
 
         for page in range(1, total_pages + 1):
@@ -60,47 +53,27 @@ def weibo_comment_spider():
             print(f"正在爬取第 {page}/{total_pages} 页")
 
             try:
-                # 随机代理和延时
-                proxy = random.choice(proxies)
-                response = requests.get(url,
-                                        headers=headers,
-                                        proxies=proxy,
-                                        timeout=15)
-                response.raise_for_status()
-
-                # 使用更健壮的解析方式
-                soup = BeautifulSoup(response.text, 'lxml')
-                comments = soup.find_all('div', class_='c', id=lambda x: x and x.startswith('C_'))
+                if page == 1 and first_comments is not None:
+                    comments = first_comments
+                else:
+                    # 随机代理和延时
+                    proxy = random.choice(proxies)
+                    comments = fetch_comment_page(requests.get,
+                                                  url,
+                                                  parser,
+                                                  headers=headers,
+                                                  proxies=proxy,
+                                                  timeout=15)[1]
 
                 if not comments:
                     print(f"第 {page} 页未找到评论，可能触发反爬！")
                     break
 
                 for comment in comments:
-                    try:
-                        # 用户信息
-                        user_link = comment.find('a', href=lambda x: x and '/u/' in x)
-                        user_id = user_link['href'].split('/')[-1] if user_link else 'N/A'
-                        screen_name = user_link.text if user_link else 'N/A'
-
-                        # 评论内容
-                        content = comment.find('span', class_='ctt').text.strip() if comment.find('span',
-                                                                                                  class_='ctt') else 'N/A'
-
-                        # 元数据解析
-                        info_text = comment.find('span', class_='ct').text if comment.find('span', class_='ct') else ''
-                        like_info = comment.find('a', string=lambda t: t and '赞[' in t)
-                        likes = like_info.text.replace('赞[', '').replace(']', '') if like_info else '0'
-
-                        # 分离时间和设备信息
-                        time_source = info_text.split('\xa0')[0] if info_text else 'N/A'
-                        device = info_text.split('来自')[-1].split('\xa0')[0] if '来自' in info_text else 'N/A'
-                        ip_location = info_text.split('\xa0')[-1] if len(info_text.split('\xa0')) > 1 else 'N/A'
-
-                        csv_writer.writerow([user_id, screen_name, content, likes, time_source, device, ip_location])
-                    except Exception as e:
-                        print(f"解析评论时出错: {str(e)}")
-                        continue
+                    csv_writer.writerow(
+                        comment.to_row(('user_id', 'screen_name', 'content',
+                                        'likes', 'publish_time', 'device',
+                                        'ip_location')))
 
                 # 动态延时（3-8秒随机）
                 sleep_time = random.uniform(3, 8)
@@ -0,0 +1,86 @@
+import logging
+import threading
+from queue import Queue
+
+logger = logging.getLogger('spider.pipeline')
+
+_STOP = object()
+
+
+class Stage:
+    """流水线中的一个阶段，由有界队列和若干工作线程组成"""
+
+    def __init__(self, name, handler, workers=1, queue_size=4):
+        self.name = name
+        self.handler = handler
+        self.queue = Queue(maxsize=queue_size)
+        self.threads = [
+            threading.Thread(target=self._run,
+                             name=f'{name}-{i}',
+                             daemon=True) for i in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, item):
+        """放入一批数据，队列满时阻塞，从而对上游形成反压"""
+        self.queue.put(item)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            try:
+                self.handler(item)
+            except Exception as e:
+                logger.exception(u'%s阶段处理出错: %s', self.name, e)
+
+    def close(self):
+        """处理完队列中剩余的数据后停止工作线程"""
+        for _ in self.threads:
+            self.queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+
+
+class WeiboPipeline:
+    """微博处理流水线
+
+    抓取线程获取的每批微博同时分发给写入、下载和评论三个阶段，
+    各阶段独立并发，慢的下载或评论爬取不会阻塞下一页微博的获取。
+    多个写入线程由爬虫的写入锁依次写入，多个评论线程各用一个评论解析器。
+    """
+
+    def __init__(self,
+                 spider,
+                 writer_workers=1,
+                 download_workers=2,
+                 comment_workers=1,
+                 queue_size=4):
+        self.stages = [
+            Stage('writer', spider.write_weibo_to_writers, writer_workers,
+                  queue_size)
+        ]
+        if spider.downloaders:
+            self.stages.append(
+                Stage('download', spider.download_weibo_files,
+                      download_workers, queue_size))
+        self.stages.append(
+            Stage('comment', spider.crawl_weibo_comments, comment_workers,
+                  queue_size))
+
+    def put(self, weibos):
+        for stage in self.stages:
+            stage.put(weibos)
+
+    def close(self):
+        """等待所有阶段处理完毕"""
+        for stage in self.stages:
+            stage.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -2,319 +2,395 @@ import requests
 import time
 import random
 import logging
-from concurrent.futures import ThreadPoolExecutor
-from queue import Queue
+from concurrent.futures import ThreadPoolExecutor, wait
 import threading
 import re
-from bs4 import BeautifulSoup
+from lxml import etree
+
+logger = logging.getLogger('spider.proxy_pool')
+
+DEFAULT_PROXY_POOL = {
+    'local_proxies': [
+        'http://127.0.0.1:7890',  # Clash默认端口
+        'http://127.0.0.1:1080',  # V2Ray默认端口
+        'http://127.0.0.1:8080',  # 其他代理软件
+    ],
+    'sources': [],  # 代理源，PROXY_SOURCES中的名称、网址或ProxySource参数dict
+    'source_deadline': 10,  # 获取全部代理源的最长时间（秒）
+    'test_urls': ['https://weibo.cn', 'https://weibo.com'],
+    'max_proxies': 3,  # 最大代理数量
+    'update_interval': 60,  # 更新间隔（秒）
+    'probe_interval': 10,  # 检查隔离代理的间隔（秒）
+    'test_timeout': 5,  # 测试超时时间（秒）
+    'test_workers': 16,  # 并发测试的线程数
+    'max_retries': 2,  # 最大重试次数
+    'max_failures': 3,  # 连续失败该次数后隔离
+    'min_success_rate': 0.5,  # 成功率低于该值时隔离
+    'quarantine_seconds': 60,  # 首次隔离时间，再次隔离时翻倍
+    'max_quarantine_seconds': 1800,
+}
+
+
+# 代理源注册表，新增代理源只需添加一项或在配置的sources中写明参数
+PROXY_SOURCES = {
+    '89ip': {'url': 'https://www.89ip.cn/index_1.html'},
+    '66ip': {'url': 'http://www.66ip.cn/1.html'},
+    'kuaidaili': {'url': 'https://www.kuaidaili.com/free/inha/1/'},
+    'ip3366': {'url': 'http://www.ip3366.net/free/?stype=1'},
+    'seofangfa': {'url': 'https://proxy.seofangfa.com/'},
+    '7yip': {'url': 'https://www.7yip.cn/free/'},
+    'data5u': {'url': 'http://www.data5u.com/'},
+    'zdaye': {'url': 'https://www.zdaye.com/free/'},
+    'iphai': {'url': 'http://www.iphai.com/free/ng'},
+    'xiladaili': {'url': 'http://www.xiladaili.com/gaoni/'},
+}
+_ROW_XPATH = '//tr[count(td) >= 2]'  # 表格中每行的前两列为IP和端口
+_IP_PORT_PATTERN = r'(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\D{1,20}?(\d{2,5})\b'
+_IP_PATTERN = re.compile(r'^\d{1,3}(\.\d{1,3}){3}$')
+_SOURCE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Cache-Control': 'no-cache',
+    'Pragma': 'no-cache'
+}
+
+
+class ProxySource:
+    """代理源，从页面的表格行(xpath)或正则匹配中提取代理"""
+
+    def __init__(self, url, xpath=_ROW_XPATH, regex=False, scheme='http'):
+        self.url = url
+        self.scheme = scheme
+        self.xpath = None if regex else etree.XPath(xpath)
+        # regex为True时使用默认的IP:端口正则，也可以传入含IP和端口两个分组的正则
+        self.regex = re.compile(
+            _IP_PORT_PATTERN if regex is True else regex) if regex else None
+
+    @classmethod
+    def from_config(cls, source):
+        """根据注册表名称、网址或参数dict创建代理源"""
+        if isinstance(source, dict):
+            return cls(**source)
+        if source in PROXY_SOURCES:
+            return cls(**PROXY_SOURCES[source])
+        return cls(source, regex=True)
+
+    def extract(self, html):
+        """提取页面中的代理，返回代理网址列表"""
+        if self.regex:
+            if isinstance(html, bytes):
+                html = html.decode('utf-8', 'ignore')
+            pairs = self.regex.findall(html)
+        else:
+            root = etree.fromstring(html, etree.HTMLParser())
+            pairs = []
+            if root is not None:
+                for row in self.xpath(root):
+                    cells = row.findall('td')
+                    pairs.append((''.join(cells[0].itertext()).strip(),
+                                  ''.join(cells[1].itertext()).strip()))
+        return [
+            f'{self.scheme}://{ip}:{port}' for ip, port in pairs
+            if _IP_PATTERN.match(ip) and port.isdigit()
+        ]
+
+    def __str__(self):
+        return self.url
+
+
+class ProxyStats:
+    """单个代理的健康状态，延迟和成功率均为指数加权移动平均(EWMA)"""
+
+    def __init__(self, proxy, latency, alpha=0.3):
+        self.proxy = proxy
+        self.alpha = alpha
+        self.latency = latency
+        self.success_rate = 1.0
+        self.requests = 0
+        self.consecutive_failures = 0
+        self.quarantine_count = 0
+        self.quarantined_until = 0
+
+    @property
+    def score(self):
+        """得分越高被选中的概率越大：成功率高、延迟低的代理优先"""
+        return self.success_rate / max(self.latency, 0.05)
+
+    def is_quarantined(self, now):
+        return self.quarantined_until > now
+
+    def update(self, success, latency=None):
+        self.requests += 1
+        self.success_rate += self.alpha * (float(success) - self.success_rate)
+        if latency is not None:
+            self.latency += self.alpha * (latency - self.latency)
+        self.consecutive_failures = 0 if success else self.consecutive_failures + 1
+
+    def get_metrics(self):
+        return {
+            'latency': round(self.latency, 3),
+            'success_rate': round(self.success_rate, 3),
+            'score': round(self.score, 3),
+            'requests': self.requests,
+            'quarantined': self.quarantined_until > time.monotonic(),
+        }
+
 
 class ProxyPool:
-    def __init__(self):
-        self.proxy_queue = Queue()
-        self.valid_proxies = set()
+    """代理池
+
+    候选代理并发测试后入池，每次请求的结果更新代理的延迟和成功率，
+    按得分加权随机选择代理。连续失败或成功率过低的代理被隔离，
+    隔离期满后由维护线程重新测试，通过后恢复使用。
+    无代理(直连)始终在池中，作为所有代理不可用时的兜底。
+    """
+
+    def __init__(self, config=None):
+        """创建代理池，不发送请求也不启动线程，调用start后才开始维护"""
+        config = dict(DEFAULT_PROXY_POOL, **(config or {}))
+        self.proxies = {}  # {代理: ProxyStats}
         self.lock = threading.Lock()
-        self.logger = logging.getLogger('spider')
-        
-        # 本地代理配置
-        self.local_proxies = [
-            'http://127.0.0.1:7890',  # Clash默认端口
-            'http://127.0.0.1:1080',  # V2Ray默认端口
-            'http://127.0.0.1:8080'   # 其他代理软件
-        ]
-        
-        self.test_urls = [
-            'https://weibo.cn',
-            'https://weibo.com'
+
+        self.local_proxies = config['local_proxies']  # 本地代理
+        self.proxy_sources = [
+            ProxySource.from_config(source) for source in config['sources']
         ]
-        
-        # 代理池配置
-        self.min_proxies = 1  # 降低最小代理数量
-        self.max_proxies = 3  # 降低最大代理数量
-        self.update_interval = 60  # 更新间隔（秒）
-        self.test_timeout = 10  # 测试超时时间（秒）
-        self.max_retries = 2  # 最大重试次数
+        self.source_deadline = config['source_deadline']
+        self.test_urls = config['test_urls']
+        self.max_proxies = config['max_proxies']
+        self.update_interval = config['update_interval']
+        self.probe_interval = config['probe_interval']
+        self.test_timeout = config['test_timeout']
+        self.test_workers = config['test_workers']
+        self.max_retries = config['max_retries']
+        self.max_failures = config['max_failures']
+        self.min_success_rate = config['min_success_rate']
+        self.quarantine_seconds = config['quarantine_seconds']
+        self.max_quarantine_seconds = config['max_quarantine_seconds']
         self.last_update = 0
-        
-        # 初始化时添加本地代理
+        self.maintain_thread = None
+
+        # 直连始终可用
         self._add_local_proxies()
-        
-        # 启动代理池维护线程
-        self.maintain_thread = threading.Thread(target=self._maintain_proxy_pool, daemon=True)
-        self.maintain_thread.start()
-        
-        # 立即进行一次代理池更新
+
+    def start(self):
+        """测试候选代理并启动维护线程，没有候选代理时不启动"""
+        if not (self.local_proxies or self.proxy_sources):
+            return self
         self._update_proxy_pool()
-        
-        # 打印代理池状态
-        self.print_status()
+        self.maintain_thread = threading.Thread(target=self._maintain_proxy_pool,
+                                                name='proxy-pool',
+                                                daemon=True)
+        self.maintain_thread.start()
+        self.log_status()
+        return self
+
+    @property
+    def valid_proxies(self):
+        """当前未被隔离的代理列表，直连为None"""
+        now = time.monotonic()
+        with self.lock:
+            return [
+                proxy for proxy, stats in self.proxies.items()
+                if not stats.is_quarantined(now)
+            ]
 
-    def print_status(self):
-        """打印代理池状态"""
+    def log_status(self):
+        """记录代理池状态"""
         with self.lock:
-            print("\n=== 代理池状态 ===")
-            print(f"当前有效代理数量: {len(self.valid_proxies)}")
-            print(f"代理队列大小: {self.proxy_queue.qsize()}")
-            print("\n当前可用代理列表:")
-            for proxy in self.valid_proxies:
-                print(f"- {proxy}")
-            print("\n代理源列表:")
-            for source in self.local_proxies:
-                print(f"- {source}")
-            print("\n测试URL列表:")
-            for url in self.test_urls:
-                print(f"- {url}")
-            print("\n代理池配置:")
-            print(f"- 最小代理数量: {self.min_proxies}")
-            print(f"- 最大代理数量: {self.max_proxies}")
-            print(f"- 更新间隔: {self.update_interval}秒")
-            print(f"- 测试超时: {self.test_timeout}秒")
-            print(f"- 最大重试次数: {self.max_retries}")
-            print("================\n")
+            proxies = [proxy or '直连' for proxy in self.proxies]
+        logger.info(f"代理池可用代理: {proxies}，候选代理源: "
+                    f"{self.local_proxies + [str(source) for source in self.proxy_sources]}")
 
     def _add_local_proxies(self):
-        """添加本地代理到代理池"""
-        # 直接使用无代理模式
-        self.valid_proxies.add(None)
-        self.proxy_queue.put(None)
-        self.logger.info("使用无代理模式")
+        """添加直连到代理池，本地代理需测试通过后才加入"""
+        with self.lock:
+            if None not in self.proxies:
+                self.proxies[None] = ProxyStats(None, self.test_timeout)
+        logger.info("使用无代理模式")
 
-    def _fetch_proxies_from_source(self, source_url):
+    def _fetch_proxies_from_source(self, source, timeout):
         """从代理源获取代理"""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-                'Connection': 'keep-alive',
-                'Cache-Control': 'no-cache',
-                'Pragma': 'no-cache'
-            }
-            response = requests.get(source_url, headers=headers, timeout=10)
+            response = requests.get(source.url, headers=_SOURCE_HEADERS, timeout=timeout)
             if response.status_code == 200:
-                # 使用BeautifulSoup解析HTML
-                soup = BeautifulSoup(response.text, 'lxml')
-                
-                # 根据不同代理源使用不同的解析方法
-                if '89ip.cn' in source_url:
-                    return self._parse_89ip(soup)
-                elif '66ip.cn' in source_url:
-                    return self._parse_66ip(soup)
-                elif 'kuaidaili.com' in source_url:
-                    return self._parse_kuaidaili(soup)
-                elif 'ip3366.net' in source_url:
-                    return self._parse_ip3366(soup)
-                elif 'seofangfa.com' in source_url:
-                    return self._parse_seofangfa(soup)
-                elif '7yip.cn' in source_url:
-                    return self._parse_7yip(soup)
-                elif 'data5u.com' in source_url:
-                    return self._parse_data5u(soup)
-                elif 'zdaye.com' in source_url:
-                    return self._parse_zdaye(soup)
-                elif 'iphai.com' in source_url:
-                    return self._parse_iphai(soup)
-                elif 'xiladaili.com' in source_url:
-                    return self._parse_xiladaili(soup)
-                else:
-                    # 默认使用正则表达式提取
-                    ip_port_pattern = r'(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}):(\d+)'
-                    proxies = re.findall(ip_port_pattern, response.text)
-                    return [f'http://{ip}:{port}' for ip, port in proxies]
+                proxies = source.extract(response.content)
+                logger.debug(f"从 {source} 获取到 {len(proxies)} 个代理")
+                return proxies
+            logger.warning(f"从 {source} 获取代理失败，状态码: {response.status_code}")
         except Exception as e:
-            self.logger.error(f"从 {source_url} 获取代理失败: {str(e)}")
+            logger.error(f"从 {source} 获取代理失败: {str(e)}")
         return []
 
-    def _parse_89ip(self, soup):
-        """解析89代理"""
-        proxies = []
-        for tr in soup.find_all('tr')[1:]:
-            tds = tr.find_all('td')
-            if len(tds) >= 2:
-                ip = tds[0].text.strip()
-                port = tds[1].text.strip()
-                proxies.append(f'http://{ip}:{port}')
-        return proxies
-
-    def _parse_66ip(self, soup):
-        """解析66代理"""
-        proxies = []
-        for tr in soup.find_all('tr')[1:]:
-            tds = tr.find_all('td')
-            if len(tds) >= 2:
-                ip = tds[0].text.strip()
-                port = tds[1].text.strip()
-                proxies.append(f'http://{ip}:{port}')
-        return proxies
-
-    def _parse_kuaidaili(self, soup):
-        """解析快代理"""
-        proxies = []
-        for tr in soup.find_all('tr')[1:]:
-            tds = tr.find_all('td')
-            if len(tds) >= 2:
-                ip = tds[0].text.strip()
-                port = tds[1].text.strip()
-                proxies.append(f'http://{ip}:{port}')
-        return proxies
-
-    def _parse_ip3366(self, soup):
-        """解析云代理"""
-        proxies = []
-        for tr in soup.find_all('tr')[1:]:
-            tds = tr.find_all('td')
-            if len(tds) >= 2:
-                ip = tds[0].text.strip()
-                port = tds[1].text.strip()
-                proxies.append(f'http://{ip}:{port}')
-        return proxies
-
-    def _parse_seofangfa(self, soup):
-        """解析小幻代理"""
-        proxies = []
-        for tr in soup.find_all('tr')[1:]:
-            tds = tr.find_all('td')
-            if len(tds) >= 2:
-                ip = tds[0].text.strip()
-                port = tds[1].text.strip()
-                proxies.append(f'http://{ip}:{port}')
-        return proxies
-
-    def _parse_7yip(self, soup):
-        """解析齐云代理"""
-        proxies = []
-        for tr in soup.find_all('tr')[1:]:
-            tds = tr.find_all('td')
-            if len(tds) >= 2:
-                ip = tds[0].text.strip()
-                port = tds[1].text.strip()
-                proxies.append(f'http://{ip}:{port}')
-        return proxies
-
-    def _parse_data5u(self, soup):
-        """解析无忧代理"""
-        proxies = []
-        for tr in soup.find_all('tr')[1:]:
-            tds = tr.find_all('td')
-            if len(tds) >= 2:
-                ip = tds[0].text.strip()
-                port = tds[1].text.strip()
-                proxies.append(f'http://{ip}:{port}')
-        return proxies
-
-    def _parse_zdaye(self, soup):
-        """解析站大爷"""
-        proxies = []
-        for tr in soup.find_all('tr')[1:]:
-            tds = tr.find_all('td')
-            if len(tds) >= 2:
-                ip = tds[0].text.strip()
-                port = tds[1].text.strip()
-                proxies.append(f'http://{ip}:{port}')
-        return proxies
-
-    def _parse_iphai(self, soup):
-        """解析IP海"""
-        proxies = []
-        for tr in soup.find_all('tr')[1:]:
-            tds = tr.find_all('td')
-            if len(tds) >= 2:
-                ip = tds[0].text.strip()
-                port = tds[1].text.strip()
-                proxies.append(f'http://{ip}:{port}')
-        return proxies
-
-    def _parse_xiladaili(self, soup):
-        """解析西拉代理"""
-        proxies = []
-        for tr in soup.find_all('tr')[1:]:
-            tds = tr.find_all('td')
-            if len(tds) >= 2:
-                ip = tds[0].text.strip()
-                port = tds[1].text.strip()
-                proxies.append(f'http://{ip}:{port}')
-        return proxies
+    def _fetch_all_sources(self):
+        """并发获取全部代理源，超过source_deadline仍未返回的代理源本次忽略"""
+        if not self.proxy_sources:
+            return []
+        executor = ThreadPoolExecutor(max_workers=len(self.proxy_sources),
+                                      thread_name_prefix='proxy-source')
+        futures = [
+            executor.submit(self._fetch_proxies_from_source, source,
+                            self.source_deadline)
+            for source in self.proxy_sources
+        ]
+        done, not_done = wait(futures, timeout=self.source_deadline)
+        executor.shutdown(wait=False, cancel_futures=True)
+        if not_done:
+            logger.warning(f"{len(not_done)} 个代理源超时，本次忽略")
+        return [proxy for future in done for proxy in future.result()]
 
     def _test_proxy(self, proxy):
-        """测试代理是否可用"""
+        """测试代理是否可用，返回访问微博的耗时，不可用时返回None"""
+        proxies = {
+            'http': proxy,
+            'https': proxy
+        }
         for _ in range(self.max_retries):
             try:
-                proxies = {
-                    'http': proxy,
-                    'https': proxy
-                }
                 test_url = random.choice(self.test_urls)
-                print(f"测试代理 {proxy} 访问 {test_url}")
+                start = time.monotonic()
                 response = requests.get(test_url, proxies=proxies, timeout=self.test_timeout)
                 if response.status_code == 200:
-                    # 额外检查是否能够访问微博
-                    if 'weibo' in test_url:
-                        print(f"代理 {proxy} 测试成功")
-                        return True
-                    # 如果不是微博域名，再测试一次微博
-                    test_weibo = requests.get('https://weibo.cn', proxies=proxies, timeout=self.test_timeout)
-                    if test_weibo.status_code == 200:
-                        print(f"代理 {proxy} 测试成功")
-                        return True
+                    latency = time.monotonic() - start
+                    logger.debug(f"代理 {proxy} 测试成功，耗时 {latency:.2f} 秒")
+                    return latency
             except Exception as e:
-                print(f"代理 {proxy} 测试失败: {str(e)}")
-                continue
-        return False
+                logger.debug(f"代理 {proxy} 测试失败: {str(e)}")
+        return None
+
+    def check_proxies(self, proxies):
+        """并发测试代理，返回{代理: 耗时}，只包含测试通过的代理"""
+        proxies = list(proxies)
+        if not proxies:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.test_workers, len(proxies)),
+                                thread_name_prefix='proxy-test') as executor:
+            latencies = executor.map(self._test_proxy, proxies)
+            return {
+                proxy: latency
+                for proxy, latency in zip(proxies, latencies)
+                if latency is not None
+            }
+
+    def _get_candidates(self):
+        """获取不在池中的候选代理"""
+        candidates = list(self.local_proxies) + self._fetch_all_sources()
+        with self.lock:
+            return [proxy for proxy in dict.fromkeys(candidates) if proxy not in self.proxies]
 
     def _update_proxy_pool(self):
-        """更新代理池，优先使用本地代理"""
+        """可用代理不足时测试候选代理并补充到代理池"""
         current_time = time.time()
         if current_time - self.last_update < self.update_interval:
             return
-        
         self.last_update = current_time
-        print("\n开始更新代理池...")
-        
-        # 清空现有代理
-        self.valid_proxies.clear()
-        while not self.proxy_queue.empty():
-            self.proxy_queue.get()
-        
-        # 添加本地代理
-        self._add_local_proxies()
-        
-        # 如果本地代理都不可用，则不使用代理
-        if not self.valid_proxies:
-            print("所有本地代理都不可用，将不使用代理")
-            self.valid_proxies.add(None)
-            self.proxy_queue.put(None)
-        
-        self.print_status()
+
+        available = len([proxy for proxy in self.valid_proxies if proxy])
+        if available >= self.max_proxies:
+            return
+        logger.info("开始更新代理池...")
+        checked = self.check_proxies(self._get_candidates())
+        best = sorted(checked.items(), key=lambda item: item[1])
+        with self.lock:
+            for proxy, latency in best[:self.max_proxies - available]:
+                self.proxies[proxy] = ProxyStats(proxy, latency)
+                logger.info(f"代理 {proxy} 加入代理池，耗时 {latency:.2f} 秒")
+
+    def _reprobe_quarantined(self):
+        """重新测试隔离期满的代理，通过后恢复，失败则延长隔离"""
+        now = time.monotonic()
+        with self.lock:
+            expired = [
+                proxy for proxy, stats in self.proxies.items()
+                if stats.quarantined_until and not stats.is_quarantined(now)
+            ]
+        checked = self.check_proxies(expired)
+        with self.lock:
+            for proxy in expired:
+                stats = self.proxies.get(proxy)
+                if stats is None:
+                    continue
+                if proxy in checked:
+                    stats.quarantined_until = 0
+                    stats.consecutive_failures = 0
+                    stats.success_rate = self.min_success_rate
+                    stats.latency = checked[proxy]
+                    logger.info(f"代理 {proxy} 重新测试通过，恢复使用")
+                else:
+                    self._quarantine(stats)
 
     def _maintain_proxy_pool(self):
         """维护代理池的线程函数"""
         while True:
             try:
-                # 如果代理数量小于最小值，立即更新
-                if len(self.valid_proxies) < self.min_proxies:
-                    self._update_proxy_pool()
-                else:
-                    # 否则按正常间隔更新
-                    time.sleep(self.update_interval)
-                    self._update_proxy_pool()
+                time.sleep(self.probe_interval)
+                self._reprobe_quarantined()
+                self._update_proxy_pool()
             except Exception as e:
-                self.logger.error(f"维护代理池时出错: {str(e)}")
+                logger.error(f"维护代理池时出错: {str(e)}")
                 time.sleep(60)
 
+    def _quarantine(self, stats):
+        """隔离代理，多次隔离时隔离时间翻倍"""
+        seconds = min(self.max_quarantine_seconds,
+                      self.quarantine_seconds * 2**stats.quarantine_count)
+        stats.quarantine_count += 1
+        stats.quarantined_until = time.monotonic() + seconds
+        logger.warning(f"隔离代理 {stats.proxy}，{seconds} 秒后重新测试")
+
+    def select(self):
+        """按得分加权随机选择一个代理，直连返回None"""
+        now = time.monotonic()
+        with self.lock:
+            candidates = [
+                stats for stats in self.proxies.values()
+                if not stats.is_quarantined(now)
+            ]
+            if not candidates:
+                return None
+            return random.choices(candidates,
+                                  weights=[stats.score for stats in candidates])[0].proxy
+
     def get_proxy(self):
         """获取一个代理"""
-        try:
-            proxy = self.proxy_queue.get(timeout=1)
-            self.proxy_queue.put(proxy)  # 放回队列
-            return {'http': proxy, 'https': proxy}
-        except:
+        proxy = self.select()
+        if proxy is None:
             return None
+        return {'http': proxy, 'https': proxy}
+
+    def get_quarantine(self, proxy):
+        """返回代理剩余的隔离秒数"""
+        with self.lock:
+            stats = self.proxies.get(proxy)
+            if stats is None:
+                return 0.0
+            return max(0.0, stats.quarantined_until - time.monotonic())
+
+    def report(self, proxy, success, latency=None):
+        """反馈一次请求的结果，更新代理的延迟和成功率"""
+        with self.lock:
+            stats = self.proxies.get(proxy)
+            if stats is None:
+                return
+            stats.update(success, latency)
+            # 直连作为兜底不隔离
+            if proxy and not stats.is_quarantined(time.monotonic()) and (
+                    stats.consecutive_failures >= self.max_failures
+                    or stats.success_rate < self.min_success_rate):
+                self._quarantine(stats)
+
+    def get_metrics(self):
+        """返回各代理的延迟、成功率、得分和隔离状态"""
+        with self.lock:
+            return {
+                proxy or '直连': stats.get_metrics()
+                for proxy, stats in self.proxies.items()
+            }
 
     def remove_proxy(self, proxy):
         """移除无效代理"""
         with self.lock:
-            if proxy in self.valid_proxies:
-                self.valid_proxies.remove(proxy)
-                self.logger.info(f"移除无效代理: {proxy}")
-
-# 创建全局代理池实例
-proxy_pool = ProxyPool() 
\ No newline at end of file
+            if proxy in self.proxies:
+                del self.proxies[proxy]
+                logger.info(f"移除无效代理: {proxy}")
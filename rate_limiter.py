@@ -0,0 +1,208 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from time import sleep
+from urllib.parse import urlparse
+
+import requests
+
+logger = logging.getLogger('spider.rate_limiter')
+
+DEFAULT_RATE_LIMIT = {
+    'host': {'rate': 0.5, 'burst': 10},  # 每个域名每秒请求数和突发请求数
+    'cookie': {'rate': 0.2, 'burst': 5},  # 每个cookie
+    'proxy': {'rate': 0.5, 'burst': 5},  # 每个代理
+    'backoff_factor': 2,  # 被限制(403/418/429/空页面)时速率除以该值
+    'recover_factor': 1.05,  # 每次请求成功后速率乘以该值，直到恢复配置值
+    'min_rate': 0.01,  # 退避后的最低速率
+}
+BLOCKED_STATUS_CODES = (403, 418, 429)
+
+
+class TokenBucket:
+    """令牌桶，rate为每秒补充的令牌数，burst为桶容量"""
+
+    def __init__(self, rate, burst):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last_time = time.monotonic()
+        self.requests = 0
+        self.blocked = 0
+        self.wait_seconds = 0.0
+
+    def _refill(self, now):
+        # now可能在令牌桶创建之前取得，不能倒退
+        if now > self.last_time:
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.last_time) * self.rate)
+            self.last_time = now
+
+    def get_wait(self, now):
+        """不取令牌，返回现在取一个令牌需要等待的秒数"""
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def reserve(self, now):
+        """预约一个令牌，返回需要等待的秒数，令牌可以透支"""
+        self._refill(now)
+        self.tokens -= 1
+        self.requests += 1
+        wait = max(0.0, -self.tokens / self.rate)
+        self.wait_seconds += wait
+        return wait
+
+    def slow_down(self, factor, min_rate):
+        self.rate = max(min_rate, self.rate / factor)
+        self.blocked += 1
+
+    def speed_up(self, factor):
+        self.rate = min(self.base_rate, self.rate * factor)
+
+    def get_metrics(self):
+        return {
+            'rate': round(self.rate, 4),
+            'base_rate': self.base_rate,
+            'tokens': round(self.tokens, 2),
+            'requests': self.requests,
+            'blocked': self.blocked,
+            'wait_seconds': round(self.wait_seconds, 2),
+        }
+
+
+class RateLimiter:
+    """统一限速服务
+
+    每个请求同时占用域名、cookie和代理三个令牌桶的令牌，等待时间取其中最长者。
+    请求被限制时相关令牌桶降速，之后每次成功请求逐步恢复。
+    """
+
+    def __init__(self, config=None):
+        config = dict(DEFAULT_RATE_LIMIT, **(config or {}))
+        for kind in ['host', 'cookie', 'proxy']:
+            config[kind] = dict(DEFAULT_RATE_LIMIT[kind], **config[kind])
+        self.config = config
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _cookie_key(cookie):
+        # 指标中不暴露cookie内容
+        return hashlib.sha1(cookie.encode('utf-8')).hexdigest()[:8]
+
+    def _get_buckets(self, url, cookie=None, proxy=None):
+        keys = [('host', urlparse(url).netloc)]
+        if cookie:
+            keys.append(('cookie', self._cookie_key(cookie)))
+        if proxy:
+            keys.append(('proxy', proxy))
+        buckets = []
+        for key in keys:
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(self.config[key[0]]['rate'],
+                                                self.config[key[0]]['burst'])
+            buckets.append(self.buckets[key])
+        return buckets
+
+    def get_wait(self, url, cookie=None, proxy=None):
+        """不取令牌，返回现在发送请求需要等待的秒数"""
+        now = time.monotonic()
+        with self.lock:
+            return max(
+                bucket.get_wait(now)
+                for bucket in self._get_buckets(url, cookie, proxy))
+
+    def reserve(self, url, cookie=None, proxy=None):
+        """预约一次请求，返回需要等待的秒数"""
+        now = time.monotonic()
+        with self.lock:
+            return max(
+                bucket.reserve(now)
+                for bucket in self._get_buckets(url, cookie, proxy))
+
+    def acquire(self, url, cookie=None, proxy=None):
+        """等待直到可以发送请求"""
+        wait = self.reserve(url, cookie, proxy)
+        if wait > 0:
+            logger.debug(u'限速等待 %.2f 秒: %s', wait, url)
+            sleep(wait)
+
+    def report(self, url, cookie=None, proxy=None, blocked=False):
+        """反馈请求结果，被限制时降速，成功时逐步恢复速率"""
+        with self.lock:
+            for bucket in self._get_buckets(url, cookie, proxy):
+                if blocked:
+                    bucket.slow_down(self.config['backoff_factor'],
+                                     self.config['min_rate'])
+                else:
+                    bucket.speed_up(self.config['recover_factor'])
+        if blocked:
+            logger.warning(u'请求被限制，降低请求速率: %s', url)
+
+    def get_metrics(self):
+        """返回各令牌桶的当前速率、请求数、被限制次数和累计等待时间"""
+        with self.lock:
+            return {
+                f'{kind}:{key}': bucket.get_metrics()
+                for (kind, key), bucket in self.buckets.items()
+            }
+
+    def log_metrics(self):
+        logger.info(u'限速指标: %s',
+                    json.dumps(self.get_metrics(), ensure_ascii=False))
+
+
+class RateLimitedSession(requests.Session):
+    """所有请求都经过RateLimiter的会话
+
+    配置了代理池且rotate_proxy为True时，每个请求从代理池选择代理；
+    请求结果都会反馈给代理池用于评分。
+    """
+
+    def __init__(self,
+                 rate_limiter,
+                 cookie=None,
+                 proxy_pool=None,
+                 rotate_proxy=True):
+        super().__init__()
+        self.rate_limiter = rate_limiter
+        self.cookie = cookie
+        self.proxy_pool = proxy_pool
+        self.rotate_proxy = rotate_proxy
+        self.last_proxy = None
+
+    def _get_proxy(self, proxies=None):
+        proxies = proxies or self.proxies
+        if proxies:
+            return proxies.get('https') or proxies.get('http')
+
+    def request(self, method, url, reserved=False, **kwargs):
+        """发送请求，reserved为True表示调用方已预约过令牌"""
+        if self.proxy_pool and self.rotate_proxy and not kwargs.get('proxies'):
+            kwargs['proxies'] = self.proxy_pool.get_proxy()
+        proxy = self.last_proxy = self._get_proxy(kwargs.get('proxies'))
+        if not reserved:
+            self.rate_limiter.acquire(url, self.cookie, proxy)
+        start = time.monotonic()
+        try:
+            response = super().request(method, url, **kwargs)
+        except requests.RequestException:
+            if self.proxy_pool:
+                self.proxy_pool.report(proxy, False)
+            raise
+        blocked = response.status_code in BLOCKED_STATUS_CODES
+        self.rate_limiter.report(url, self.cookie, proxy, blocked=blocked)
+        if self.proxy_pool:
+            self.proxy_pool.report(proxy, not blocked,
+                                   time.monotonic() - start)
+        return response
+
+    def report_blocked(self, url):
+        """反馈页面内容被限制(如评论页为空)"""
+        self.rate_limiter.report(url, self.cookie, self.last_proxy,
+                                 blocked=True)
+        if self.proxy_pool:
+            self.proxy_pool.report(self.last_proxy, False)
@@ -0,0 +1,43 @@
+from functools import lru_cache
+from operator import attrgetter
+
+
+@lru_cache(maxsize=None)
+def _get_getter(fields):
+    return attrgetter(*fields)
+
+
+class Record:
+    """数据记录基类
+
+    子类用__slots__声明全部属性，实例不带__dict__，大批量记录占用内存更少；
+    fields为输出的字段及顺序，所有输出共用to_row和to_dict序列化。
+    """
+
+    __slots__ = ()
+    fields = ()
+
+    def to_row(self, fields=None):
+        """按字段顺序返回字段值列表，fields为None时输出全部字段"""
+        fields = tuple(fields) if fields else self.fields
+        if len(fields) == 1:
+            return [getattr(self, fields[0])]
+        return list(_get_getter(fields)(self))
+
+    def to_dict(self, fields=None):
+        """返回{字段: 值}字典"""
+        fields = tuple(fields) if fields else self.fields
+        return dict(zip(fields, self.to_row(fields)))
+
+    @classmethod
+    def from_dict(cls, data):
+        """由字典创建记录，忽略不属于记录的键"""
+        record = cls()
+        for key, value in data.items():
+            if key in cls.__slots__:
+                setattr(record, key, value)
+        return record
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(
+            '%s=%r' % item for item in self.to_dict().items()))
@@ -0,0 +1,158 @@
+import glob
+import json
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+
+logger = logging.getLogger('spider.response_archive')
+
+DEFAULT_RESPONSE_ARCHIVE = {
+    'path': 'response_archive',
+    'compression': 'zlib',  # zlib或zstd，zstd需要安装zstandard
+    'segment_size': 64 * 1024 * 1024,  # 段文件超过该字节数后写入新的段
+}
+HTML = 'html'  # 原始页面
+RECORD = 'record'  # 在解析器内部请求的页面，保存解析结果(JSON)
+
+
+class _Codec:
+
+    def __init__(self, name):
+        self.name = name
+        self.local = threading.local()  # zstandard的压缩器不能跨线程共用
+
+    def _get_zstd(self):
+        if not hasattr(self.local, 'compressor'):
+            import zstandard
+
+            self.local.compressor = zstandard.ZstdCompressor(level=3)
+            self.local.decompressor = zstandard.ZstdDecompressor()
+        return self.local.compressor, self.local.decompressor
+
+    def compress(self, data):
+        if self.name == 'zstd':
+            return self._get_zstd()[0].compress(data)
+        return zlib.compress(data, 6)
+
+    def decompress(self, data):
+        if self.name == 'zstd':
+            return self._get_zstd()[1].decompress(data)
+        return zlib.decompress(data)
+
+
+class ResponseArchive:
+    """只追加的响应存档
+
+    每个响应单独压缩后追加到段文件(segment-NNNNNN.dat)，位置、获取时间和
+    所属用户记录在index.db中，同一url可存档多次，读取时返回最新的一次。
+    存档用于修复解析器后离线重新解析(--replay)和可重复的解析基准测试。
+    多个线程可同时写入。
+    """
+
+    def __init__(self,
+                 path,
+                 compression='zlib',
+                 segment_size=64 * 1024 * 1024):
+        self.path = path
+        self.segment_size = segment_size
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.codecs = {}
+        self.codec = self._get_codec(compression)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(path, 'index.db'),
+                                          check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL,
+                    user_uri TEXT,
+                    kind TEXT NOT NULL,
+                    segment INTEGER NOT NULL,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL,
+                    codec TEXT NOT NULL,
+                    fetched_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )""")
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS responses_url ON responses (url, id)')
+        segments = sorted(
+            glob.glob(os.path.join(path, 'segment-[0-9]*.dat')))
+        self.segment = int(segments[-1][-10:-4]) if segments else 1
+        self.file = open(self._get_segment_path(self.segment), 'ab')
+        self.readers = {}
+
+    def _get_codec(self, name):
+        if name not in self.codecs:
+            self.codecs[name] = _Codec(name)
+        return self.codecs[name]
+
+    def _get_segment_path(self, segment):
+        return os.path.join(self.path, 'segment-%06d.dat' % segment)
+
+    def put(self, url, content, user_uri='', kind=HTML):
+        """存档一个响应，content为bytes"""
+        data = self.codec.compress(content)
+        with self.lock:
+            if self.file.tell() and self.file.tell() + len(
+                    data) > self.segment_size:
+                self.file.close()
+                self.segment += 1
+                self.file = open(self._get_segment_path(self.segment), 'ab')
+            offset = self.file.tell()
+            self.file.write(data)
+            self.file.flush()
+            with self.connection:
+                self.connection.execute(
+                    'INSERT INTO responses (url, user_uri, kind, segment, '
+                    'offset, length, codec) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (url, user_uri, kind, self.segment, offset, len(data),
+                     self.codec.name))
+
+    def put_record(self, url, value, user_uri=''):
+        """存档页面的解析结果"""
+        self.put(url,
+                 json.dumps(value, ensure_ascii=False).encode('utf-8'),
+                 user_uri, RECORD)
+
+    def get(self, url):
+        """返回url最新一次存档的内容，没有存档时返回None"""
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT segment, offset, length, codec FROM responses '
+                'WHERE url = ? ORDER BY id DESC LIMIT 1', (url, )).fetchone()
+            if row is None:
+                return None
+            segment, offset, length, codec = row
+            if segment == self.segment:
+                self.file.flush()
+            reader = self.readers.get(segment)
+            if reader is None:
+                reader = self.readers[segment] = open(
+                    self._get_segment_path(segment), 'rb')
+            reader.seek(offset)
+            data = reader.read(length)
+        return self._get_codec(codec).decompress(data)
+
+    def get_record(self, url):
+        content = self.get(url)
+        return None if content is None else json.loads(content)
+
+    def get_metrics(self):
+        with self.lock:
+            count, size = self.connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(length), 0) FROM responses'
+            ).fetchone()
+        return {'responses': count, 'compressed_bytes': size}
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            for reader in self.readers.values():
+                reader.close()
+            self.connection.close()
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import random
+import time
+from urllib.parse import urlparse
+
+import requests
+
+logger = logging.getLogger('spider.response_classifier')
+
+# 响应类别
+OK = 'ok'
+NO_COMMENTS = 'no_comments'  # 页面正常但没有评论，如最后一页或无人评论的微博
+EMPTY = 'empty'  # 页面内容异常为空，通常是被限制
+LOGIN_REDIRECT = 'login_redirect'
+CAPTCHA = 'captcha'
+BLOCKED = 'blocked'  # 403/418或访问过于频繁
+CLIENT_ERROR = 'client_error'
+SERVER_ERROR = 'server_error'
+TIMEOUT = 'timeout'
+
+# fetch_page_steps要求调用方执行的步骤
+FETCH = 'fetch'  # 请求一次页面，将(身份, 响应类别, 解析结果)传回
+SLEEP = 'sleep'  # 等待指定秒数
+
+# 处理动作
+RETRY = 'retry'  # 等待后使用同一身份重试
+ROTATE = 'rotate'  # 当前身份冷却，换身份重试
+SKIP = 'skip'  # 放弃该页，不重试
+DISABLE = 'disable'  # 当前身份已失效，不再使用
+
+# 各类别默认的处理策略，delay为首次退避秒数，之后指数增长，不超过max_delay
+DEFAULT_BACKOFF = {
+    EMPTY: {'action': ROTATE, 'delay': 30, 'max_delay': 600, 'retries': 2},
+    LOGIN_REDIRECT: {'action': DISABLE, 'delay': 0, 'max_delay': 0, 'retries': 0},
+    CAPTCHA: {'action': ROTATE, 'delay': 60, 'max_delay': 900, 'retries': 2},
+    BLOCKED: {'action': ROTATE, 'delay': 60, 'max_delay': 900, 'retries': 2},
+    CLIENT_ERROR: {'action': SKIP, 'delay': 0, 'max_delay': 0, 'retries': 0},
+    SERVER_ERROR: {'action': RETRY, 'delay': 2, 'max_delay': 60, 'retries': 3},
+    TIMEOUT: {'action': RETRY, 'delay': 1, 'max_delay': 30, 'retries': 3},
+}
+BACKOFF_ACTIONS = (RETRY, ROTATE, SKIP, DISABLE)
+
+_LOGIN_HOSTS = ('passport.weibo.cn', 'passport.weibo.com', 'login.sina.com.cn')
+_CAPTCHA_MARKERS = [
+    marker.encode('utf-8') for marker in ('验证码', 'captcha', 'geetest')
+]
+_BLOCKED_MARKERS = [
+    marker.encode('utf-8') for marker in ('访问过于频繁', '操作过于频繁')
+]
+# 正常的评论页会在评论列表上方显示原微博
+_WEIBO_MARKER = b'id="M_'
+
+
+class BackoffPolicy:
+    """一类响应的处理策略，退避时间按指数增长并加入随机抖动"""
+
+    def __init__(self, action, delay=0, max_delay=0, retries=0):
+        self.action = action
+        self.delay = delay
+        self.max_delay = max_delay
+        self.retries = retries
+
+    def get_delay(self, attempt):
+        """第attempt次(从1开始)重试前的等待秒数，使用full jitter避免多个身份同时重试"""
+        if not self.delay:
+            return 0
+        return random.uniform(
+            0, min(self.max_delay, self.delay * 2**(attempt - 1)))
+
+    def should_retry(self, attempt):
+        return self.action in (RETRY, ROTATE) and attempt <= self.retries
+
+
+def get_backoff_policies(config=None):
+    """合并默认策略和配置中的策略，返回{类别: BackoffPolicy}"""
+    config = config or {}
+    return {
+        response_class: BackoffPolicy(**dict(policy,
+                                             **config.get(response_class, {})))
+        for response_class, policy in DEFAULT_BACKOFF.items()
+    }
+
+
+class ResponseClassifier:
+    """根据响应和解析结果判断请求是否被反爬"""
+
+    @staticmethod
+    def classify_error(error):
+        """对请求异常分类"""
+        if isinstance(error, (requests.Timeout, requests.ConnectionError)):
+            return TIMEOUT
+        return SERVER_ERROR
+
+    @staticmethod
+    def classify(response):
+        """对HTTP响应分类，状态码正常时返回OK，页面内容还需classify_page判断"""
+        for r in response.history + [response]:
+            if urlparse(r.url).netloc in _LOGIN_HOSTS:
+                return LOGIN_REDIRECT
+        status_code = response.status_code
+        if status_code in (403, 418, 429):
+            return BLOCKED
+        if 400 <= status_code < 500:
+            return CLIENT_ERROR
+        if status_code >= 500:
+            return SERVER_ERROR
+        return OK
+
+    @staticmethod
+    def classify_page(html, comments):
+        """对没有评论的页面进一步分类，区分正常的空页面和被反爬的页面"""
+        if comments:
+            return OK
+        html = html or b''
+        if _WEIBO_MARKER in html:
+            return NO_COMMENTS
+        if any(marker in html for marker in _BLOCKED_MARKERS):
+            return BLOCKED
+        if any(marker in html for marker in _CAPTCHA_MARKERS):
+            return CAPTCHA
+        return EMPTY
+
+
+def fetch_page_steps(url, identity_pool, backoff_policies, classifier=None):
+    """评论页请求的分类、退避和重试流程，同步和异步评论引擎共用
+
+    生成器不发送请求也不等待：yield (FETCH, None)时由调用方请求一次页面，
+    并用send传回(身份, 响应类别, (总页数, 评论列表, 原始内容))；yield (SLEEP, 秒数)时
+    由调用方等待。结束时返回(总页数, 评论列表, 原始内容)，放弃该页时返回None。
+    """
+    classifier = classifier or ResponseClassifier()
+    attempt = 0
+    while not identity_pool.is_exhausted():
+        identity, response_class, page = yield FETCH, None
+        if page:
+            total_pages, comments, html = page
+            response_class = classifier.classify_page(html, comments)
+            if response_class in (OK, NO_COMMENTS):
+                return page
+            # 页面内容异常时状态码正常，需单独反馈给限速服务
+            identity.session.report_blocked(url)
+        policy = backoff_policies[response_class]
+        if policy.action == DISABLE:
+            # 身份失效不是页面的问题，换其他身份重试
+            identity.mark_expired()
+            continue
+        attempt += 1
+        if not policy.should_retry(attempt):
+            logger.warning(f"请求{url}失败({response_class})，放弃该页")
+            return None
+        delay = policy.get_delay(attempt)
+        logger.warning(f"[{identity}] 请求{url}失败({response_class})，{delay:.1f}秒后第{attempt}次重试")
+        if policy.action == ROTATE:
+            # 被反爬的身份冷却，其他身份可以立即重试
+            identity.mark_blocked(delay)
+        else:
+            yield SLEEP, delay
+    return None
+
+
+def run_fetch_steps(steps, fetch):
+    """同步执行fetch_page_steps，fetch()请求一次页面"""
+    try:
+        action, delay = next(steps)
+        while True:
+            if action == FETCH:
+                action, delay = steps.send(fetch())
+            else:
+                time.sleep(delay)
+                action, delay = next(steps)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def run_fetch_steps_async(steps, fetch):
+    """在事件循环中执行fetch_page_steps，fetch()返回请求一次页面的协程"""
+    try:
+        action, delay = next(steps)
+        while True:
+            if action == FETCH:
+                action, delay = steps.send(await fetch())
+            else:
+                await asyncio.sleep(delay)
+                action, delay = next(steps)
+    except StopIteration as stop:
+        return stop.value
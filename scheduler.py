@@ -0,0 +1,36 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger('spider.scheduler')
+
+
+class UserScheduler:
+    """多用户并行调度
+
+    每个用户在独立的爬取上下文中运行，上下文之间只共享配置、
+    限速服务、代理池和断点等线程安全的对象。
+    """
+
+    def __init__(self, spider, workers):
+        self.spider = spider
+        self.workers = workers
+
+    def run(self, user_config_list):
+        """并行爬取所有用户"""
+        logger.info(u'使用%d个线程并行爬取%d个用户', self.workers,
+                    len(user_config_list))
+        with ThreadPoolExecutor(max_workers=self.workers,
+                                thread_name_prefix='user') as executor:
+            futures = {
+                executor.submit(self._crawl_user, user_config):
+                user_config['user_uri']
+                for user_config in user_config_list
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.exception(u'爬取用户%s时出错: %s', futures[future], e)
+
+    def _crawl_user(self, user_config):
+        self.spider.new_context().get_one_user(user_config)
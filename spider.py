@@ -1,33 +1,34 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 
+import copy
 import json
 import logging
 import logging.config
 import os
-import random
 import shutil
 import sys
-import time
+import threading
 from datetime import date, datetime, timedelta
-from time import sleep
+from types import SimpleNamespace
 
 from absl import app, flags
 from tqdm import tqdm
 import requests
-from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
-import warnings
-import csv
-from fake_useragent import UserAgent
-
-warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
 
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 from . import config_util, datetime_util
-from .downloader import AvatarPictureDownloader
+from .checkpoint import filter_new_comments
+from .comment_parser import CommentPageParser, parse_response
+from .fingerprint import FingerprintManager
+from .identity_pool import IdentityPool
+from .rate_limiter import RateLimiter
+from .response_classifier import (OK, ResponseClassifier, fetch_page_steps,
+                                  get_backoff_policies, run_fetch_steps)
 from .parser import AlbumParser, IndexParser, PageParser, PhotoParser
 from .user import User
+from .weibo import Weibo
 
 FLAGS = flags.FLAGS
 
@@ -35,30 +36,32 @@ flags.DEFINE_string('config_path', None, 'The path to config.json.')
 flags.DEFINE_string('u', None, 'The user_id we want to input.')
 flags.DEFINE_string('user_id_list', None, 'The path to user_id_list.txt.')
 flags.DEFINE_string('output_dir', None, 'The dir path to store results.')
+flags.DEFINE_boolean('replay', False,
+                     'Parse and write from the response archive without network.')
 
 logging_path = os.path.split(
     os.path.realpath(__file__))[0] + os.sep + 'logging.conf'
 logging.config.fileConfig(logging_path)
 logger = logging.getLogger('spider')
 
-def get_total_pages(url, headers):
-    """获取评论总页数"""
-    try:
-        response = requests.get(url, headers=headers)
-        soup = BeautifulSoup(response.text, 'lxml')
-        pagination = soup.find('div', id='pagelist')
-        if pagination:
-            input_tag = pagination.find('input', {'name': 'mp'})
-            return int(input_tag['value']) if input_tag else 1
-        return 1
-    except Exception as e:
-        logger.error(f"获取总页数失败: {str(e)}")
-        return 1
-
 def clean_header_value(value: str) -> str:
     """清理请求头中的非法字符"""
     return value.strip().replace('\ufeff', '').replace('\xa0', ' ')
 
+class _DictRecordWriter:
+    """writer模块中的写入器按__dict__读取记录，传给它们由to_dict()生成的对象"""
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write_weibo(self, weibos):
+        self.writer.write_weibo(
+            [SimpleNamespace(**weibo.to_dict()) for weibo in weibos])
+
+    def write_user(self, user):
+        self.writer.write_user(SimpleNamespace(**user.to_dict()))
+
+
 class Spider:
     def __init__(self, config):
         """Weibo类初始化"""
@@ -68,24 +71,93 @@ class Spider:
             since_date = date.today() - timedelta(since_date)
         self.since_date = str(since_date)
         self.end_date = config['end_date']
-        random_wait_pages = config['random_wait_pages']
-        self.random_wait_pages = [min(random_wait_pages), max(random_wait_pages)]
-        random_wait_seconds = config['random_wait_seconds']
-        self.random_wait_seconds = [min(random_wait_seconds), max(random_wait_seconds)]
-        self.global_wait = config['global_wait']
-        self.page_count = 0
+        # 所有请求统一限速，多用户并行时共享
+        self.rate_limiter = RateLimiter(config.get('rate_limit'))
+        # 按响应类别(登录跳转、验证码、空页面、4xx/5xx、超时)退避
+        self.response_classifier = ResponseClassifier()
+        self.backoff_policies = get_backoff_policies(config.get('backoff'))
+        self.user_concurrency = config.get('user_concurrency', 1)  # 并行爬取的用户数
         self.write_mode = config['write_mode']
         self.pic_download = config['pic_download']
         self.video_download = config['video_download']
         self.file_download_timeout = config.get('file_download_timeout', [5, 5, 10])
+        self.media_download_workers = config.get('media_download_workers', 4)  # 并行下载文件的线程数
+        # 下载清单路径，默认为结果目录下的media.db，用于跨用户去重和续传
+        self.media_manifest_path = config.get('media_manifest_path')
+        self.media_rate_limit = config.get('media_rate_limit')  # 图片和视频服务器的按域名限速
         self.result_dir_name = config.get('result_dir_name', 0)
-        self.cookie = config['cookie']
+        # 多个账号时配置cookies列表，每个cookie为一个身份
+        self.cookies = config.get('cookies') or [config['cookie']]
         self.mysql_config = config.get('mysql_config')
         self.sqlite_config = config.get('sqlite_config')
         self.kafka_config = config.get('kafka_config')
         self.mongo_config = config.get('mongo_config')
+        self.parquet_config = config.get('parquet_config')
         self.max_weibo_pages = config.get('max_weibo_pages', 2)  # 获取要爬取的微博页数
         self.max_comment_pages = config.get('max_comment_pages', 2)  # 获取每条微博要爬取的评论页数
+        self.comment_engine_mode = config.get('comment_engine', 'sync')  # 评论爬取引擎，sync或async
+        self.comment_concurrency = config.get('comment_concurrency', 8)  # async引擎的最大并发请求数
+        self.comment_batch_size = config.get('comment_batch_size', 500)  # 评论批量写入条数
+        self.comment_flush_interval = config.get('comment_flush_interval', 5)  # 评论最长缓冲秒数
+        self.comment_streaming = config.get('comment_streaming', 0)  # 是否边下载边解析评论页
+        # 评论存储方式，weibo为每条微博一个csv文件，user为每个用户一个带索引的csv文件
+        self.comment_storage = config.get('comment_storage', 'weibo')
+        # 流水线各阶段的线程数和队列长度，配置后微博抓取、写入、下载和评论爬取并行进行
+        self.pipeline_config = config.get('pipeline')
+        self.comment_database = None
+        if 'sqlite' in self.write_mode:  # 评论写入sqlite_config指定的数据库，多用户共用
+            from .comment_sink import SqliteCommentDatabase
+
+            self.comment_database = SqliteCommentDatabase(self.sqlite_config)
+        # MySQL和MongoDB写入器在后台批量写出，多用户共用连接
+        self.db_writers = []
+        if 'mysql' in self.write_mode:
+            from .db_writer import BufferedMySqlWriter
+
+            self.db_writers.append(BufferedMySqlWriter(self.mysql_config))
+        if 'mongo' in self.write_mode:
+            from .db_writer import BufferedMongoWriter
+
+            self.db_writers.append(BufferedMongoWriter(self.mongo_config))
+        self.comment_producer = None
+        if 'kafka' in self.write_mode and self.kafka_config.get(
+                'comment_topics'):  # 评论发送到Kafka，多用户共用一个生产者
+            from .kafka_comment_sink import KafkaCommentProducer
+
+            self.comment_producer = KafkaCommentProducer(self.kafka_config)
+        self.checkpoint = None
+        if config.get('checkpoint_path'):  # 断点数据库路径，配置后可续爬评论
+            from .checkpoint import CheckpointStore
+
+            self.checkpoint = CheckpointStore(config['checkpoint_path'])
+        # 用户资料和头像相册的解析结果缓存，有效期内不再请求，多用户共用
+        self.page_cache = None
+        if config.get('page_cache'):
+            from .page_cache import DEFAULT_PAGE_CACHE, PageCache
+
+            self.page_cache_config = dict(DEFAULT_PAGE_CACHE,
+                                          **config['page_cache'])
+            self.page_cache = PageCache(self.page_cache_config['path'])
+        # 响应存档，修复解析器后可用--replay离线重新解析和写入
+        self.response_archive = None
+        if config.get('response_archive'):
+            from .response_archive import (DEFAULT_RESPONSE_ARCHIVE,
+                                           ResponseArchive)
+
+            self.response_archive = ResponseArchive(
+                **dict(DEFAULT_RESPONSE_ARCHIVE, **config['response_archive']))
+            if self.comment_streaming:
+                logger.info(u'存档需要完整的评论页，不使用流式解析')
+                self.comment_streaming = 0
+        if FLAGS.replay:
+            if not self.response_archive:
+                logger.warning(u'--replay需要配置response_archive')
+                sys.exit()
+            # 回放只读取存档，不访问网络：不下载文件，不使用断点，评论使用同步引擎
+            self.pic_download = 0
+            self.video_download = 0
+            self.checkpoint = None
+            self.comment_engine_mode = 'sync'
         self.user_config_file_path = ''
         user_id_list = config['user_id_list']
         if FLAGS.user_id_list:
@@ -137,183 +209,314 @@ class Spider:
         self.weibo_counter = 0  # 添加微博计数器
         
         # 初始化评论爬虫相关属性
-        self.ua = UserAgent()
+        # User-Agent、accept和sec-*头由FingerprintManager按身份生成
         self.comment_headers = {
-            'cookie': clean_header_value(self.cookie),
             'referer': 'https://weibo.cn/u/2803301701',
-            'user-agent': self.ua.random,
-            'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
             'accept-language': 'zh-CN,zh;q=0.9,en;q=0.8',
             'accept-encoding': 'gzip, deflate, br',
             'connection': 'keep-alive',
-            'upgrade-insecure-requests': '1',
-            'sec-fetch-dest': 'document',
-            'sec-fetch-mode': 'navigate',
-            'sec-fetch-site': 'same-origin',
-            'sec-fetch-user': '?1',
             'cache-control': 'max-age=0'
         }
-        # 使用代理池
-        from .proxy_pool import proxy_pool
-        self.proxy_pool = proxy_pool
-        
-        # 添加随机延时
-        self.min_delay = 5
-        self.max_delay = 15
+        # User-Agent数据的本地缓存文件，首次使用时生成
+        self.fingerprints = FingerprintManager(config.get('user_agent_cache'))
+        # 配置proxy_pool后才创建代理池，未配置或回放时直连；回放不发送请求，
+        # 不创建代理池也就不会抓取代理源，身份池也不会重新绑定代理
+        self.proxy_pool = None
+        if config.get('proxy_pool') is not None and not FLAGS.replay:
+            from .proxy_pool import ProxyPool
+
+            self.proxy_pool = ProxyPool(config['proxy_pool']).start()
         
-        # 添加请求失败计数器
-        self.fail_count = 0
-        self.max_fails = 3
-        
-        # 添加会话管理
-        self.session = requests.Session()
-        self.session.headers.update(self.comment_headers)
-
-    def _random_delay(self):
-        """随机延时"""
-        delay = random.uniform(self.min_delay, self.max_delay)
-        logger.info(f"随机延时 {delay:.2f} 秒")
-        sleep(delay)
-
-    def _rotate_user_agent(self):
-        """轮换User-Agent"""
-        self.comment_headers['user-agent'] = self.ua.random
-        self.session.headers.update(self.comment_headers)
-
-    def _handle_request_error(self, e):
-        """处理请求错误"""
-        self.fail_count += 1
-        logger.error(f"请求失败 ({self.fail_count}/{self.max_fails}): {str(e)}")
-        
-        if self.fail_count >= self.max_fails:
-            logger.warning("连续失败次数过多，等待较长时间后重试")
-            sleep(random.uniform(300, 600))  # 等待5-10分钟
-            self.fail_count = 0
-        else:
-            self._random_delay()
-            self._rotate_user_agent()
-
-    def crawl_comments(self, weibo_url, weibo_id, weibo_number):
-        """爬取单条微博的评论"""
+        # 评论解析器不是线程安全的，流水线的每个评论线程各用一个
+        self.comment_parsers = threading.local()
+        # 文件写入器不是线程安全的，流水线的多个写入线程依次写入
+        self.writer_lock = threading.Lock()
+
+        # 身份池，每个cookie拥有独立的会话、User-Agent和代理，多用户并行时共享
+        self.identity_pool = IdentityPool(self.rate_limiter, [
+            dict(cookie, cookie=clean_header_value(cookie['cookie']))
+            if isinstance(cookie, dict) else clean_header_value(cookie)
+            for cookie in self.cookies
+        ], self.comment_headers, self.proxy_pool, self.fingerprints)
+        self.comment_engine = None
+        # 图片和视频由下载服务在后台并行下载，所有用户共用
+        self.media_service = None
+        if self.pic_download or self.video_download:
+            from .media_downloader import MediaDownloadService
+
+            output_dir = self._get_output_dir()
+            if not os.path.isdir(output_dir):
+                os.makedirs(output_dir)
+            self.media_service = MediaDownloadService(
+                self.media_manifest_path
+                or os.path.join(output_dir, 'media.db'),
+                self.media_download_workers,
+                self.file_download_timeout,
+                headers={
+                    'user-agent':
+                    self.fingerprints.create('media')['user-agent']
+                },
+                rate_limit=self.media_rate_limit)
+        self.parquet_writer = None
+        self.comment_store = None
+
+    def new_context(self):
+        """创建独立的用户爬取上下文，共享配置和全局限速，用户相关状态各自独立"""
+        context = copy.copy(self)
+        context.user_config = {}
+        context.new_since_date = ''
+        context.user = User()
+        context.got_num = 0
+        context.weibo_id_list = []
+        context.weibo_counter = 0
+        context.writers = []
+        context.downloaders = []
+        context.comment_engine = None
+        context.parquet_writer = None
+        context.comment_store = None
+        context.comment_parsers = threading.local()
+        context.writer_lock = threading.Lock()
+        return context
+
+    @property
+    def comment_parser(self):
+        """当前线程使用的评论解析器"""
+        parser = getattr(self.comment_parsers, 'parser', None)
+        if parser is None:
+            parser = self.comment_parsers.parser = CommentPageParser()
+        return parser
+
+    def _replay_comment_page(self, url):
+        """从存档中读取并解析一页评论，没有存档时返回None"""
+        html = self.response_archive.get(url)
+        if html is None:
+            logger.warning(u'存档中没有%s', url)
+            return None
+        return self.comment_parser.parse(html)
+
+    def _fetch_comment_page(self, url):
+        """获取并解析一页评论，返回(总页数, 评论列表)，放弃该页时返回None"""
+        if FLAGS.replay:
+            return self._replay_comment_page(url)
+        page = run_fetch_steps(
+            fetch_page_steps(url, self.identity_pool, self.backoff_policies,
+                             self.response_classifier),
+            lambda: self._request_comment_page(url))
+        if page is None:
+            return None
+        total_pages, comments, html = page
+        logger.info(f"找到 {len(comments)} 条评论")
+        if self.response_archive:
+            self.response_archive.put(url, html, self.user_config['user_uri'])
+        return total_pages, comments
+
+    def _request_comment_page(self, url):
+        """使用可用身份请求并解析一次评论页，返回(身份, 响应类别, 解析结果)"""
+        identity = self.identity_pool.acquire(url)
+        logger.info(f"[{identity}] 发送请求: {url}")
         try:
-            # 准备保存评论的文件
-            comment_file = os.path.join(os.path.dirname(self._get_filepath('csv')), f'comments_{weibo_id}.csv')
-            logger.info(f"评论将保存到文件: {comment_file}")
-            
-            # 如果文件已存在，先删除
-            if os.path.exists(comment_file):
-                os.remove(comment_file)
-            
-            with open(comment_file, mode='w', encoding='utf-8-sig', newline='') as f:
-                csv_writer = csv.writer(f)
-                csv_writer.writerow(['评论编号', '用户ID', '昵称', '内容', '点赞数', '发布时间', '设备', 'IP属地'])
-
-                # 获取总页数
+            response = identity.session.get(url,
+                                            reserved=True,
+                                            timeout=15,
+                                            stream=bool(self.comment_streaming))
+        except requests.RequestException as e:
+            logger.error(f"[{identity}] 请求失败: {str(e)}")
+            return identity, self.response_classifier.classify_error(e), None
+        response_class = self.response_classifier.classify(response)
+        if response_class != OK:
+            response.close()
+            return identity, response_class, None
+        return identity, response_class, parse_response(
+            response, self.comment_streaming, self.comment_parser)
+
+    def crawl_comments(self,
+                       weibo_url,
+                       weibo_id,
+                       weibo_number,
+                       weibo_publish_time=None):
+        """爬取单条微博的评论，评论时间的年份按微博发布时间推断"""
+        try:
+            # 读取断点，跳过已写出的评论页
+            user_uri = self.user_config['user_uri']
+            finished_pages = {}
+            total_pages = None
+            high_water_mark = None
+            if self.checkpoint:
+                finished_pages = self.checkpoint.get_finished_pages(user_uri, weibo_id)
+                total_pages = self.checkpoint.get_total_pages(user_uri, weibo_id)
+                high_water_mark = self.checkpoint.get_high_water_mark(user_uri, weibo_id)
+
+            # 获取总页数，第1页的评论直接复用，不再重复请求
+            fetched_pages = {}
+            if total_pages is None:
                 logger.info(f"正在获取微博 {weibo_number} 的评论总页数...")
-                try:
-                    response = self.session.get(f"{weibo_url}?page=1", 
-                                             headers=self.comment_headers,
-                                             timeout=15)
-                    response.raise_for_status()
-                    soup = BeautifulSoup(response.text, 'lxml')
-                    pagination = soup.find('div', id='pagelist')
-                    if pagination:
-                        input_tag = pagination.find('input', {'name': 'mp'})
-                        total_pages = int(input_tag['value']) if input_tag else 1
-                    else:
-                        total_pages = 1
-                    logger.info(f"获取到总页数: {total_pages}")
-                except Exception as e:
-                    logger.error(f"获取总页数失败: {str(e)}")
-                    total_pages = 1
-
-                # 使用配置的评论页数
-                total_pages = min(self.max_comment_pages, total_pages)
-                logger.info(f"微博 {weibo_number} 将爬取前 {total_pages} 页评论")
-
-                comment_counter = 0  # 评论计数器
-                for page in range(1, total_pages + 1):
+                result = self._fetch_comment_page(f"{weibo_url}?page=1")
+                if result is None:
+                    logger.error(f"获取微博 {weibo_number} 的评论总页数失败")
+                    return
+                total_pages, fetched_pages[1] = result
+                logger.info(f"获取到总页数: {total_pages}")
+                if self.checkpoint:
+                    self.checkpoint.set_total_pages(user_uri, weibo_id, total_pages)
+
+            # 使用配置的评论页数
+            total_pages = min(self.max_comment_pages, total_pages)
+            pages = [page for page in range(1, total_pages + 1) if page not in finished_pages]
+            if not pages:
+                logger.info(f"微博 {weibo_number} 的前 {total_pages} 页评论已爬取，跳过")
+                if self.checkpoint:
+                    self.checkpoint.finish_weibo(user_uri, weibo_id)
+                return
+            logger.info(f"微博 {weibo_number} 将爬取前 {total_pages} 页评论，已完成 {len(finished_pages)} 页")
+            if high_water_mark:
+                logger.info(f"微博 {weibo_number} 增量爬取，翻到已爬取的评论即停止")
+
+            # 评论计数器，续爬时从已写出的最大评论序号继续
+            comment_counter = self.checkpoint.get_last_number(
+                user_uri, weibo_id) if self.checkpoint else 0
+            all_pages_done = True
+            with self._get_comment_sink(weibo_id) as comment_sink:
+                for page in pages:
                     url = f"{weibo_url}?page={page}"
                     logger.info(f"正在爬取微博 {weibo_number} 的第 {page}/{total_pages} 页评论")
 
-                    try:
-                        # 随机延时
-                        self._random_delay()
-                        
-                        # 轮换User-Agent
-                        self._rotate_user_agent()
-                        logger.info(f"使用User-Agent: {self.comment_headers['user-agent']}")
-
-                        logger.info(f"发送请求: {url}")
-                        response = self.session.get(url,
-                                                headers=self.comment_headers,
-                                                timeout=15)
-                        response.raise_for_status()
-                        logger.info(f"请求成功，状态码: {response.status_code}")
-
-                        # 解析评论
-                        soup = BeautifulSoup(response.text, 'lxml')
-                        comments = soup.find_all('div', class_='c', id=lambda x: x and x.startswith('C_'))
-                        logger.info(f"找到 {len(comments)} 条评论")
-
-                        if not comments:
-                            logger.warning(f"微博 {weibo_number} 第 {page} 页未找到评论，可能触发反爬！")
-                            self._handle_request_error(Exception("未找到评论"))
+                    if page in fetched_pages:
+                        comments = fetched_pages.pop(page)
+                    else:
+                        result = self._fetch_comment_page(url)
+                        if result is None:
+                            all_pages_done = False
                             continue
+                        comments = result[1]
+                    if not comments:
+                        # 页面正常但没有评论，之后的页面也不会有评论
+                        logger.info(f"微博 {weibo_number} 第 {page} 页没有评论，停止翻页")
+                        break
+
+                    # 增量爬取只保留高水位之后的新评论
+                    comments, reached = filter_new_comments(comments, high_water_mark)
+                    for comment in comments:
+                        comment_counter += 1
+                        comment.weibo_id = weibo_id
+                        comment.publish_time = datetime_util.standardize_comment_date(
+                            comment.publish_time, weibo_publish_time)
+                        comment.number = f"{weibo_number}-{comment_counter}"  # 生成评论编号
+                    if comments:
+                        comment_sink.write_page(weibo_number, page, comments)
+
+                    if reached:
+                        logger.info(f"微博 {weibo_number} 第 {page} 页已到达上次爬取的位置，停止翻页")
+                        break
 
-                        for comment in comments:
-                            try:
-                                comment_counter += 1
-                                comment_number = f"{weibo_number}-{comment_counter}"  # 生成评论编号
-                                
-                                # 用户信息
-                                user_link = comment.find('a', href=lambda x: x and '/u/' in x)
-                                user_id = user_link['href'].split('/')[-1] if user_link else 'N/A'
-                                screen_name = user_link.text if user_link else 'N/A'
-
-                                # 评论内容
-                                content = comment.find('span', class_='ctt').text.strip() if comment.find('span',
-                                                                                                      class_='ctt') else 'N/A'
-
-                                # 元数据解析
-                                info_text = comment.find('span', class_='ct').text if comment.find('span', class_='ct') else ''
-                                like_info = comment.find('a', string=lambda t: t and '赞[' in t)
-                                likes = like_info.text.replace('赞[', '').replace(']', '') if like_info else '0'
-
-                                # 分离时间和设备信息
-                                time_source = info_text.split('\xa0')[0] if info_text else 'N/A'
-                                device = info_text.split('来自')[-1].split('\xa0')[0] if '来自' in info_text else 'N/A'
-                                ip_location = info_text.split('\xa0')[-1] if len(info_text.split('\xa0')) > 1 else 'N/A'
-
-                                csv_writer.writerow([comment_number, user_id, screen_name, content, likes, time_source, device, ip_location])
-                                logger.info(f"已保存评论 {comment_number}")
-                            except Exception as e:
-                                logger.error(f"解析评论时出错: {str(e)}")
-                                continue
-                        
-                        logger.info(f"成功保存 {comment_counter} 条评论")
-
-                        # 重置失败计数
-                        self.fail_count = 0
-
-                    except Exception as e:
-                        self._handle_request_error(e)
-                        continue
-
-            logger.info(f"微博 {weibo_number} 的评论爬取完成，共爬取 {total_pages} 页")
+            # 评论已全部落盘后更新高水位；有失败页时保留断点，下次续爬
+            if self.checkpoint and all_pages_done:
+                comment_sink.after_flush(
+                    lambda: self.checkpoint.finish_weibo(user_uri, weibo_id))
+
+            logger.info(f"微博 {weibo_number} 的评论爬取完成，共爬取 {total_pages} 页，保存 {comment_sink.saved_count} 条评论")
 
         except Exception as e:
             logger.error(f"爬取微博 {weibo_number} 的评论时出错: {str(e)}")
 
+    def _writes_comment_csv(self):
+        """评论是否保存为csv，未配置其他评论输出时默认保存为csv"""
+        return 'csv' in self.write_mode or not (
+            'parquet' in self.write_mode or self.comment_database
+            or self.comment_producer)
+
+    def _get_comment_sink(self, weibo_id):
+        """获取评论输出"""
+        sinks = []
+        # 未配置其他评论输出时，评论保存到每条微博一个的csv文件
+        if self.comment_store:
+            from .comment_store import CommentStoreSink
+
+            sinks.append(
+                CommentStoreSink(self.comment_store, weibo_id,
+                                 self.comment_batch_size,
+                                 self.comment_flush_interval))
+        elif self._writes_comment_csv():
+            from .comment_sink import CsvCommentSink
+
+            comment_file = os.path.join(self._get_result_dir(), f'comments_{weibo_id}.csv')
+            logger.info(f"评论将保存到文件: {comment_file}")
+            sinks.append(
+                CsvCommentSink(comment_file, self.comment_batch_size,
+                               self.comment_flush_interval,
+                               append=bool(self.checkpoint)))
+        if self.parquet_writer:
+            from .parquet_writer import ParquetCommentSink
+
+            sinks.append(
+                ParquetCommentSink(self.parquet_writer.comment_dataset,
+                                   self.user.id, self.comment_batch_size,
+                                   self.comment_flush_interval))
+        if self.comment_database:
+            from .comment_sink import SqliteCommentSink
+
+            sinks.append(
+                SqliteCommentSink(self.comment_database,
+                                  self.comment_batch_size,
+                                  self.comment_flush_interval))
+        if self.comment_producer:
+            from .kafka_comment_sink import KafkaCommentSink
+
+            sinks.append(
+                KafkaCommentSink(self.comment_producer,
+                                 self.comment_batch_size,
+                                 self.comment_flush_interval))
+        if len(sinks) == 1:
+            comment_sink = sinks[0]
+        else:
+            from .comment_sink import MultiCommentSink
+
+            comment_sink = MultiCommentSink(sinks, self.comment_batch_size,
+                                            self.comment_flush_interval)
+        if self.checkpoint:
+            # 评论写出后再记录断点，保证断点之前的评论都已落盘
+            user_uri = self.user_config['user_uri']
+            comment_sink.on_flush = lambda pages: self.checkpoint.commit_pages(
+                user_uri, weibo_id, pages)
+        return comment_sink
+
     def write_weibo(self, weibos):
         """将爬取到的信息写入文件或数据库"""
-        for writer in self.writers:
-            writer.write_weibo(weibos)
+        self.write_weibo_to_writers(weibos)
+        self.download_weibo_files(weibos)
+        self.crawl_weibo_comments(weibos)
+
+    def write_weibo_to_writers(self, weibos):
+        """将微博写入文件或数据库，启用断点时已写出过的微博不再写出"""
+        with self.writer_lock:
+            if self.checkpoint:
+                user_uri = self.user_config['user_uri']
+                written = self.checkpoint.get_written_weibos(
+                    user_uri, [weibo.id for weibo in weibos])
+                weibos = [weibo for weibo in weibos if weibo.id not in written]
+                if not weibos:
+                    return
+            for writer in self.writers:
+                writer.write_weibo(weibos)
+            if self.checkpoint:
+                self.checkpoint.add_written_weibos(
+                    user_uri, [weibo.id for weibo in weibos])
+
+    def download_weibo_files(self, weibos):
+        """下载微博图片和视频"""
         for downloader in self.downloaders:
             downloader.download_files(weibos)
-            
+
+    def crawl_weibo_comments(self, weibos):
+        """爬取一批微博的评论"""
+        if self.comment_engine:
+            self.comment_engine.crawl(weibos)
+            return
+
         # 爬取每条微博的评论
         for weibo in weibos:
+            if self.identity_pool.is_exhausted():
+                logger.error("所有身份的cookie均已失效，停止爬取评论，请更新cookie")
+                break
             try:
                 # 构造评论URL
                 comment_url = f'https://weibo.cn/comment/{weibo.id}'
@@ -321,12 +524,8 @@ class Spider:
                 logger.info(f"评论URL: {comment_url}")
                 
                 # 爬取评论
-                self.crawl_comments(comment_url, weibo.id, weibo.weibo_number)
-                
-                # 随机延时
-                sleep_time = random.uniform(3, 8)
-                logger.info(f"评论爬取完成，等待 {sleep_time:.2f} 秒后继续")
-                time.sleep(sleep_time)
+                self.crawl_comments(comment_url, weibo.id, weibo.weibo_number,
+                                    weibo.publish_time)
                 
             except Exception as e:
                 logger.error(f"爬取微博 {weibo.weibo_number} 的评论时出错: {str(e)}")
@@ -337,20 +536,60 @@ class Spider:
         for writer in self.writers:
             writer.write_user(user)
 
+    def _get_archived_record(self, url):
+        record = self.response_archive.get_record(url)
+        if record is None:
+            raise RuntimeError(u'存档中没有%s' % url)
+        return record
+
     def get_user_info(self, user_uri):
-        """获取用户信息"""
-        self.user = IndexParser(self.cookie, user_uri).get_user()
-        self.page_count += 1
+        """获取用户信息，page_cache配置了profile_ttl时有效期内使用缓存"""
+        url = f'https://weibo.cn/{user_uri}'
+        if FLAGS.replay:
+            self.user = User.from_dict(
+                self._get_archived_record(url + '/profile'))
+            return
+
+        profile_ttl = self.page_cache_config[
+            'profile_ttl'] if self.page_cache else 0
+        cached = self.page_cache.get(url + '/profile',
+                                     profile_ttl) if profile_ttl else None
+        if cached:
+            self.user = User.from_dict(cached)
+            logger.info(u'用户%s的资料来自%d秒内的缓存，微博数和粉丝数可能不是最新',
+                        user_uri, profile_ttl)
+        else:
+            identity = self.identity_pool.acquire(url)
+            self.user = IndexParser(identity.cookie, user_uri).get_user()
+            if profile_ttl:
+                self.page_cache.set(url + '/profile', self.user.to_dict())
+        if self.response_archive:
+            # 用户资料在解析器内部请求，存档解析结果
+            self.response_archive.put_record(url + '/profile',
+                                             self.user.to_dict(), user_uri)
 
     def download_user_avatar(self, user_uri):
         """下载用户头像"""
-        avatar_album_url = PhotoParser(self.cookie,
-                                       user_uri).extract_avatar_album_url()
-        pic_urls = AlbumParser(self.cookie,
+        from .media_downloader import AvatarPictureDownloader
+
+        url = f'https://weibo.cn/{user_uri}/photo'
+
+        def fetch_pic_urls():
+            identity = self.identity_pool.acquire(url)
+            avatar_album_url = PhotoParser(
+                identity.cookie, user_uri).extract_avatar_album_url()
+            identity = self.identity_pool.acquire(avatar_album_url)
+            return AlbumParser(identity.cookie,
                                avatar_album_url).extract_pic_urls()
-        AvatarPictureDownloader(
-            self._get_filepath('img'),
-            self.file_download_timeout).handle_download(pic_urls)
+
+        if self.page_cache:
+            pic_urls = self.page_cache.get_or_fetch(
+                url, self.page_cache_config['album_ttl'], fetch_pic_urls)
+        else:
+            pic_urls = fetch_pic_urls()
+        # 已下载过的头像由下载服务直接跳过，不再请求
+        AvatarPictureDownloader(self.media_service,
+                                self._get_filepath('img')).handle_download(pic_urls)
 
     def get_weibo_info(self):
         """获取微博信息"""
@@ -359,29 +598,12 @@ class Spider:
                 self.user_config['since_date'])
             now = datetime.now()
             if since_date <= now:
-                page_num = IndexParser(
-                    self.cookie,
-                    self.user_config['user_uri']).get_page_num()  # 获取微博总页数
-                self.page_count += 1
-                if self.page_count > 2 and (self.page_count +
-                                            page_num) > self.global_wait[0][0]:
-                    wait_seconds = int(
-                        self.global_wait[0][1] *
-                        min(1, self.page_count / self.global_wait[0][0]))
-                    logger.info(u'即将进入全局等待时间，%d秒后程序继续执行' % wait_seconds)
-                    for i in tqdm(range(wait_seconds)):
-                        sleep(1)
-                    self.page_count = 0
-                    self.global_wait.append(self.global_wait.pop(0))
-                page1 = 0
-                random_pages = random.randint(*self.random_wait_pages)
-                # 使用配置的微博页数
-                max_pages = min(self.max_weibo_pages, page_num)
-                for page in tqdm(range(1, max_pages + 1), desc='Progress'):
-                    weibos, self.weibo_id_list, to_continue = PageParser(
-                        self.cookie,
-                        self.user_config, page, self.filter).get_one_page(
-                            self.weibo_id_list)  # 获取第page页的全部微博
+                user_url = f"https://weibo.cn/{self.user_config['user_uri']}"
+                if FLAGS.replay:
+                    weibo_pages = self._replay_weibo_pages(user_url)
+                else:
+                    weibo_pages = self._fetch_weibo_pages(user_url)
+                for page, weibos, to_continue in weibo_pages:
                     logger.info(
                         u'%s已获取%s(%s)的第%d页微博%s',
                         '-' * 30,
@@ -390,7 +612,6 @@ class Spider:
                         page,
                         '-' * 30,
                     )
-                    self.page_count += 1
                     if weibos:
                         # 为每条微博添加编号
                         for weibo in weibos:
@@ -400,22 +621,8 @@ class Spider:
                     if not to_continue:
                         break
 
-                    # 通过加入随机等待避免被限制
-                    if (page - page1) % random_pages == 0 and page < page_num:
-                        sleep(random.randint(*self.random_wait_seconds))
-                        page1 = page
-                        random_pages = random.randint(*self.random_wait_pages)
-
-                    if self.page_count >= self.global_wait[0][0]:
-                        logger.info(u'即将进入全局等待时间，%d秒后程序继续执行' %
-                                    self.global_wait[0][1])
-                        for i in tqdm(range(self.global_wait[0][1])):
-                            sleep(1)
-                        self.page_count = 0
-                        self.global_wait.append(self.global_wait.pop(0))
-
-                # 更新用户user_id_list.txt中的since_date
-                if self.user_config_file_path or FLAGS.u:
+                # 更新用户user_id_list.txt中的since_date，回放时不更新
+                if (self.user_config_file_path or FLAGS.u) and not FLAGS.replay:
                     config_util.update_user_config_file(
                         self.user_config_file_path,
                         self.user_config['user_uri'],
@@ -425,16 +632,58 @@ class Spider:
         except Exception as e:
             logger.exception(e)
 
+    def _fetch_weibo_pages(self, user_url):
+        """逐页获取微博，返回(页码, 微博列表, 是否继续)"""
+        identity = self.identity_pool.acquire(user_url)
+        page_num = IndexParser(
+            identity.cookie,
+            self.user_config['user_uri']).get_page_num()  # 获取微博总页数
+        # 使用配置的微博页数
+        max_pages = min(self.max_weibo_pages, page_num)
+        for page in tqdm(range(1, max_pages + 1), desc='Progress'):
+            identity = self.identity_pool.acquire(f'{user_url}?page={page}')
+            weibos, self.weibo_id_list, to_continue = PageParser(
+                identity.cookie, self.user_config, page,
+                self.filter).get_one_page(self.weibo_id_list)  # 获取第page页的全部微博
+            if self.response_archive:
+                # 微博页在解析器内部请求，存档解析结果
+                self.response_archive.put_record(
+                    f'{user_url}?page={page}', {
+                        'weibos': [weibo.to_dict() for weibo in weibos],
+                        'to_continue': to_continue,
+                    }, self.user_config['user_uri'])
+            yield page, weibos, to_continue
+
+    def _replay_weibo_pages(self, user_url):
+        """从存档中逐页读取微博，返回(页码, 微博列表, 是否继续)"""
+        for page in range(1, self.max_weibo_pages + 1):
+            record = self.response_archive.get_record(f'{user_url}?page={page}')
+            if record is None:
+                break
+            yield page, [Weibo.from_dict(weibo) for weibo in record['weibos']
+                         ], record['to_continue']
+
+    @staticmethod
+    def _get_output_dir():
+        """获取结果目录，各用户的结果保存在其下的子目录中"""
+        if FLAGS.output_dir is not None:
+            return FLAGS.output_dir
+        return os.getcwd() + os.sep + 'weibo'
+
+    def _get_result_dir(self):
+        """获取用户结果目录"""
+        dir_name = self.user.nickname
+        if self.result_dir_name:
+            dir_name = self.user.id
+        file_dir = self._get_output_dir() + os.sep + dir_name
+        if not os.path.isdir(file_dir):
+            os.makedirs(file_dir)
+        return file_dir
+
     def _get_filepath(self, type):
         """获取结果文件路径"""
         try:
-            dir_name = self.user.nickname
-            if self.result_dir_name:
-                dir_name = self.user.id
-            if FLAGS.output_dir is not None:
-                file_dir = FLAGS.output_dir + os.sep + dir_name
-            else:
-                file_dir = (os.getcwd() + os.sep + 'weibo' + os.sep + dir_name)
+            file_dir = self._get_result_dir()
             if type == 'img' or type == 'video':
                 file_dir = file_dir + os.sep + type
             if not os.path.isdir(file_dir):
@@ -442,8 +691,8 @@ class Spider:
             if type == 'img' or type == 'video':
                 return file_dir
             file_path = file_dir + os.sep + self.user.id + '.' + type
-            # 如果文件已存在，先删除
-            if os.path.exists(file_path):
+            # 如果文件已存在，先删除；启用断点续爬时保留并追加
+            if os.path.exists(file_path) and not self.checkpoint:
                 os.remove(file_path)
             return file_path
         except Exception as e:
@@ -463,52 +712,80 @@ class Spider:
             from .writer import CsvWriter
 
             self.writers.append(
-                CsvWriter(self._get_filepath('csv'), self.filter))
+                _DictRecordWriter(
+                    CsvWriter(self._get_filepath('csv'), self.filter)))
         if 'txt' in self.write_mode:
             from .writer import TxtWriter
 
             self.writers.append(
-                TxtWriter(self._get_filepath('txt'), self.filter))
+                _DictRecordWriter(
+                    TxtWriter(self._get_filepath('txt'), self.filter)))
         if 'json' in self.write_mode:
             from .writer import JsonWriter
 
-            self.writers.append(JsonWriter(self._get_filepath('json')))
-        if 'mysql' in self.write_mode:
-            from .writer import MySqlWriter
-
-            self.writers.append(MySqlWriter(self.mysql_config))
-        if 'mongo' in self.write_mode:
-            from .writer import MongoWriter
-
-            self.writers.append(MongoWriter(self.mongo_config))
+            self.writers.append(
+                _DictRecordWriter(JsonWriter(self._get_filepath('json'))))
+        self.writers.extend(self.db_writers)
         if 'sqlite' in self.write_mode:
             from .writer import SqliteWriter
 
-            self.writers.append(SqliteWriter(self.sqlite_config))
+            self.writers.append(
+                _DictRecordWriter(SqliteWriter(self.sqlite_config)))
 
         if 'kafka' in self.write_mode:
             from .writer import KafkaWriter
 
-            self.writers.append(KafkaWriter(self.kafka_config))
+            self.writers.append(
+                _DictRecordWriter(KafkaWriter(self.kafka_config)))
+
+        self.comment_store = None
+        if self.comment_storage == 'user' and self._writes_comment_csv():
+            from .comment_store import CommentStore
+
+            self.comment_store = CommentStore(
+                os.path.join(self._get_result_dir(),
+                             self.user.id + '_comments.csv'),
+                append=bool(self.checkpoint))
+
+        self.parquet_writer = None
+        if 'parquet' in self.write_mode:
+            from .parquet_writer import ParquetWriter
+
+            # 数据集按用户和日期分区，所有用户写入结果目录下的同一个parquet目录
+            self.parquet_writer = ParquetWriter(
+                os.path.join(self._get_output_dir(), 'parquet'), self.user.id,
+                self.parquet_config)
+            self.writers.append(self.parquet_writer)
 
         self.downloaders = []
         if self.pic_download == 1:
-            from .downloader import (OriginPictureDownloader,
-                                     RetweetPictureDownloader)
+            from .media_downloader import (OriginPictureDownloader,
+                                           RetweetPictureDownloader)
 
             self.downloaders.append(
-                OriginPictureDownloader(self._get_filepath('img'),
-                                        self.file_download_timeout))
+                OriginPictureDownloader(self.media_service,
+                                        self._get_filepath('img')))
         if self.pic_download and not self.filter:
             self.downloaders.append(
-                RetweetPictureDownloader(self._get_filepath('img'),
-                                         self.file_download_timeout))
+                RetweetPictureDownloader(self.media_service,
+                                         self._get_filepath('img')))
         if self.video_download == 1:
-            from .downloader import VideoDownloader
+            from .media_downloader import VideoDownloader
 
             self.downloaders.append(
-                VideoDownloader(self._get_filepath('video'),
-                                self.file_download_timeout))
+                VideoDownloader(self.media_service,
+                                self._get_filepath('video')))
+
+        if self.comment_engine_mode == 'async':
+            from .comment_engine import AsyncCommentEngine
+
+            self.comment_engine = AsyncCommentEngine(
+                self.identity_pool, self._get_comment_sink,
+                self.max_comment_pages, self.comment_concurrency, checkpoint=self.checkpoint,
+                user_uri=user_config['user_uri'],
+                backoff_policies=self.backoff_policies,
+                streaming=bool(self.comment_streaming),
+                response_archive=self.response_archive)
 
     def get_one_user(self, user_config):
         """获取一个用户的微博"""
@@ -525,17 +802,44 @@ class Spider:
             if self.pic_download:
                 self.download_user_avatar(user_config['user_uri'])
 
-            for weibos in self.get_weibo_info():
-                self.write_weibo(weibos)
-                self.got_num += len(weibos)
+            if self.pipeline_config is not None:
+                from .pipeline import WeiboPipeline
+
+                with WeiboPipeline(self, **self.pipeline_config) as pipeline:
+                    for weibos in self.get_weibo_info():
+                        pipeline.put(weibos)
+                        self.got_num += len(weibos)
+            else:
+                for weibos in self.get_weibo_info():
+                    self.write_weibo(weibos)
+                    self.got_num += len(weibos)
             if not self.filter:
                 logger.info(u'共爬取' + str(self.got_num) + u'条微博')
             else:
                 logger.info(u'共爬取' + str(self.got_num) + u'条原创微博')
             logger.info(u'信息抓取完毕')
+            self.rate_limiter.log_metrics()
+            logger.info(u'身份池指标: %s',
+                        json.dumps(self.identity_pool.get_metrics(),
+                                   ensure_ascii=False))
+            if self.proxy_pool:
+                logger.info(u'代理池指标: %s',
+                            json.dumps(self.proxy_pool.get_metrics(),
+                                       ensure_ascii=False))
+            if self.page_cache:
+                logger.info(u'页面缓存指标: %s', self.page_cache.get_metrics())
+            if self.response_archive:
+                logger.info(u'响应存档指标: %s',
+                            self.response_archive.get_metrics())
             logger.info('*' * 100)
         except Exception as e:
             logger.exception(e)
+        finally:
+            if self.comment_store:
+                self.comment_store.close()
+            if self.parquet_writer:
+                # 关闭文件后parquet数据才完整可读
+                self.parquet_writer.close()
 
     def start(self):
         """运行爬虫"""
@@ -544,18 +848,30 @@ class Spider:
                 logger.info(
                     u'没有配置有效的user_id，请通过config.json或user_id_list.txt配置user_id')
                 return
-            user_count = 0
-            user_count1 = random.randint(*self.random_wait_pages)
-            random_users = random.randint(*self.random_wait_pages)
+            if self.user_concurrency > 1:
+                from .scheduler import UserScheduler
+
+                UserScheduler(self, self.user_concurrency).run(
+                    self.user_config_list)
+                return
             for user_config in self.user_config_list:
-                if (user_count - user_count1) % random_users == 0:
-                    sleep(random.randint(*self.random_wait_seconds))
-                    user_count1 = user_count
-                    random_users = random.randint(*self.random_wait_pages)
-                user_count += 1
                 self.get_one_user(user_config)
         except Exception as e:
             logger.exception(e)
+        finally:
+            if self.media_service:
+                # 等待已登记的文件下载完成
+                self.media_service.close()
+            for db_writer in self.db_writers:
+                db_writer.close()
+            if self.page_cache:
+                self.page_cache.close()
+            if self.response_archive:
+                self.response_archive.close()
+            if self.comment_database:
+                self.comment_database.close()
+            if self.comment_producer:
+                self.comment_producer.close()
 
 
 def _get_config():
@@ -0,0 +1,11 @@
+import os
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def pytest_collect_directory(path, parent):
+    # 仓库根目录按普通目录收集，不导入__init__.py(它导入的解析器和下载器不在本仓库中)
+    if str(path) == ROOT_DIR:
+        return pytest.Dir.from_parent(parent, path=path)
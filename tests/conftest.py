@@ -0,0 +1,11 @@
+import os
+import sys
+import types
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 以weibo_spider包名加载仓库中的模块，不执行__init__.py(它导入的解析器和下载器不在本仓库中)
+if 'weibo_spider' not in sys.modules:
+    package = types.ModuleType('weibo_spider')
+    package.__path__ = [ROOT_DIR]
+    sys.modules['weibo_spider'] = package
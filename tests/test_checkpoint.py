@@ -0,0 +1,149 @@
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from weibo_spider.checkpoint import CheckpointStore
+from weibo_spider.comment import Comment
+from weibo_spider.comment_engine import AsyncCommentEngine
+from weibo_spider.comment_sink import CommentSink
+from weibo_spider.identity_pool import IdentityPool
+from weibo_spider.rate_limiter import RateLimiter
+from weibo_spider.weibo import Weibo
+
+USER_URI = '1669879400'
+WEIBO_ID = 'KabcDEF12'
+COMMENT_URL = f'https://weibo.cn/comment/{WEIBO_ID}'
+HOT_MARK = '<span class="kt">[热门]</span>'
+
+
+def comment_page(comment_ids, total_pages, hot_ids=()):
+    """生成weibo.cn评论页，评论id越大越新，hot_ids中的评论为置顶热门评论"""
+    nodes = ''.join(
+        f'<div class="c" id="C_{i}"><a href="/u/{i}">用户{i}</a>:'
+        f'<span class="ctt">评论{i}</span>'
+        f'{HOT_MARK if i in hot_ids else ""}'
+        f'<span class="ct">01月02日 10:00</span></div>' for i in comment_ids)
+    return (f'<html><body><div class="c" id="M_1">原微博</div>{nodes}'
+            f'<div id="pagelist"><form><input name="mp" type="hidden" '
+            f'value="{total_pages}"/></form></div></body></html>').encode('utf-8')
+
+
+class FakeWeiboAdapter(BaseAdapter):
+    """按url返回预置页面的传输层，记录请求过的url"""
+
+    def __init__(self, pages):
+        super().__init__()
+        self.pages = pages
+        self.requested = []
+
+    def send(self, request, **kwargs):
+        self.requested.append(request.url)
+        response = requests.Response()
+        response.status_code = 200
+        response.url = request.url
+        response.request = request
+        response._content = self.pages[request.url]
+        return response
+
+    def close(self):
+        pass
+
+
+class ListCommentSink(CommentSink):
+    """将写出的评论页保存在列表中"""
+
+    def __init__(self, pages):
+        super().__init__(batch_size=1)
+        self.pages = pages
+
+    def write_page(self, weibo_number, page, comments):
+        self.pages.append((page, comments))
+        super().write_page(weibo_number, page, comments)
+
+    def _write_batch(self, comments):
+        pass
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    store = CheckpointStore(str(tmp_path / 'checkpoint.db'))
+    yield store
+    store.close()
+
+
+def crawl(checkpoint, pages):
+    """用异步评论引擎爬取一条微博，返回(请求过的url, 写出的评论页)"""
+    adapter = FakeWeiboAdapter(
+        {f'{COMMENT_URL}?page={page}': html
+         for page, html in pages.items()})
+    identity_pool = IdentityPool(
+        RateLimiter({
+            'host': {'rate': 1000, 'burst': 100},
+            'cookie': {'rate': 1000, 'burst': 100},
+        }), ['cookie'], {})
+    for identity in identity_pool.identities:
+        identity.session.mount('https://', adapter)
+    written = []
+
+    def sink_factory(weibo_id):
+        sink = ListCommentSink(written)
+        sink.on_flush = lambda flushed: checkpoint.commit_pages(
+            USER_URI, weibo_id, flushed)
+        return sink
+
+    weibo = Weibo()
+    weibo.id = WEIBO_ID
+    weibo.weibo_number = 1
+    AsyncCommentEngine(identity_pool,
+                       sink_factory,
+                       max_comment_pages=10,
+                       checkpoint=checkpoint,
+                       user_uri=USER_URI).crawl([weibo])
+    return adapter.requested, written
+
+
+def test_resume_skips_committed_pages(checkpoint):
+    # 上次运行写出前两页后中断
+    checkpoint.set_total_pages(USER_URI, WEIBO_ID, 3)
+    checkpoint.commit_pages(USER_URI, WEIBO_ID, [
+        (1, [Comment(id='C_90', number='1-1'),
+             Comment(id='C_80', number='1-2')]),
+        (2, [Comment(id='C_70', number='1-3')]),
+    ])
+
+    requested, written = crawl(checkpoint, {
+        1: comment_page([90, 80], 3),
+        2: comment_page([70], 3),
+        3: comment_page([60, 50], 3),
+    })
+
+    assert requested == [f'{COMMENT_URL}?page=3']
+    assert [page for page, _ in written] == [3]
+    assert [comment.id for comment in written[0][1]] == ['C_60', 'C_50']
+    # 续爬的评论接着已写出的最大序号编号
+    assert [comment.number for comment in written[0][1]] == ['1-4', '1-5']
+    # 全部页写出后清除页断点，只保留高水位
+    assert checkpoint.get_finished_pages(USER_URI, WEIBO_ID) == {}
+    assert checkpoint.get_high_water_mark(USER_URI, WEIBO_ID) == 90
+
+
+def test_high_water_mark_stops_at_seen_comment(checkpoint):
+    # 上次爬取到评论50，已编号到1-2
+    checkpoint.commit_pages(USER_URI, WEIBO_ID, [
+        (1, [Comment(id='C_50', number='1-1'),
+             Comment(id='C_40', number='1-2')]),
+    ])
+    checkpoint.finish_weibo(USER_URI, WEIBO_ID)
+
+    requested, written = crawl(checkpoint, {
+        # 置顶的旧热门评论不代表已翻到上次的位置
+        1: comment_page([10, 70, 60], 3, hot_ids=(10, )),
+        2: comment_page([55, 50, 40], 3),
+        3: comment_page([30, 20], 3),
+    })
+
+    assert requested == [f'{COMMENT_URL}?page=1', f'{COMMENT_URL}?page=2']
+    comments = [comment for _, page in written for comment in page]
+    assert [comment.id for comment in comments] == ['C_70', 'C_60', 'C_55']
+    assert [comment.number for comment in comments] == ['1-3', '1-4', '1-5']
+    assert checkpoint.get_high_water_mark(USER_URI, WEIBO_ID) == 70
@@ -0,0 +1,56 @@
+import sqlite3
+
+from weibo_spider.comment import Comment
+from weibo_spider.comment_sink import SqliteCommentDatabase, SqliteCommentSink
+
+
+def make_comment(comment_id, likes, content=u'评论', hot=False):
+    return Comment(id=comment_id,
+                   weibo_id='KabcDEF12',
+                   number=f'1-{comment_id[2:]}',
+                   user_id='100',
+                   screen_name=u'甲',
+                   content=content,
+                   likes=likes,
+                   publish_time='2024-01-02 10:00',
+                   hot=hot)
+
+
+def read_rows(db_path):
+    connection = sqlite3.connect(db_path)
+    rows = connection.execute(
+        'SELECT id, number, content, likes, hot FROM comment ORDER BY id'
+    ).fetchall()
+    connection.close()
+    return rows
+
+
+def test_repeated_upsert_updates_existing_comment(tmp_path):
+    db_path = str(tmp_path / 'weibo.db')
+    database = SqliteCommentDatabase(db_path)
+    with SqliteCommentSink(database, batch_size=10) as sink:
+        sink.write_page(1, 1, [make_comment('C_1', 3), make_comment('C_2', 0)])
+    # 再次爬取同一条评论时点赞数和热门状态变化，编号保持首次写入的值
+    updated = make_comment('C_1', 8, u'评论(已编辑)', hot=True)
+    updated.number = '1-9'
+    with SqliteCommentSink(database, batch_size=10) as sink:
+        sink.write_page(1, 1, [updated])
+    database.close()
+
+    assert read_rows(db_path) == [
+        ('C_1', '1-1', u'评论(已编辑)', 8, 1),
+        ('C_2', '1-2', u'评论', 0, 0),
+    ]
+
+
+def test_database_uses_wal_and_indexes(tmp_path):
+    db_path = str(tmp_path / 'weibo.db')
+    SqliteCommentDatabase(db_path).close()
+    connection = sqlite3.connect(db_path)
+    assert connection.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    indexes = {
+        row[1]
+        for row in connection.execute("PRAGMA index_list('comment')")
+    }
+    connection.close()
+    assert {'comment_weibo_time', 'comment_user'} <= indexes
@@ -0,0 +1,78 @@
+import threading
+
+from weibo_spider.comment import Comment
+from weibo_spider.comment_store import CommentStore
+
+
+def make_comments(weibo_number, start, count):
+    return [
+        Comment(id=f'C_{i}',
+                number=f'{weibo_number}-{i}',
+                user_id=str(i),
+                screen_name=f'用户{i}',
+                content=f'评论{i}, 含逗号和"引号"',
+                likes=i) for i in range(start, start + count)
+    ]
+
+
+def test_read_comments_by_weibo(tmp_path):
+    store = CommentStore(str(tmp_path / 'comments.csv'))
+    store.append('A', make_comments(1, 1, 2))
+    store.append('B', make_comments(2, 1, 1))
+    store.append('A', make_comments(1, 3, 1))
+    store.close()
+
+    store = CommentStore(str(tmp_path / 'comments.csv'), append=True)
+    assert sorted(store.get_weibo_ids()) == ['A', 'B']
+    comments = store.read_comments('A')
+    assert [comment.number for comment in comments] == ['1-1', '1-2', '1-3']
+    assert comments[0].content == u'评论1, 含逗号和"引号"'
+    assert comments[2].likes == 3
+    store.close()
+
+
+def test_reload_drops_segments_beyond_truncated_data(tmp_path):
+    path = str(tmp_path / 'comments.csv')
+    store = CommentStore(path)
+    store.append('A', make_comments(1, 1, 2))
+    store.append('B', make_comments(2, 1, 2))
+    store.close()
+    # 写入B的数据后中断：数据文件只留下B的一部分，索引仍记录了整段
+    with open(path, 'rb+') as f:
+        f.truncate(store.index['B'][0][0] + 5)
+
+    store = CommentStore(path, append=True)
+    assert store.get_weibo_ids() == ['A']
+    assert [comment.number for comment in store.read_comments('A')
+            ] == ['1-1', '1-2']
+    assert store.read_comments('B') == []
+    # 续写的评论追加在截断处之后，可以正常读出
+    store.append('B', make_comments(2, 3, 1))
+    store.close()
+
+    store = CommentStore(path, append=True)
+    assert [comment.number for comment in store.read_comments('B')
+            ] == ['2-3']
+    store.close()
+
+
+def test_concurrent_appends(tmp_path):
+    store = CommentStore(str(tmp_path / 'comments.csv'))
+
+    def append(weibo_id):
+        for start in range(1, 21):
+            store.append(weibo_id, make_comments(1, start * 10, 2))
+
+    threads = [
+        threading.Thread(target=append, args=(f'W{i}', )) for i in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.close()
+
+    store = CommentStore(str(tmp_path / 'comments.csv'), append=True)
+    for i in range(4):
+        assert len(store.read_comments(f'W{i}')) == 40
+    store.close()
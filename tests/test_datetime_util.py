@@ -0,0 +1,40 @@
+from datetime import datetime
+
+import pytest
+
+from weibo_spider.datetime_util import (standardize_comment_date,
+                                        standardize_date)
+
+NOW = datetime(2025, 1, 2, 9, 30)
+
+
+@pytest.mark.parametrize('text, expected', [
+    (u'刚刚', '2025-01-02 09:30'),
+    (u'5分钟前', '2025-01-02 09:25'),
+    (u'今天 08:15', '2025-01-02 08:15'),
+    (u'01月02日 08:00', '2025-01-02 08:00'),
+    # 晚于当前日期的x月x日是去年的
+    (u'12月31日 23:59', '2024-12-31 23:59'),
+    ('2023-05-06 07:08:09', '2023-05-06 07:08'),
+])
+def test_standardize_date(text, expected):
+    assert standardize_date(text, NOW) == expected
+
+
+def test_month_day_not_before_since():
+    # 微博在新年当天发布，评论的01月01日不会被推到前一年
+    assert standardize_date(u'01月01日 00:05',
+                            datetime(2025, 1, 1, 0, 30),
+                            since='2025-01-01 00:01') == '2025-01-01 00:05'
+    # 当前时间的月日早于评论(时钟偏差等)，按微博发布时间仍归入当年
+    assert standardize_date(u'03月04日 10:00',
+                            datetime(2025, 3, 3, 23, 0),
+                            since='2025-03-01 10:00') == '2025-03-04 10:00'
+
+
+def test_standardize_comment_date():
+    assert standardize_comment_date('2023-05-06 07:08:09',
+                                    '2023-05-06 07:00') == '2023-05-06 07:08'
+    # 无法识别的时间原样保留
+    assert standardize_comment_date(u'某月某日', '2024-12-31 20:00') == u'某月某日'
+    assert standardize_comment_date(u'N/A', None) == 'N/A'
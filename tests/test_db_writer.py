@@ -0,0 +1,191 @@
+import sys
+import types
+
+import mongomock
+import pytest
+
+from weibo_spider.db_writer import BufferedMongoWriter, BufferedMySqlWriter
+from weibo_spider.user import User
+from weibo_spider.weibo import Weibo
+
+FAST_OPTIONS = {'flush_interval': 0.05, 'retry_interval': 0}
+
+
+def make_weibo(weibo_id, content='', up_num=0):
+    weibo = Weibo()
+    weibo.id = weibo_id
+    weibo.user_id = '1669879400'
+    weibo.content = content
+    weibo.original_pictures = ['a.jpg', 'b.jpg']
+    weibo.publish_time = '2024-01-01 10:00'
+    weibo.up_num = up_num
+    return weibo
+
+
+def make_user():
+    user = User()
+    user.id = '1669879400'
+    user.nickname = 'Dear-迪丽热巴'
+    return user
+
+
+class FakeMySqlServer:
+    """pymysql的替身，按主键保存executemany写入的行；content超过10个字符的批次整体失败"""
+
+    max_content_length = 10
+
+    def __init__(self):
+        self.tables = {'user': {}, 'weibo': {}}
+        self.batches = []
+        self.failures = 0  # 之后的该次数ping和连接请求失败，模拟数据库暂时不可用
+        self.connect_count = 0
+
+    def check_available(self):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Can't connect to MySQL server")
+
+    def connect(self, **kwargs):
+        self.check_available()
+        self.connect_count += 1
+        return FakeConnection(self)
+
+
+class FakeConnection:
+
+    def __init__(self, server):
+        self.server = server
+
+    def cursor(self):
+        return FakeCursor(self.server)
+
+    def ping(self, reconnect=False):
+        self.server.check_available()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+
+    def __init__(self, server):
+        self.server = server
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self, sql):
+        pass
+
+    def executemany(self, sql, rows):
+        table = sql.split()[2]
+        fields = [field.strip() for field in
+                  sql[sql.index('(') + 1:sql.index(')')].split(',')]
+        rows = [dict(zip(fields, row)) for row in rows]
+        if any(
+                len(row.get('content') or '') > self.server.max_content_length
+                for row in rows):
+            raise ValueError('Data too long for column content')
+        self.server.batches.append((table, len(rows)))
+        for row in rows:
+            self.server.tables[table][row['id']] = row
+
+
+@pytest.fixture
+def mysql_server(monkeypatch):
+    server = FakeMySqlServer()
+    monkeypatch.setitem(sys.modules, 'pymysql',
+                        types.SimpleNamespace(connect=server.connect))
+    return server
+
+
+def test_mysql_writer_batches_and_keeps_latest_record(mysql_server):
+    writer = BufferedMySqlWriter(dict(FAST_OPTIONS, batch_size=3))
+    writer.write_user(make_user())
+    writer.write_weibo([make_weibo('1', up_num=1), make_weibo('2')])
+    writer.write_weibo([make_weibo('1', up_num=5), make_weibo('3')])
+    writer.close()
+
+    weibos = mysql_server.tables['weibo']
+    assert sorted(weibos) == ['1', '2', '3']
+    assert weibos['1']['up_num'] == 5
+    assert weibos['1']['original_pictures'] == 'a.jpg,b.jpg'
+    assert mysql_server.tables['user']['1669879400']['nickname'] == 'Dear-迪丽热巴'
+    assert ('weibo', 3) in mysql_server.batches
+    assert writer.written_count == 4
+
+
+def test_mysql_writer_only_drops_the_bad_row(mysql_server):
+    writer = BufferedMySqlWriter(dict(FAST_OPTIONS, retries=1))
+    writer.write_weibo([
+        make_weibo('1', 'ok'),
+        make_weibo('2', 'much too long for the column'),
+        make_weibo('3', 'ok'),
+    ])
+    writer.close()
+
+    assert sorted(mysql_server.tables['weibo']) == ['1', '3']
+    assert writer.written_count == 2
+    assert writer.failed_count == 1
+
+
+def test_mongo_writer_upserts_by_id():
+    client = mongomock.MongoClient()
+    writer = BufferedMongoWriter(dict(FAST_OPTIONS, batch_size=2),
+                                 client=client)
+    writer.write_user(make_user())
+    writer.write_weibo([make_weibo('1', up_num=1), make_weibo('2')])
+    writer.write_weibo([make_weibo('1', up_num=7)])
+    writer.close()
+
+    weibos = {
+        weibo['id']: weibo
+        for weibo in client['weibo']['weibo'].find({}, {'_id': 0})
+    }
+    assert sorted(weibos) == ['1', '2']
+    assert weibos['1']['up_num'] == 7
+    assert client['weibo']['user'].count_documents({'id': '1669879400'}) == 1
+
+
+def test_mongo_writer_retries_a_failed_batch(monkeypatch):
+    client = mongomock.MongoClient()
+    writer = BufferedMongoWriter(FAST_OPTIONS, client=client)
+    bulk_write = type(client['weibo']['weibo']).bulk_write
+    calls = []
+
+    def flaky_bulk_write(collection, operations, **kwargs):
+        calls.append(len(operations))
+        if len(calls) == 1:
+            raise ConnectionError('connection reset')
+        return bulk_write(collection, operations, **kwargs)
+
+    monkeypatch.setattr(type(client['weibo']['weibo']), 'bulk_write',
+                        flaky_bulk_write)
+    writer.write_weibo([make_weibo('1'), make_weibo('2')])
+    writer.close()
+
+    assert calls == [2, 2]
+    assert client['weibo']['weibo'].count_documents({}) == 2
+    assert writer.failed_count == 0
+
+
+def test_mysql_writer_recovers_after_failed_connects(mysql_server):
+    writer = BufferedMySqlWriter(dict(FAST_OPTIONS, retries=3, pool_size=1))
+    # 池中的连接ping失败被丢弃，之后两次新建连接失败，第三次成功
+    mysql_server.failures = 3
+    writer.write_weibo([make_weibo('1'), make_weibo('2')])
+    writer.close()
+
+    assert sorted(mysql_server.tables['weibo']) == ['1', '2']
+    assert writer.failed_count == 0
+    assert writer.pool.created == 1
+    assert mysql_server.connect_count == 3
@@ -0,0 +1,85 @@
+import json
+import zlib
+
+from weibo_spider.comment import Comment
+from weibo_spider.kafka_comment_sink import (KafkaCommentProducer,
+                                             KafkaCommentSink,
+                                             get_memory_broker)
+
+
+def make_comments(weibo_id, start, count):
+    return [
+        Comment(id=f'C_{i}', weibo_id=weibo_id, number=f'1-{i}')
+        for i in range(start, start + count)
+    ]
+
+
+def make_producer(broker_name, topics=('comments', )):
+    return KafkaCommentProducer({
+        'bootstrap-server': f'memory://{broker_name}',
+        'comment_topics': list(topics),
+    })
+
+
+def test_comments_of_a_weibo_share_a_partition_in_order():
+    producer = make_producer('partitioning')
+    broker = get_memory_broker('partitioning')
+    for weibo_id in ['A1', 'B2', 'C3']:
+        producer.send(make_comments(weibo_id, 1, 5))
+    producer.close()
+
+    for weibo_id in ['A1', 'B2', 'C3']:
+        key = weibo_id.encode()
+        partitions = [
+            partition for partition in range(broker.partitions)
+            if any(message_key == key for message_key, _ in
+                   broker.get_messages('comments', partition))
+        ]
+        assert partitions == [zlib.crc32(key) % broker.partitions]
+        ids = [
+            json.loads(value)['id']
+            for message_key, value in broker.get_messages(
+                'comments', partitions[0]) if message_key == key
+        ]
+        assert ids == ['C_1', 'C_2', 'C_3', 'C_4', 'C_5']
+    assert producer.get_metrics() == {'sent': 15, 'acked': 15, 'failed': 0}
+
+
+def test_every_topic_receives_each_comment():
+    producer = make_producer('topics', topics=('a', 'b'))
+    broker = get_memory_broker('topics')
+    producer.send(make_comments('W1', 1, 3))
+    assert len(broker.get_messages('a')) == 3
+    assert len(broker.get_messages('b')) == 3
+
+
+def test_checkpoint_waits_for_acks():
+    producer = make_producer('acks')
+    committed = []
+    with KafkaCommentSink(producer, batch_size=2) as sink:
+        sink.on_flush = lambda pages: committed.extend(
+            page for page, _ in pages)
+        sink.write_page(1, 1, make_comments('W1', 1, 2))
+        sink.write_page(1, 2, make_comments('W1', 3, 2))
+    sink.after_flush(lambda: committed.append('finished'))
+    assert committed == [1, 2, 'finished']
+
+
+def test_checkpoint_is_not_recorded_after_a_failed_send():
+    producer = make_producer('failures')
+    sends = []
+    producer.send = lambda comments, on_acked, on_failed: sends.append(
+        (on_acked, on_failed))
+    committed = []
+    sink = KafkaCommentSink(producer, batch_size=1)
+    sink.on_flush = lambda pages: committed.extend(page for page, _ in pages)
+    sink.write_page(1, 1, make_comments('W1', 1, 1))
+    sink.write_page(1, 2, make_comments('W1', 2, 1))
+    assert committed == []
+
+    # 第1页确认后记录第1页，第2页发送失败后不再记录任何断点
+    sends[0][0]()
+    assert committed == [1]
+    sends[1][1](Exception('broker unavailable'))
+    sink.after_flush(lambda: committed.append('finished'))
+    assert committed == [1]
@@ -0,0 +1,91 @@
+import io
+import os
+import time
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from weibo_spider.media_downloader import MediaDownloadService
+
+CONTENT = bytes(range(256)) * 64
+URL = 'https://wx1.sinaimg.cn/large/abc.jpg'
+
+
+class FakeMediaAdapter(BaseAdapter):
+    """返回CONTENT的传输层，support_range为False时忽略Range请求头"""
+
+    def __init__(self, support_range):
+        super().__init__()
+        self.support_range = support_range
+        self.ranges = []
+
+    def send(self, request, **kwargs):
+        range_header = request.headers.get('Range')
+        self.ranges.append(range_header)
+        response = requests.Response()
+        response.url = request.url
+        response.request = request
+        response.status_code = 200
+        content = CONTENT
+        if range_header and self.support_range:
+            offset = int(range_header[len('bytes='):-1])
+            response.status_code = 206
+            content = CONTENT[offset:]
+        response.raw = io.BytesIO(content)
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = MediaDownloadService(str(tmp_path / 'media.db'), workers=1)
+    yield service
+    service.close()
+
+
+def wait_idle(service):
+    deadline = time.monotonic() + 5
+    while service.get_metrics()['pending'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def download(service, adapter, file_path):
+    service.session.mount('https://', adapter)
+    service.submit(URL, file_path)
+    wait_idle(service)
+
+
+@pytest.mark.parametrize('support_range', [True, False])
+def test_resume_partial_download(tmp_path, service, support_range):
+    file_path = str(tmp_path / 'img' / 'abc.jpg')
+    os.makedirs(os.path.dirname(file_path))
+    with open(file_path + '.part', 'wb') as f:
+        f.write(CONTENT[:1000])
+    adapter = FakeMediaAdapter(support_range)
+
+    download(service, adapter, file_path)
+
+    assert adapter.ranges == ['bytes=1000-']
+    # 206时追加剩余部分，服务器忽略Range返回200时从头写入完整内容
+    with open(file_path, 'rb') as f:
+        assert f.read() == CONTENT
+    assert not os.path.exists(file_path + '.part')
+    assert service.get_metrics()['downloaded'] == 1
+
+
+def test_same_url_downloaded_once(tmp_path, service):
+    adapter = FakeMediaAdapter(True)
+    service.session.mount('https://', adapter)
+    first = str(tmp_path / 'a' / 'abc.jpg')
+    second = str(tmp_path / 'b' / 'abc.jpg')
+    service.submit(URL, first)
+    wait_idle(service)
+    service.submit(URL, second)
+
+    assert adapter.ranges == [None]
+    with open(second, 'rb') as f:
+        assert f.read() == CONTENT
+    assert service.get_metrics()['reused'] == 1
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import requests
+
+from weibo_spider.proxy_pool import PROXY_SOURCES, ProxyPool, ProxySource
+
+TABLE_PAGE = u'''<html><body><table>
+<tr><th>IP</th><th>端口</th><th>类型</th></tr>
+<tr><td> 1.2.3.4 </td><td>8080</td><td>高匿</td></tr>
+<tr><td>5.6.7.8</td><td><b>3128</b></td><td>透明</td></tr>
+<tr><td>不是IP</td><td>80</td><td>高匿</td></tr>
+<tr><td>9.9.9.9</td><td>端口</td><td>高匿</td></tr>
+</table></body></html>'''.encode('utf-8')
+TEXT_PAGE = u'''<html><body>
+10.0.0.1:8888<br/>10.0.0.2 端口 9999<br/>说明文字 2024<br/>
+</body></html>'''.encode('utf-8')
+
+
+def test_from_config_uses_registry_url_or_dict():
+    registered = ProxySource.from_config('89ip')
+    assert registered.url == PROXY_SOURCES['89ip']['url']
+    assert registered.xpath is not None and registered.regex is None
+
+    url = ProxySource.from_config('http://example.com/proxies.txt')
+    assert url.url == 'http://example.com/proxies.txt'
+    assert url.regex is not None
+
+    configured = ProxySource.from_config({
+        'url': 'http://example.com/socks',
+        'regex': r'(\d+\.\d+\.\d+\.\d+)\|(\d+)',
+        'scheme': 'socks5'
+    })
+    assert configured.extract(b'1.1.1.1|1080 2.2.2.2|1081') == [
+        'socks5://1.1.1.1:1080', 'socks5://2.2.2.2:1081'
+    ]
+
+
+def test_extract_table_rows():
+    assert ProxySource('http://example.com').extract(TABLE_PAGE) == [
+        'http://1.2.3.4:8080', 'http://5.6.7.8:3128'
+    ]
+
+
+def test_extract_with_default_regex():
+    source = ProxySource('http://example.com', regex=True)
+    assert source.extract(TEXT_PAGE) == [
+        'http://10.0.0.1:8888', 'http://10.0.0.2:9999'
+    ]
+    assert source.extract(TEXT_PAGE.decode('utf-8')) == source.extract(
+        TEXT_PAGE)
+
+
+def test_extract_empty_page():
+    assert ProxySource('http://example.com').extract(b'') == []
+
+
+def test_sources_fetched_concurrently_within_deadline(monkeypatch):
+    release = threading.Event()
+
+    def get(url, **kwargs):
+        if 'slow' in url:
+            release.wait(5)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = f'{url[-1]}.{url[-1]}.{url[-1]}.{url[-1]}:80'.encode()
+        return response
+
+    monkeypatch.setattr(requests, 'get', get)
+    pool = ProxyPool({
+        'local_proxies': [],
+        'sources': [f'http://fast/{i}' for i in range(1, 4)] +
+        ['http://slow/9'],
+        'source_deadline': 0.5,
+    })
+    start = time.monotonic()
+    proxies = pool._fetch_all_sources()
+    elapsed = time.monotonic() - start
+    release.set()
+
+    # 慢代理源超过期限后忽略，不拖慢其他代理源
+    assert sorted(proxies) == [
+        'http://1.1.1.1:80', 'http://2.2.2.2:80', 'http://3.3.3.3:80'
+    ]
+    assert elapsed < 2
@@ -0,0 +1,97 @@
+import socket
+
+import pytest
+
+from weibo_spider.comment_store import CommentStore
+from weibo_spider.response_archive import ResponseArchive
+from weibo_spider.user import User
+from weibo_spider.weibo import Weibo
+
+USER_URI = '1669879400'
+WEIBO_ID = 'KabcDEF12'
+COMMENT_PAGE = u'''<html><body>
+<div class="c" id="C_1"><a href="/u/100">甲</a>:<span class="ctt">第一条评论</span>
+<a href="/attitude">赞[3]</a><span class="ct">01月02日 10:00&#160;来自iPhone</span></div>
+<div class="c" id="C_2"><a href="/u/200">乙</a>:<span class="ctt">第二条评论</span>
+<a href="/attitude">赞[0]</a><span class="ct">01月02日 11:00&#160;来自Android</span></div>
+</body></html>'''.encode('utf-8')
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    """禁止访问网络，返回尝试建立的连接"""
+    attempts = []
+
+    def connect(*args, **kwargs):
+        attempts.append(args)
+        raise OSError('replay must not touch the network')
+
+    monkeypatch.setattr(socket.socket, 'connect', connect)
+    monkeypatch.setattr(socket.socket, 'connect_ex', connect)
+    monkeypatch.setattr(socket, 'create_connection', connect)
+    return attempts
+
+
+def _archive(path):
+    archive = ResponseArchive(path)
+    user = User()
+    user.id = USER_URI
+    user.nickname = 'replay_user'
+    archive.put_record(f'https://weibo.cn/{USER_URI}/profile', user.to_dict(),
+                       USER_URI)
+    weibo = Weibo()
+    weibo.id = WEIBO_ID
+    weibo.user_id = USER_URI
+    weibo.content = u'存档中的微博'
+    weibo.publish_time = '2024-01-01 12:00'
+    archive.put_record(f'https://weibo.cn/{USER_URI}?page=1', {
+        'weibos': [weibo.to_dict()],
+        'to_continue': False,
+    }, USER_URI)
+    archive.put(f'https://weibo.cn/comment/{WEIBO_ID}?page=1', COMMENT_PAGE,
+                USER_URI)
+    archive.close()
+
+
+def test_replay_writes_archived_comments_without_network(
+        tmp_path, monkeypatch, connections):
+    monkeypatch.chdir(tmp_path)  # logging.conf在当前目录写日志
+    # spider依赖的解析器和写入器不在本仓库中
+    spider_module = pytest.importorskip('weibo_spider.spider')
+    flags = spider_module.FLAGS
+    if not flags.is_parsed():
+        flags(['spider'])
+    monkeypatch.setattr(flags, 'replay', True)
+    monkeypatch.setattr(flags, 'output_dir', str(tmp_path / 'weibo'))
+    _archive(str(tmp_path / 'archive'))
+
+    spider = spider_module.Spider({
+        'user_id_list': [USER_URI],
+        'filter': 1,
+        'since_date': '2018-01-01',
+        'end_date': 'now',
+        'write_mode': [],
+        'comment_storage': 'user',
+        'pic_download': 1,
+        'video_download': 1,
+        'cookie': 'replay',
+        'proxy_pool': {
+            'sources': ['89ip']
+        },
+        'response_archive': {
+            'path': str(tmp_path / 'archive')
+        },
+    })
+    assert spider.proxy_pool is None
+    assert spider.media_service is None
+    spider.start()
+
+    assert spider.got_num == 1
+    store = CommentStore(str(tmp_path / 'weibo' / 'replay_user' /
+                             f'{USER_URI}_comments.csv'),
+                         append=True)
+    comments = store.read_comments(WEIBO_ID)
+    store.close()
+    assert [comment.content for comment in comments] == [u'第一条评论', u'第二条评论']
+    assert [comment.likes for comment in comments] == [3, 0]
+    assert connections == []
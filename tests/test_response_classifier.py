@@ -0,0 +1,151 @@
+import pytest
+import requests
+
+from weibo_spider.comment_parser import CommentPageParser
+from weibo_spider.response_classifier import (BLOCKED, CAPTCHA, EMPTY,
+                                              LOGIN_REDIRECT, NO_COMMENTS, OK,
+                                              SERVER_ERROR, SLEEP, TIMEOUT,
+                                              ResponseClassifier,
+                                              fetch_page_steps,
+                                              get_backoff_policies,
+                                              run_fetch_steps)
+
+# 没有评论的正常页面仍显示原微博
+NO_COMMENTS_PAGE = u'''<html><body><div class="c" id="M_KabcDEF12">
+<span class="ctt">原微博</span></div><div class="c">还没有人针对这条微博发表评论!</div>
+</body></html>'''.encode('utf-8')
+CAPTCHA_PAGE = u'''<html><body><form action="/captcha">
+<img src="https://passport.weibo.cn/captcha/image"/>请输入验证码</form>
+</body></html>'''.encode('utf-8')
+BLOCKED_PAGE = u'<html><body>访问过于频繁，请稍后再试</body></html>'.encode('utf-8')
+COMMENT_PAGE = u'''<html><body><div class="c" id="M_KabcDEF12">原微博</div>
+<div class="c" id="C_1"><a href="/u/100">甲</a>:<span class="ctt">评论</span>
+<span class="ct">01月02日 10:00</span></div></body></html>'''.encode('utf-8')
+
+
+def make_response(url, status_code=200, history=()):
+    response = requests.Response()
+    response.url = url
+    response.status_code = status_code
+    response.history = list(history)
+    return response
+
+
+@pytest.mark.parametrize('html, expected', [
+    (COMMENT_PAGE, OK),
+    (NO_COMMENTS_PAGE, NO_COMMENTS),
+    (CAPTCHA_PAGE, CAPTCHA),
+    (BLOCKED_PAGE, BLOCKED),
+    (b'<html><body></body></html>', EMPTY),
+    (b'', EMPTY),
+])
+def test_classify_page(html, expected):
+    comments = CommentPageParser().parse(html)[1]
+    assert ResponseClassifier.classify_page(html, comments) == expected
+
+
+def test_classify_login_redirect():
+    redirect = make_response('https://weibo.cn/comment/KabcDEF12?page=1', 302)
+    response = make_response(
+        'https://passport.weibo.cn/signin/login?r=https%3A%2F%2Fweibo.cn',
+        history=[redirect])
+    assert ResponseClassifier.classify(response) == LOGIN_REDIRECT
+
+
+@pytest.mark.parametrize('status_code, expected', [
+    (200, OK),
+    (418, BLOCKED),
+    (429, BLOCKED),
+    (503, SERVER_ERROR),
+])
+def test_classify_status(status_code, expected):
+    response = make_response('https://weibo.cn/comment/KabcDEF12',
+                             status_code)
+    assert ResponseClassifier.classify(response) == expected
+
+
+def test_classify_timeout():
+    assert ResponseClassifier.classify_error(
+        requests.ReadTimeout()) == TIMEOUT
+
+
+class FakeSession:
+
+    def __init__(self):
+        self.blocked_urls = []
+
+    def report_blocked(self, url):
+        self.blocked_urls.append(url)
+
+
+class FakeIdentity:
+
+    def __init__(self):
+        self.session = FakeSession()
+        self.expired = False
+        self.blocked_for = []
+
+    def mark_expired(self):
+        self.expired = True
+
+    def mark_blocked(self, seconds):
+        self.blocked_for.append(seconds)
+
+
+class FakeIdentityPool:
+
+    def __init__(self, identities):
+        self.identities = identities
+
+    def is_exhausted(self):
+        return all(identity.expired for identity in self.identities)
+
+
+def parse(html):
+    total_pages, comments = CommentPageParser().parse(html)
+    return total_pages, comments, html
+
+
+def test_captcha_rotates_and_login_disables_identity():
+    captcha_identity, expired_identity, good_identity = [
+        FakeIdentity() for _ in range(3)
+    ]
+    responses = iter([
+        (captcha_identity, OK, parse(CAPTCHA_PAGE)),
+        (expired_identity, LOGIN_REDIRECT, None),
+        (good_identity, OK, parse(COMMENT_PAGE)),
+    ])
+    url = 'https://weibo.cn/comment/KabcDEF12?page=1'
+    steps = fetch_page_steps(
+        url,
+        FakeIdentityPool([captcha_identity, expired_identity, good_identity]),
+        get_backoff_policies())
+
+    page = run_fetch_steps(steps, lambda: next(responses))
+
+    assert [comment.id for comment in page[1]] == ['C_1']
+    # 验证码页面状态码正常，需单独反馈给限速服务，身份冷却后换身份重试
+    assert captcha_identity.session.blocked_urls == [url]
+    assert len(captcha_identity.blocked_for) == 1
+    assert expired_identity.expired
+    assert not good_identity.expired
+
+
+def test_server_error_sleeps_then_gives_up():
+    identity = FakeIdentity()
+    policies = get_backoff_policies(
+        {SERVER_ERROR: {'delay': 1, 'max_delay': 1, 'retries': 2}})
+    steps = fetch_page_steps('https://weibo.cn/comment/KabcDEF12?page=2',
+                             FakeIdentityPool([identity]), policies)
+    sleeps = []
+    action, delay = next(steps)
+    with pytest.raises(StopIteration) as stop:
+        while True:
+            if action == SLEEP:
+                sleeps.append(delay)
+                action, delay = next(steps)
+            else:
+                action, delay = steps.send((identity, SERVER_ERROR, None))
+    assert stop.value.value is None
+    assert len(sleeps) == 2
+    assert all(0 <= delay <= 1 for delay in sleeps)
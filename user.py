@@ -1,4 +1,44 @@
-class User:
+from .record import Record
+
+
+class User(Record):
+    """微博用户
+
+    字段:
+        id (str): 用户id
+        nickname (str): 昵称
+        gender (str): 性别
+        location (str): 所在地
+        birthday (str): 生日
+        description (str): 简介
+        verified_reason (str): 认证信息
+        talent (str): 达人标签
+        education (str): 学习经历
+        work (str): 工作经历
+        weibo_num (int): 微博数
+        following (int): 关注数
+        followers (int): 粉丝数
+    """
+
+    fields = ('id', 'nickname', 'gender', 'location', 'birthday',
+              'description', 'verified_reason', 'talent', 'education', 'work',
+              'weibo_num', 'following', 'followers')
+    __slots__ = fields
+
+    id: str
+    nickname: str
+    gender: str
+    location: str
+    birthday: str
+    description: str
+    verified_reason: str
+    talent: str
+    education: str
+    work: str
+    weibo_num: int
+    following: int
+    followers: int
+
     def __init__(self):
         self.id = ''
 
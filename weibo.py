@@ -1,4 +1,49 @@
-class Weibo:
+from .record import Record
+
+
+class Weibo(Record):
+    """微博
+
+    字段:
+        id (str): 微博id
+        user_id (str): 发布者用户id
+        content (str): 微博正文
+        article_url (str): 头条文章链接
+        original_pictures (list): 原创微博的图片链接
+        retweet_pictures (list): 转发微博中原微博的图片链接
+        original (bool): 是否为原创微博
+        video_url (str): 视频链接
+        publish_place (str): 发布位置
+        publish_time (str): 发布时间
+        publish_tool (str): 发布工具
+        up_num (int): 点赞数
+        retweet_num (int): 转发数
+        comment_num (int): 评论数
+    weibo_number为本次爬取中的微博序号，只用于生成评论编号，不输出。
+    """
+
+    fields = ('id', 'user_id', 'content', 'article_url', 'original_pictures',
+              'retweet_pictures', 'original', 'video_url', 'publish_place',
+              'publish_time', 'publish_tool', 'up_num', 'retweet_num',
+              'comment_num')
+    __slots__ = fields + ('weibo_number', )
+
+    id: str
+    user_id: str
+    content: str
+    article_url: str
+    original_pictures: list
+    retweet_pictures: list
+    original: bool
+    video_url: str
+    publish_place: str
+    publish_time: str
+    publish_tool: str
+    up_num: int
+    retweet_num: int
+    comment_num: int
+    weibo_number: int
+
     def __init__(self):
         self.id = ''
         self.user_id = ''
@@ -19,6 +64,8 @@ class Weibo:
         self.retweet_num = 0
         self.comment_num = 0
 
+        self.weibo_number = 0
+
     def __str__(self):
         """打印一条微博"""
         result = self.content + '\n'